@@ -0,0 +1,113 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from .services.shop_resolver import get_active_shop_id
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    """JSON response encoded the same way DRF's JSONRenderer encodes it."""
+    return JsonResponse(data, status=status, headers=headers, encoder=JSONEncoder, safe=False)
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of DRF's APIView for I/O-bound JSON endpoints, such as
+    the ones the frontend polls. Handlers must be ``async def`` and return
+    JSON (see json_response); there is no content negotiation.
+
+    Authenticates with the configured DRF authentication classes, checks the
+    configured permissions, resolves the active shop and applies the
+    configured throttles before dispatching, so handlers can rely on
+    request.user and request.active_shop_id. APIExceptions raised by the
+    checks or the handler go through DRF's EXCEPTION_HANDLER like they do for
+    APIView.
+    """
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        try:
+            await sync_to_async(self.initial)(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            return self.handle_exception(exc)
+
+    def initial(self, request):
+        """
+        Runs authentication, permission and throttle checks, raising the
+        matching APIException if one fails.
+        """
+        user = self.authenticate(request)
+        request.user = user if user is not None else AnonymousUser()
+        self.check_permissions(request)
+        request.active_shop_id = get_active_shop_id(request)
+
+        wait = self.check_throttles(request)
+        if wait is not None:
+            raise exceptions.Throttled(wait)
+
+    def authenticate(self, request):
+        """
+        Runs the authenticators in order and returns the first user found.
+        """
+        self.authenticators = [auth() for auth in self.authentication_classes]
+        for authenticator in self.authenticators:
+            user_auth_tuple = authenticator.authenticate(request)
+            if user_auth_tuple is not None:
+                return user_auth_tuple[0]
+        return None
+
+    def check_permissions(self, request):
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(detail=getattr(permission, 'message', None))
+
+    def check_throttles(self, request):
+        """
+        Returns the longest wait among throttles that refused the request,
+        or None if the request is allowed.
+        """
+        throttle_durations = []
+        for throttle in [throttle() for throttle in self.throttle_classes]:
+            if not throttle.allow_request(request, self):
+                throttle_durations.append(throttle.wait())
+
+        if throttle_durations:
+            durations = [duration for duration in throttle_durations if duration is not None]
+            return max(durations, default=None) or 0
+        return None
+
+    def get_authenticate_header(self, request):
+        authenticators = getattr(self, 'authenticators', None) or [
+            auth() for auth in self.authentication_classes
+        ]
+        if authenticators:
+            return authenticators[0].authenticate_header(request)
+        return None
+
+    def handle_exception(self, exc):
+        """
+        Turns an exception into a JSON response with DRF's EXCEPTION_HANDLER.
+        Exceptions it doesn't handle are re-raised, as in APIView.
+        """
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            # Without a WWW-Authenticate header the response must be a 403, not a 401
+            auth_header = self.get_authenticate_header(self.request)
+            if auth_header:
+                exc.auth_header = auth_header
+            else:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+
+        context = {'view': self, 'args': self.args, 'kwargs': self.kwargs, 'request': self.request}
+        response = api_settings.EXCEPTION_HANDLER(exc, context)
+        if response is None:
+            raise exc
+        headers = {name: value for name, value in response.items() if name.lower() != 'content-type'}
+        return json_response(response.data, status=response.status_code, headers=headers)
@@ -0,0 +1,68 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+AUTH_USER_CACHE_TIMEOUT = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+def _user_version_key(user_id):
+    return f"auth_user_version_{user_id}"
+
+def _user_cache_key(user_id, version):
+    return f"auth_user_{user_id}_{version}"
+
+def get_user_version(user_id):
+    """
+    Returns the user's current cache version stamp, creating one if missing.
+    Cached users are keyed on this stamp, so bumping it invalidates them at once.
+    """
+    key = _user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+def invalidate_user_cache(user_id):
+    cache.set(_user_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that serves the user (with its active shop) from a
+    short-TTL cache instead of loading the User row on every request.
+    Saving the user, e.g. on password change, deactivation or a shop switch,
+    bumps the version stamp and invalidates the cached copy.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cache_key = _user_cache_key(user_id, get_user_version(user_id))
+        user = cache.get(cache_key)
+        if user is None:
+            try:
+                user = self.user_model.objects.select_related('active_shop').get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(cache_key, user, timeout=AUTH_USER_CACHE_TIMEOUT)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
@@ -1,43 +1,50 @@
-import threading
+import contextvars
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from .services.shop_resolver import get_active_shop_id
 
-def _get_current_request():
-    """Get the current request from thread local storage."""
-    return getattr(_thread_locals, 'request', None)
+# Context-local rather than thread-local so concurrent requests served by the
+# same ASGI event loop thread never see each other's request.
+_current_request = contextvars.ContextVar('current_request', default=None)
 
-_thread_locals = threading.local()
+def _get_current_request():
+    """Get the current request from the active context."""
+    return _current_request.get()
 
 class ShopScopingMiddleware:
     """
-    Middleware that sets the current active shop ID in thread local storage.
+    Middleware that sets the current request in a context variable and the
+    active shop ID on the request.
     This allows models and managers to automatically filter queries by the active shop.
+    The shop is resolved once per request by the shop resolver; DRF views using
+    token authentication resolve it lazily through the same service.
+    Runs natively in both WSGI (sync) and ASGI (async) stacks.
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        _thread_locals.request = request
-        
-        # Determine the active shop
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            # First check headers for an explicit shop override (useful for admins/multi-shop owners)
-            shop_id_header = request.headers.get('X-Shop-ID')
-            if shop_id_header and shop_id_header.isdigit():
-                # Verify user has access to this shop
-                from .models import Membership
-                if Membership.objects.filter(user=request.user, shop_id=shop_id_header).exists():
-                    request.active_shop_id = int(shop_id_header)
-                else:
-                    request.active_shop_id = getattr(request.user.active_shop, 'id', None)
-            else:
-                # Default to the user's selected active shop
-                request.active_shop_id = getattr(request.user.active_shop, 'id', None)
-        else:
-            request.active_shop_id = None
-            
-        response = self.get_response(request)
-        
-        # Cleanup
-        if hasattr(_thread_locals, 'request'):
-            del _thread_locals.request
-            
-        return response
+        if self.async_mode:
+            return self.__acall__(request)
+
+        token = _current_request.set(request)
+        try:
+            # X-Shop-ID overrides are verified against the cached membership set
+            request.active_shop_id = get_active_shop_id(request)
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            # Resolving the session user and memberships may hit the database
+            request.active_shop_id = await sync_to_async(get_active_shop_id)(request)
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
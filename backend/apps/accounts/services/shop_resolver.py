@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.cache import cache
+from apps.accounts.models import Membership
+
+MEMBERSHIP_CACHE_TIMEOUT = getattr(settings, 'MEMBERSHIP_CACHE_TIMEOUT', 300)
+
+# Attribute used to memoize the resolved shop on the underlying HttpRequest,
+# so DRF's Request wrapper and the middleware share the same result.
+_REQUEST_CACHE_ATTR = '_resolved_active_shop'
+
+def _membership_cache_key(user_id):
+    return f"shop_memberships_{user_id}"
+
+def get_member_shop_ids(user_id):
+    """
+    Returns the ids of all shops the user belongs to, oldest membership first.
+    Cached across requests and invalidated by the Membership signals.
+    """
+    cache_key = _membership_cache_key(user_id)
+    shop_ids = cache.get(cache_key)
+    if shop_ids is None:
+        shop_ids = list(
+            Membership.objects.filter(user_id=user_id).order_by('id').values_list('shop_id', flat=True)
+        )
+        cache.set(cache_key, shop_ids, timeout=MEMBERSHIP_CACHE_TIMEOUT)
+    return shop_ids
+
+def is_member(user_id, shop_id):
+    try:
+        shop_id = int(shop_id)
+    except (TypeError, ValueError):
+        return False
+    return shop_id in get_member_shop_ids(user_id)
+
+def invalidate_memberships(user_id):
+    cache.delete(_membership_cache_key(user_id))
+
+def resolve_shop_id(user, shop_id_header=None):
+    """
+    Resolves the active shop for a user:
+    1. An explicit X-Shop-ID the user is a member of
+    2. The user's selected active shop
+    3. The user's first shop
+    """
+    if not user or not user.is_authenticated:
+        return None
+
+    if shop_id_header and shop_id_header.isdigit() and is_member(user.id, shop_id_header):
+        return int(shop_id_header)
+
+    # Use the raw FK column so we don't load the Shop row
+    if user.active_shop_id:
+        return user.active_shop_id
+
+    shop_ids = get_member_shop_ids(user.id)
+    return shop_ids[0] if shop_ids else None
+
+def get_active_shop_id(request):
+    """
+    Returns the active shop id for the request, computing it at most once per
+    request and user. Accepts either a Django HttpRequest or a DRF Request.
+    """
+    http_request = getattr(request, '_request', request)
+    user = getattr(request, 'user', None)
+    if not user or not user.is_authenticated:
+        return None
+
+    cached = getattr(http_request, _REQUEST_CACHE_ATTR, None)
+    if cached is not None and cached[0] == user.id:
+        return cached[1]
+
+    shop_id = resolve_shop_id(user, request.headers.get('X-Shop-ID'))
+    setattr(http_request, _REQUEST_CACHE_ATTR, (user.id, shop_id))
+    http_request.active_shop_id = shop_id
+    return shop_id
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .authentication import invalidate_user_cache
+from .models import Membership, Shop, User
+from .services.shop_resolver import invalidate_memberships
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def membership_changed(sender, instance, **kwargs):
+    invalidate_memberships(instance.user_id)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Covers password changes, deactivation and active shop switches
+    invalidate_user_cache(instance.pk)
+
+@receiver(pre_delete, sender=Shop)
+def shop_deleted(sender, instance, **kwargs):
+    # active_shop is nulled with a queryset update, which sends no User signals
+    for user_id in instance.active_users.values_list('id', flat=True):
+        invalidate_user_cache(user_id)
@@ -1,3 +1,177 @@
-from django.test import TestCase
+from unittest import mock
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.accounts.authentication import CachedJWTAuthentication
+from apps.accounts.models import Membership, Shop, User
+from apps.accounts.services import shop_resolver
+from core.testing import FakeRedisMixin
 
-# Create your tests here.
+
+class AccountsTestCase(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Cached users and memberships live in the (process-wide) Django cache
+        self.addCleanup(cache.clear)
+        self.shop = Shop.objects.create(name='Shop')
+        self.user = self.make_user('user', self.shop)
+
+    def make_user(self, username, *shops):
+        user = User.objects.create_user(username=username, password='password')
+        for shop in shops:
+            Membership.objects.create(user=user, shop=shop)
+        return user
+
+    def call(self, method, url, user=None, data=None, remote_addr='127.0.0.1', **headers):
+        if user is not None:
+            headers['Authorization'] = f"Bearer {AccessToken.for_user(user)}"
+        return getattr(self.client, method)(
+            url, data, content_type='application/json', headers=headers, REMOTE_ADDR=remote_addr
+        )
+
+
+class ShopResolverTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.second_shop = Shop.objects.create(name='Second')
+        Membership.objects.create(user=self.user, shop=self.second_shop)
+        self.other_shop = Shop.objects.create(name='Other')
+
+    def resolve(self, shop_id_header=None):
+        headers = {'HTTP_X_SHOP_ID': str(shop_id_header)} if shop_id_header else {}
+        request = RequestFactory().get('/', **headers)
+        request.user = self.user
+        return shop_resolver.get_active_shop_id(request)
+
+    def test_x_shop_id_of_a_member_shop_wins(self):
+        self.user.active_shop = self.shop
+        self.assertEqual(self.resolve(self.second_shop.id), self.second_shop.id)
+
+    def test_x_shop_id_of_another_shop_is_ignored(self):
+        self.assertEqual(self.resolve(self.other_shop.id), self.shop.id)
+        self.assertEqual(self.resolve('not-a-number'), self.shop.id)
+
+    def test_active_shop_comes_before_the_first_membership(self):
+        self.user.active_shop = self.second_shop
+        self.assertEqual(self.resolve(), self.second_shop.id)
+
+    def test_memberships_are_cached_until_they_change(self):
+        self.assertEqual(shop_resolver.get_member_shop_ids(self.user.id), [self.shop.id, self.second_shop.id])
+        with self.assertNumQueries(0):
+            shop_resolver.get_member_shop_ids(self.user.id)
+        Membership.objects.create(user=self.user, shop=self.other_shop)
+        self.assertEqual(self.resolve(self.other_shop.id), self.other_shop.id)
+
+    def test_resolves_once_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with mock.patch.object(shop_resolver, 'resolve_shop_id', wraps=shop_resolver.resolve_shop_id) as resolve:
+            shop_resolver.get_active_shop_id(request)
+            shop_resolver.get_active_shop_id(request)
+        resolve.assert_called_once()
+        self.assertEqual(request.active_shop_id, self.shop.id)
+
+    def test_dashboard_remembers_the_fallback_but_not_x_shop_id(self):
+        self.call('get', reverse('dashboard-summary'), self.user, **{'X-Shop-ID': str(self.second_shop.id)})
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.active_shop_id)
+        self.call('get', reverse('dashboard-summary'), self.user)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.active_shop_id, self.shop.id)
+
+
+class CachedJWTAuthenticationTests(AccountsTestCase):
+    def authenticate(self, user):
+        authentication = CachedJWTAuthentication()
+        return authentication.get_user(authentication.get_validated_token(str(AccessToken.for_user(user))))
+
+    def test_serves_the_user_from_cache(self):
+        self.assertEqual(self.authenticate(self.user), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(self.user), self.user)
+
+    def test_user_save_shows_on_the_next_request(self):
+        self.call('get', reverse('auth_me'), self.user)
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        response = self.call('get', reverse('auth_me'), self.user)
+        self.assertEqual(response.json()['first_name'], 'Renamed')
+
+    def test_deactivated_user_is_rejected_on_the_next_request(self):
+        self.assertEqual(self.call('get', reverse('auth_me'), self.user).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        response = self.call('get', reverse('auth_me'), self.user)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'user_inactive')
+
+    def test_deleted_membership_shows_on_the_next_request(self):
+        other_shop = Shop.objects.create(name='Other')
+        membership = Membership.objects.create(user=self.user, shop=other_shop)
+        response = self.call('get', reverse('shop-list'), self.user)
+        self.assertEqual(len(response.json()['results']), 2)
+        membership.delete()
+        response = self.call('get', reverse('shop-list'), self.user)
+        self.assertEqual([shop['id'] for shop in response.json()['results']], [self.shop.id])
+        response = self.call('patch', reverse('auth_me'), self.user, {'active_shop': other_shop.id})
+        self.assertEqual(response.status_code, 403)
+
+    def test_active_shop_switch_shows_on_the_next_request(self):
+        other_shop = Shop.objects.create(name='Other')
+        Membership.objects.create(user=self.user, shop=other_shop)
+        self.assertIsNone(self.call('get', reverse('auth_me'), self.user).json()['active_shop'])
+        response = self.call('patch', reverse('auth_me'), self.user, {'active_shop': other_shop.id})
+        self.assertEqual(response.json()['active_shop']['id'], other_shop.id)
+        response = self.call('get', reverse('auth_me'), self.user)
+        self.assertEqual(response.json()['active_shop']['id'], other_shop.id)
+
+    def test_deleted_active_shop_shows_on_the_next_request(self):
+        other_shop = Shop.objects.create(name='Other')
+        Membership.objects.create(user=self.user, shop=other_shop)
+        self.call('patch', reverse('auth_me'), self.user, {'active_shop': other_shop.id})
+        other_shop.delete()
+        self.assertIsNone(self.call('get', reverse('auth_me'), self.user).json()['active_shop'])
+
+
+@override_settings(SHOP_THROTTLE_RATES={
+    'read': {'capacity': 1, 'refill_rate': 0.1, 'cost': 1},
+    'bulk': {'capacity': 10, 'refill_rate': 0.1, 'cost': 10},
+    'anon': {'capacity': 1, 'refill_rate': 0.1, 'cost': 1},
+})
+class ShopRateThrottleTests(AccountsTestCase):
+    def test_each_shop_has_its_own_bucket(self):
+        other_shop = Shop.objects.create(name='Other')
+        colleague = self.make_user('colleague', self.shop)
+        self.assertEqual(self.call('get', reverse('auth_me'), self.user).status_code, 200)
+        response = self.call('get', reverse('auth_me'), colleague)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.call('get', reverse('auth_me'), self.make_user('other', other_shop)).status_code, 200)
+
+    def test_x_shop_id_selects_the_bucket(self):
+        other_shop = Shop.objects.create(name='Other')
+        Membership.objects.create(user=self.user, shop=other_shop)
+        self.assertEqual(self.call('get', reverse('auth_me'), self.user).status_code, 200)
+        self.assertEqual(self.call('get', reverse('auth_me'), self.user).status_code, 429)
+        response = self.call('get', reverse('auth_me'), self.user, **{'X-Shop-ID': str(other_shop.id)})
+        self.assertEqual(response.status_code, 200)
+
+    def test_csv_import_draws_on_the_bulk_bucket(self):
+        # Unmetered 'write' here, so only the bulk budget can refuse it
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        self.assertEqual(self.client.post(reverse('csv-import'), headers=headers).status_code, 400)
+        self.assertEqual(self.client.post(reverse('csv-import'), headers=headers).status_code, 429)
+        self.assertEqual(self.call('get', reverse('auth_me'), self.user).status_code, 200)
+
+    def test_anonymous_requests_are_keyed_on_the_client_address(self):
+        self.assertEqual(self.call('post', reverse('auth_register')).status_code, 400)
+        self.assertEqual(self.call('post', reverse('auth_register')).status_code, 429)
+        self.assertEqual(self.call('post', reverse('auth_register'), remote_addr='10.0.0.2').status_code, 400)
+        # Signed-in callers don't share the anonymous budget
+        self.assertEqual(self.call('get', reverse('auth_me'), self.user).status_code, 200)
+
+    def test_allows_requests_while_redis_is_down(self):
+        self.server.connected = False
+        for _ in range(3):
+            self.assertEqual(self.call('get', reverse('auth_me'), self.user).status_code, 200)
@@ -0,0 +1,59 @@
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+from core.ratelimit import TokenBucket
+from .services.shop_resolver import get_active_shop_id
+
+class ShopRateThrottle(BaseThrottle):
+    """
+    Fair-share throttle: every shop gets its own token bucket per endpoint
+    class, so one shop's bulk sync can't starve the others.
+
+    The endpoint class comes from the view's `throttle_scope`, defaulting to
+    'read' for safe methods and 'write' otherwise. Each class has its own
+    budget and per-request cost in SHOP_THROTTLE_RATES; a view may override
+    the cost with `throttle_cost`. Unauthenticated requests are keyed on the
+    client address under the 'anon' class.
+    """
+    def __init__(self):
+        self.retry_after = None
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return 'read' if request.method in SAFE_METHODS else 'write'
+
+    def get_ident_key(self, request):
+        user = getattr(request, 'user', None)
+        if user and user.is_authenticated:
+            shop_id = get_active_shop_id(request)
+            if shop_id:
+                return f"shop_{shop_id}"
+            return f"user_{user.pk}"
+        return None
+
+    def allow_request(self, request, view):
+        rates = settings.SHOP_THROTTLE_RATES
+        ident_key = self.get_ident_key(request)
+        if ident_key is None:
+            scope = 'anon'
+            ident_key = f"anon_{self.get_ident(request)}"
+        else:
+            scope = self.get_scope(request, view)
+
+        budget = rates.get(scope)
+        if budget is None:
+            return True
+
+        bucket = TokenBucket(
+            f"throttle_{ident_key}_{scope}",
+            capacity=budget['capacity'],
+            refill_rate=budget['refill_rate'],
+        )
+        cost = getattr(view, 'throttle_cost', None) or budget.get('cost', 1)
+        allowed, self.retry_after = bucket.consume(cost)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
@@ -4,7 +4,8 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Shop, Membership, Role
+from .models import Shop, Role
+from .services.shop_resolver import get_member_shop_ids, is_member
 from .serializers import (
     UserSerializer, 
     RegisterSerializer, 
@@ -50,9 +51,10 @@ class MeView(views.APIView):
         if 'active_shop' in request.data:
             shop_id = request.data['active_shop']
             # Verify user has membership to this shop
-            if Membership.objects.filter(user=request.user, shop_id=shop_id).exists():
+            if is_member(request.user.id, shop_id):
                 request.user.active_shop_id = shop_id
-                request.user.save()
+                # Saving bumps the user's auth cache version (see signals)
+                request.user.save(update_fields=['active_shop'])
             else:
                 return Response({"error": "Not a member of this shop"}, status=status.HTTP_403_FORBIDDEN)
                 
@@ -65,5 +67,4 @@ class ShopViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Return only shops the user is a member of
-        user_shop_ids = Membership.objects.filter(user=self.request.user).values_list('shop_id', flat=True)
-        return Shop.objects.filter(id__in=user_shop_ids)
+        return Shop.objects.filter(id__in=get_member_shop_ids(self.request.user.id))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ChannelIntegration, ChannelListing, SyncJob
+from .models import ChannelIntegration, ChannelListing, SyncJob, WebhookEvent
 
 @admin.register(ChannelIntegration)
 class ChannelIntegrationAdmin(admin.ModelAdmin):
@@ -17,3 +17,10 @@ class SyncJobAdmin(admin.ModelAdmin):
     list_display = ('operation', 'direction', 'status', 'integration', 'created_at')
     list_filter = ('status', 'direction', 'operation')
     readonly_fields = ('created_at', 'completed_at')
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('topic', 'status', 'integration', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'topic', 'provider')
+    search_fields = ('notification_id',)
+    readonly_fields = ('received_at', 'processed_at')
@@ -0,0 +1,51 @@
+import requests
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from apps.channels.models import ChannelIntegration
+from apps.channels.services.webhook_intake import identify_seller, remember_seller_id
+from integrations.ebay.client import EbayClient
+
+class Command(BaseCommand):
+    help = (
+        "Records the eBay username of active integrations that don't have one yet, "
+        "so webhook notifications can be routed to them."
+    )
+
+    def handle(self, *args, **options):
+        integrations = ChannelIntegration.objects.filter(
+            Q(external_account_id__isnull=True) | Q(external_account_id=''),
+            provider='ebay', status='active'
+        )
+
+        missing = []
+        for integration in integrations.order_by('id'):
+            try:
+                seller_id = self.find_seller_id(integration)
+            except Exception as e:
+                self.stderr.write(f"Integration {integration.id}: {e}")
+                seller_id = None
+            if seller_id:
+                self.stdout.write(f"Integration {integration.id}: {seller_id}")
+            else:
+                missing.append(integration.id)
+
+        if missing:
+            self.stdout.write(
+                f"No eBay username found for integrations {', '.join(map(str, missing))}; "
+                "they need to reconnect before notifications reach them"
+            )
+
+    def find_seller_id(self, integration):
+        """
+        Asks the Identity API, falling back to the seller named on a recent
+        order: tokens granted before the identity scope was requested are
+        refused by the Identity API.
+        """
+        try:
+            return identify_seller(integration)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in (401, 403):
+                raise
+        response = EbayClient(integration).get_orders(page_size=1) or {}
+        remember_seller_id(integration, response.get('orders') or [])
+        return integration.external_account_id
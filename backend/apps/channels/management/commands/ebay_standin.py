@@ -0,0 +1,69 @@
+import signal
+from django.core.management.base import BaseCommand
+from apps.channels.models import ChannelListing
+from apps.inventory.models import InventoryLot
+from integrations.ebay.standin import EbayStandin, StandinConfig, make_server
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local stand-in for the eBay API for load testing. "
+        "Start workers with EBAY_API_BASE_URL=http://<host>:<port> to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.05, help="Seconds added to every response")
+        parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many extra seconds per response")
+        parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="Share of API calls answered with 429")
+        parser.add_argument('--retry-after', type=int, default=1, help="Retry-After sent with injected 429s")
+        parser.add_argument('--backlog-orders', type=int, default=100, help="Orders per seller created before startup")
+        parser.add_argument('--backlog-hours', type=float, default=24)
+        parser.add_argument('--order-rate', type=float, default=0.0, help="New orders per second per seller")
+        parser.add_argument('--skus', type=int, default=0,
+                            help="Generate this many SKUs instead of using the SKUs in the database")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        skus = self.get_skus(options['skus'])
+        config = StandinConfig(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            rate_limit_ratio=options['rate_limit_ratio'],
+            retry_after=options['retry_after'],
+            backlog_orders=options['backlog_orders'],
+            backlog_hours=options['backlog_hours'],
+            order_rate=options['order_rate'],
+            skus=skus,
+            seed=options['seed'],
+        )
+        standin = EbayStandin(config)
+        server = make_server(standin, options['host'], options['port'])
+        
+        self.stdout.write(f"eBay stand-in listening on http://{options['host']}:{options['port']} with {len(skus)} SKUs")
+        # Print the request stats when stopped from a process manager too
+        signal.signal(signal.SIGTERM, _interrupt)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            
+        for (method, route, status), count in sorted(standin.stats.items()):
+            self.stdout.write(f"{method} {route} {status}: {count}")
+
+    def get_skus(self, count):
+        """
+        Orders reference the SKUs already linked or stocked in the database, so
+        processing them hits real lots. Falls back to generated SKUs.
+        """
+        if count:
+            return [f"STANDIN-{i:05d}" for i in range(count)]
+        skus = set(ChannelListing.objects.exclude(external_sku__isnull=True).exclude(external_sku='')
+                   .values_list('external_sku', flat=True))
+        skus.update(InventoryLot.objects.values_list('sku', flat=True))
+        return sorted(skus) or StandinConfig().skus
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('channels', '0002_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channelintegration',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='channelintegration',
+            index=models.Index(fields=['status', 'next_poll_at'], name='channels_ch_status_8fb5b1_idx'),
+        ),
+    ]
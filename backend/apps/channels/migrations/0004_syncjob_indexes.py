@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channels', '0003_channelintegration_next_poll_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='syncjob',
+            index=models.Index(fields=['integration', '-created_at'], name='channels_sy_integra_99b63a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='syncjob',
+            index=models.Index(fields=['created_at'], name='channels_sy_created_39412d_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channels', '0004_syncjob_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(max_length=100)),
+                ('bucket_start', models.DateTimeField()),
+                ('success_count', models.IntegerField(default=0)),
+                ('failure_count', models.IntegerField(default=0)),
+                ('retry_count', models.IntegerField(default=0)),
+                ('latency_sum', models.FloatField(default=0)),
+                ('latency_buckets', models.JSONField(blank=True, default=list)),
+                ('integration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_metrics', to='channels.channelintegration')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket_start'], name='channels_sy_bucket__f5b66e_idx')],
+                'unique_together': {('integration', 'operation', 'bucket_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channels', '0005_syncmetric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('integration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_entries', to='channels.channelintegration')),
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_entry', to='channels.channellisting')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channels', '0006_outboxentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxentry',
+            name='lane',
+            field=models.CharField(choices=[('sales', 'Sales'), ('interactive', 'Interactive')], default='interactive', max_length=20),
+        ),
+    ]
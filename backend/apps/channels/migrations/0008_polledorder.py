@@ -0,0 +1,45 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:54
+
+import django.db.models.deletion
+from datetime import datetime
+from django.db import migrations, models
+
+
+def move_seen_orders(apps, schema_editor):
+    # Seen order ids used to live in ChannelIntegration.metadata['poll_cursor_seen']
+    ChannelIntegration = apps.get_model('channels', 'ChannelIntegration')
+    PolledOrder = apps.get_model('channels', 'PolledOrder')
+    for integration in ChannelIntegration.objects.filter(metadata__has_key='poll_cursor_seen'):
+        rows = []
+        for order_id, created in integration.metadata.pop('poll_cursor_seen').items():
+            try:
+                created_at = datetime.fromisoformat(created.replace('Z', '+00:00'))
+            except (AttributeError, ValueError):
+                continue
+            rows.append(PolledOrder(integration=integration, order_id=order_id, order_created_at=created_at))
+        PolledOrder.objects.bulk_create(rows, ignore_conflicts=True)
+        integration.save(update_fields=['metadata'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channels', '0007_outboxentry_lane'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolledOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.CharField(max_length=255)),
+                ('order_created_at', models.DateTimeField()),
+                ('integration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='polled_orders', to='channels.channelintegration')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['integration', 'order_created_at'], name='channels_po_integra_c74db8_idx')],
+                'unique_together': {('integration', 'order_id')},
+            },
+        ),
+        migrations.RunPython(move_seen_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:56
+
+from django.db import migrations, models
+
+
+def move_seller_ids(apps, schema_editor):
+    # Seller ids used to live in ChannelIntegration.metadata['ebay_seller_id']
+    ChannelIntegration = apps.get_model('channels', 'ChannelIntegration')
+    for integration in ChannelIntegration.objects.filter(metadata__has_key='ebay_seller_id'):
+        integration.external_account_id = integration.metadata.pop('ebay_seller_id')
+        integration.save(update_fields=['external_account_id', 'metadata'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('channels', '0008_polledorder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channelintegration',
+            name='external_account_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='channelintegration',
+            index=models.Index(fields=['provider', 'external_account_id'], name='channels_ch_provide_dc8a6f_idx'),
+        ),
+        migrations.RunPython(move_seller_ids, migrations.RunPython.noop),
+    ]
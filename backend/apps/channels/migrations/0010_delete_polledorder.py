@@ -0,0 +1,16 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:11
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channels', '0009_channelintegration_external_account_id'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='PolledOrder',
+        ),
+    ]
@@ -16,9 +16,20 @@ class ChannelIntegration(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='disconnected')
     token_expiry = models.DateTimeField(null=True, blank=True)
     last_poll_cursor = models.CharField(max_length=255, blank=True, null=True)
+    next_poll_at = models.DateTimeField(null=True, blank=True)
+    # The seller's user id on the channel, which notifications are addressed to
+    external_account_id = models.CharField(max_length=255, blank=True, null=True)
     metadata = JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Due-poll lookups: active integrations in next_poll_at order
+            models.Index(fields=['status', 'next_poll_at']),
+            # Routing notifications to their integration
+            models.Index(fields=['provider', 'external_account_id']),
+        ]
+
     def __str__(self):
         return f"{self.get_provider_display()} - {self.shop.name} ({self.status})"
 
@@ -70,5 +81,90 @@ class SyncJob(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Per-integration history, newest first
+            models.Index(fields=['integration', '-created_at']),
+            # Retention pruning
+            models.Index(fields=['created_at']),
+        ]
+
     def __str__(self):
         return f"{self.operation} ({self.status}) for {self.integration.shop.name}"
+
+class SyncMetric(models.Model):
+    """
+    Aggregated outcome and latency of one sync operation for an integration
+    over one time bucket (SYNC_METRICS_BUCKET_SECONDS). latency_buckets holds
+    histogram counts per bound in apps.channels.services.sync_metrics.LATENCY_BUCKETS.
+    """
+    integration = models.ForeignKey(ChannelIntegration, on_delete=models.CASCADE, related_name='sync_metrics')
+    operation = models.CharField(max_length=100)
+    bucket_start = models.DateTimeField()
+    success_count = models.IntegerField(default=0)
+    failure_count = models.IntegerField(default=0)
+    retry_count = models.IntegerField(default=0)
+    latency_sum = models.FloatField(default=0)
+    latency_buckets = JSONField(default=list, blank=True)
+
+    class Meta:
+        unique_together = ('integration', 'operation', 'bucket_start')
+        indexes = [
+            models.Index(fields=['bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.operation} at {self.bucket_start} for integration {self.integration_id}"
+
+class OutboxEntry(models.Model):
+    """
+    Transactional outbox for outbound quantity sync. A row is written in the
+    same transaction that marks its listing pending, so a push is only ever
+    dispatched for committed changes and none is lost if the broker publish
+    fails. dispatch_outbox drains the table. At most one row exists per listing.
+    The lane picks the worker queue of the push: sales for quantity changes
+    caused by orders, interactive for changes made by users.
+    """
+    LANE_CHOICES = (
+        ('sales', 'Sales'),
+        ('interactive', 'Interactive'),
+    )
+
+    integration = models.ForeignKey(ChannelIntegration, on_delete=models.CASCADE, related_name='outbox_entries')
+    listing = models.OneToOneField(ChannelListing, on_delete=models.CASCADE, related_name='outbox_entry')
+    lane = models.CharField(max_length=20, choices=LANE_CHOICES, default='interactive')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Outbound sync of listing {self.listing_id}"
+
+class WebhookEvent(models.Model):
+    """
+    Durable intake queue for channel notifications. A row is written before the
+    webhook is acknowledged, then processed by process_webhook_event.
+    """
+    STATUS_CHOICES = (
+        ('received', 'Received'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    )
+
+    provider = models.CharField(max_length=50, choices=[('ebay', 'eBay')], default='ebay')
+    notification_id = models.CharField(max_length=255, unique=True)
+    topic = models.CharField(max_length=100)
+    integration = models.ForeignKey(ChannelIntegration, on_delete=models.SET_NULL, null=True, blank=True, related_name='webhook_events')
+    payload = JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='received')
+    attempts = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.topic} ({self.status})"
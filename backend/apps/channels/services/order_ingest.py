@@ -0,0 +1,220 @@
+import logging
+from dataclasses import dataclass
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from apps.channels.models import ChannelIntegration, ChannelListing
+from apps.channels.services.outbound import queue_lots_push
+from apps.inventory.models import InventoryEvent, InventoryLot
+from core.bloom import RecentBloomFilter
+
+logger = logging.getLogger(__name__)
+
+# Attempts at a batch when a concurrent worker inserts one of its events first
+MAX_BATCH_ATTEMPTS = 2
+
+PROVIDER_EVENT_ID_MAX_LENGTH = InventoryEvent._meta.get_field('provider_event_id').max_length
+ORDER_ID_MAX_LENGTH = InventoryEvent._meta.get_field('order_id').max_length
+
+def provider_event_filter(integration_id):
+    """
+    Bloom filter of the provider event ids recently recorded for an integration.
+    """
+    return RecentBloomFilter(
+        f"provider_events_{integration_id}",
+        bits=settings.PROVIDER_EVENT_FILTER_BITS,
+        hashes=settings.PROVIDER_EVENT_FILTER_HASHES,
+        period=settings.PROVIDER_EVENT_FILTER_PERIOD
+    )
+
+@dataclass
+class SaleLine:
+    provider_event_id: str
+    order_id: str
+    sku: str
+    quantity: int
+    item: dict
+
+def ebay_provider_event_id(order_id, line_item_id):
+    # lineItemId is unique per sale, so it makes the event idempotent
+    return f"ebay_order_{order_id}_{line_item_id}"
+
+def extract_sale_lines(orders, integration_id):
+    """
+    Flattens eBay orders into one SaleLine per line item, dropping duplicates
+    within the batch. Malformed orders and line items are logged and skipped,
+    so one bad line can't fail the rest of the page.
+    """
+    lines = {}
+    for order in orders:
+        order_id = order.get('orderId') if isinstance(order, dict) else None
+        if not order_id:
+            logger.error(f"Received order without orderId for integration {integration_id}")
+            continue
+        for item in order.get('lineItems') or []:
+            try:
+                line = _sale_line(order_id, item)
+            except (AttributeError, TypeError, ValueError) as e:
+                logger.error(f"Skipping malformed line item in order {order_id} for integration {integration_id}: {e}")
+                continue
+            lines.setdefault(line.provider_event_id, line)
+    return list(lines.values())
+
+def _sale_line(order_id, item):
+    line_item_id = item.get('lineItemId')
+    if not line_item_id:
+        raise ValueError("no lineItemId")
+    quantity = int(item.get('quantity', 1))
+    if quantity < 1:
+        raise ValueError(f"quantity {quantity}")
+    provider_event_id = ebay_provider_event_id(order_id, line_item_id)
+    # Would fail the whole batch insert rather than just this line
+    if len(provider_event_id) > PROVIDER_EVENT_ID_MAX_LENGTH or len(str(order_id)) > ORDER_ID_MAX_LENGTH:
+        raise ValueError("order or line item id too long")
+    sku = item.get('sku')
+    return SaleLine(
+        provider_event_id=provider_event_id,
+        order_id=order_id,
+        sku=sku if isinstance(sku, str) else None,
+        quantity=quantity,
+        item=item,
+    )
+
+def resolve_lot_ids(integration_id, skus):
+    """
+    Maps each SKU to its lot: through the integration's listing when one is
+    linked, otherwise by lot SKU within the integration's shop.
+    """
+    lot_ids = {}
+    listings = (ChannelListing.objects
+                .filter(integration_id=integration_id, external_sku__in=skus)
+                .order_by('-id')
+                .values_list('external_sku', 'lot_id'))
+    # Ordered newest first, so the oldest listing wins for a SKU
+    for sku, lot_id in listings:
+        lot_ids[sku] = lot_id
+
+    unlinked = [sku for sku in skus if sku not in lot_ids]
+    if unlinked:
+        shop_id = ChannelIntegration.objects.filter(id=integration_id).values_list('shop_id', flat=True).first()
+        lots = InventoryLot.objects.filter(shop_id=shop_id, sku__in=unlinked).values_list('sku', 'id')
+        lot_ids.update(lots)
+    return lot_ids
+
+def process_order_batch(orders, integration_id):
+    """
+    Records the sales in a page of eBay orders in a handful of set-based queries.
+    Line items already recorded are skipped, so the same orders can be fed in
+    any number of times. All decrements happen in one transaction, with the
+    affected lots locked in id order so concurrent batches can't deadlock.
+    Returns counts of recorded, duplicate and unmatched line items.
+    """
+    lines = extract_sale_lines(orders, integration_id)
+    summary = {"recorded": 0, "duplicates": 0, "unmatched": 0}
+    if not lines:
+        return summary
+
+    # Ids the filter has never seen are certainly new and skip the database
+    # checks; only possible repeats are looked up. Repeated under the lot locks below.
+    event_filter = provider_event_filter(integration_id)
+    maybe_recorded = event_filter.might_contain(line.provider_event_id for line in lines)
+    recorded = set(InventoryEvent.objects.filter(
+        provider_event_id__in=maybe_recorded
+    ).values_list('provider_event_id', flat=True)) if maybe_recorded else set()
+    if recorded:
+        # Keep them in the current period's filter while they're still being redelivered
+        event_filter.add(recorded)
+    pending = [line for line in lines if line.provider_event_id not in recorded]
+    summary["duplicates"] = len(lines) - len(pending)
+    if not pending:
+        return summary
+
+    lot_ids = resolve_lot_ids(integration_id, {line.sku for line in pending if line.sku})
+    matched = []
+    for line in pending:
+        if line.sku in lot_ids:
+            matched.append(line)
+        else:
+            logger.error(f"Could not find lot for SKU {line.sku} in order {line.order_id}")
+    summary["unmatched"] = len(pending) - len(matched)
+
+    recheck_ids = maybe_recorded
+    for attempt in range(1, MAX_BATCH_ATTEMPTS + 1):
+        try:
+            recorded, duplicates = _apply_sales(matched, lot_ids, recheck_ids, event_filter)
+            break
+        except IntegrityError:
+            # The unique constraint is the source of truth: another worker
+            # recorded one of these events, or the filter had aged it out
+            if attempt == MAX_BATCH_ATTEMPTS:
+                raise
+            logger.info(f"Retrying order batch for integration {integration_id} with a full duplicate check")
+            recheck_ids = None
+
+    summary["recorded"] = recorded
+    summary["duplicates"] += duplicates
+    return summary
+
+def _apply_sales(lines, lot_ids, recheck_ids, event_filter):
+    """
+    Applies the sales under the lot locks. Only ids in `recheck_ids` are
+    checked against recorded events again, or every id when it is None.
+    """
+    if not lines:
+        return 0, 0
+
+    with transaction.atomic():
+        lots = {
+            lot.id: lot
+            for lot in InventoryLot.objects.select_for_update().filter(
+                id__in={lot_ids[line.sku] for line in lines}
+            ).order_by('id')
+        }
+        # Holding the locks, nobody else can record a sale against these lots
+        if recheck_ids is None:
+            recheck_ids = [line.provider_event_id for line in lines]
+        else:
+            recheck_ids = [line.provider_event_id for line in lines if line.provider_event_id in recheck_ids]
+        already_recorded = set(InventoryEvent.objects.filter(
+            provider_event_id__in=recheck_ids
+        ).values_list('provider_event_id', flat=True)) if recheck_ids else set()
+
+        now = timezone.now()
+        events = []
+        touched = {}
+        for line in lines:
+            if line.provider_event_id in already_recorded:
+                continue
+            lot = lots.get(lot_ids[line.sku])
+            if lot is None:
+                continue
+
+            if lot.quantity_available < line.quantity:
+                logger.warning(f"Oversell detected for {line.sku}: trying to sell {line.quantity}, have {lot.quantity_available}")
+                # quantity_available can't go negative, so we can only sell what we have
+                actual_decrement = lot.quantity_available
+            else:
+                actual_decrement = line.quantity
+
+            lot.quantity_available -= actual_decrement
+            lot.updated_at = now
+            touched[lot.id] = lot
+            events.append(InventoryEvent(
+                lot=lot,
+                event_type='sale',
+                quantity_delta=-actual_decrement,
+                resulting_quantity=lot.quantity_available,
+                provider_event_id=line.provider_event_id,
+                order_id=line.order_id,
+                metadata={'ebay_line_item': line.item}
+            ))
+
+        if touched:
+            InventoryLot.objects.bulk_update(touched.values(), ['quantity_available', 'updated_at'])
+            InventoryEvent.objects.bulk_create(events)
+            recorded_ids = [event.provider_event_id for event in events]
+            transaction.on_commit(lambda: event_filter.add(recorded_ids))
+            # Every listing of a sold lot needs the new quantity, including the one just sold
+            queue_lots_push(touched.keys(), lane='sales')
+
+    return len(events), len(lines) - len(events)
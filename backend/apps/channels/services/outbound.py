@@ -0,0 +1,111 @@
+import logging
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+from apps.channels.models import ChannelListing, OutboxEntry
+from core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Extra lifetime of the "dispatch scheduled" marker beyond the debounce window,
+# so a dispatch that sits in the queue for a while isn't scheduled twice
+DISPATCH_SCHEDULE_GRACE_SECONDS = 60
+
+# Kept in Redis rather than the Django cache: the web process sets it and the
+# worker clears it, so it has to be shared even where the cache is per process
+OUTBOX_DISPATCH_SCHEDULED_KEY = "channel_outbox_dispatch_scheduled"
+
+def queue_lot_push(lot_id, lane='interactive'):
+    """
+    Marks every live listing of a lot as pending (dirty) and records it in the
+    outbox in the same transaction. A debounced dispatch_outbox is scheduled
+    once the transaction commits. Pushes caused by sales use lane='sales',
+    which is dispatched to the sales worker queue.
+    The push reads the lot's quantity when it runs, so it always sends the
+    latest value, and repeated changes inside the debounce window coalesce
+    into a single push per listing.
+    """
+    queue_lots_push([lot_id], lane)
+
+def queue_lots_push(lot_ids, lane='interactive'):
+    """
+    queue_lot_push for many lots at once.
+    """
+    _queue_listings(ChannelListing.objects.filter(lot_id__in=lot_ids), lane)
+
+def queue_listing_push(listing_id):
+    """
+    Queues a push of a single listing, e.g. right after it's linked or when a
+    push is requested by hand.
+    """
+    _queue_listings(ChannelListing.objects.filter(id=listing_id), 'interactive')
+
+def _queue_listings(listings, lane):
+    listings = listings.exclude(sync_state='delisted')
+    rows = list(listings.values_list('id', 'integration_id'))
+    if not rows:
+        return
+
+    with transaction.atomic():
+        ChannelListing.objects.filter(id__in=[listing_id for listing_id, _ in rows]).update(sync_state='pending')
+        entries = [OutboxEntry(listing_id=listing_id, integration_id=integration_id, lane=lane) for listing_id, integration_id in rows]
+        # A listing already in the outbox is covered by its existing row; a
+        # sale moves that row to the sales lane, nothing moves it back
+        if lane == 'sales':
+            OutboxEntry.objects.bulk_create(entries, update_conflicts=True, unique_fields=['listing'], update_fields=['lane'])
+        else:
+            OutboxEntry.objects.bulk_create(entries, ignore_conflicts=True)
+        transaction.on_commit(schedule_outbox_dispatch)
+
+def schedule_outbox_dispatch():
+    """
+    Schedules dispatch_outbox after the debounce window, unless one is already
+    scheduled and hasn't started yet. If the broker can't be reached the rows
+    stay in the outbox for the periodic dispatch.
+    """
+    from apps.channels.tasks import dispatch_outbox
+
+    debounce = settings.CHANNEL_PUSH_DEBOUNCE_SECONDS
+    try:
+        scheduled = get_redis().set(OUTBOX_DISPATCH_SCHEDULED_KEY, 1, nx=True, ex=debounce + DISPATCH_SCHEDULE_GRACE_SECONDS)
+    except RedisError as e:
+        # Without the marker a dispatch per transaction is scheduled; harmless, just more of them
+        logger.warning(f"Outbox dispatch marker unavailable, scheduling anyway: {e}")
+        scheduled = True
+    if not scheduled:
+        return
+    try:
+        dispatch_outbox.apply_async(countdown=debounce)
+    except Exception as e:
+        clear_outbox_dispatch_schedule()
+        logger.warning(f"Could not schedule outbox dispatch, leaving it to the periodic run: {e}")
+
+def clear_outbox_dispatch_schedule():
+    """
+    Called when a dispatch starts, so rows written from here on schedule a new one.
+    """
+    try:
+        get_redis().delete(OUTBOX_DISPATCH_SCHEDULED_KEY)
+    except RedisError as e:
+        logger.warning(f"Could not clear the outbox dispatch marker: {e}")
+
+def claim_outbox_batch(batch_size):
+    """
+    Locks up to batch_size outbox rows (skipping rows another dispatcher holds),
+    deletes them and returns {integration id: lane} for the integrations they
+    belong to. An integration with any sales row gets the sales lane. Must run
+    inside the dispatcher's transaction, so the rows come back if queueing the
+    pushes fails.
+    """
+    entries = list(
+        OutboxEntry.objects.select_for_update(skip_locked=True)
+        .order_by('id')
+        .values_list('id', 'integration_id', 'lane')[:batch_size]
+    )
+    lanes = {}
+    for _, integration_id, lane in entries:
+        if lanes.get(integration_id) != 'sales':
+            lanes[integration_id] = lane
+    if entries:
+        OutboxEntry.objects.filter(id__in=[entry[0] for entry in entries]).delete()
+    return lanes
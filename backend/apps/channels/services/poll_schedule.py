@@ -0,0 +1,65 @@
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from apps.channels.models import ChannelIntegration
+from apps.inventory.models import InventoryEvent
+
+# Due integrations claimed per dispatch tick
+DISPATCH_BATCH_SIZE = 1000
+
+def get_sales_per_hour(integration):
+    """
+    Order velocity of the integration's shop: eBay sale events per hour over
+    the last EBAY_POLL_VELOCITY_WINDOW_HOURS.
+    """
+    window_hours = settings.EBAY_POLL_VELOCITY_WINDOW_HOURS
+    sales = InventoryEvent.objects.filter(
+        event_type='sale',
+        lot__shop_id=integration.shop_id,
+        provider_event_id__startswith='ebay_',
+        created_at__gte=timezone.now() - timedelta(hours=window_hours)
+    ).count()
+    return sales / window_hours
+
+def get_poll_interval(sales_per_hour):
+    """
+    Seconds until the next poll: long enough to expect about
+    EBAY_POLL_TARGET_ORDERS new sales, within the configured bounds.
+    """
+    if sales_per_hour <= 0:
+        return settings.EBAY_POLL_MAX_INTERVAL
+    interval = settings.EBAY_POLL_TARGET_ORDERS * 3600 / sales_per_hour
+    return min(max(interval, settings.EBAY_POLL_MIN_INTERVAL), settings.EBAY_POLL_MAX_INTERVAL)
+
+def schedule_next_poll(integration):
+    """
+    Sets the integration's next poll time from its current order velocity.
+    Jittered by up to 10% so integrations don't fall into lockstep.
+    """
+    interval = get_poll_interval(get_sales_per_hour(integration))
+    interval = max(interval * random.uniform(0.9, 1.0), settings.EBAY_POLL_MIN_INTERVAL)
+    integration.next_poll_at = timezone.now() + timedelta(seconds=interval)
+    integration.save(update_fields=['next_poll_at'])
+
+def claim_due_integrations(now=None):
+    """
+    Returns the ids of active eBay integrations whose poll is due, oldest due
+    first, and pushes their next_poll_at out by EBAY_POLL_CLAIM_SECONDS so the
+    next tick doesn't dispatch them again while they're being polled.
+    Reads only the due rows through the (status, next_poll_at) index.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = ChannelIntegration.objects.select_for_update(skip_locked=True).filter(
+            Q(next_poll_at__lte=now) | Q(next_poll_at__isnull=True),
+            provider='ebay',
+            status='active'
+        ).order_by(F('next_poll_at').asc(nulls_first=True))
+        integration_ids = list(due.values_list('id', flat=True)[:DISPATCH_BATCH_SIZE])
+        ChannelIntegration.objects.filter(id__in=integration_ids).update(
+            next_poll_at=now + timedelta(seconds=settings.EBAY_POLL_CLAIM_SECONDS)
+        )
+    return integration_ids
@@ -0,0 +1,69 @@
+import logging
+import random
+import threading
+import time
+from celery.signals import task_postrun, worker_process_shutdown
+from django.conf import settings
+from apps.channels.models import SyncJob
+
+logger = logging.getLogger(__name__)
+
+class SyncJobBuffer:
+    """
+    Per-process buffer of SyncJob audit rows, written with one bulk_create per
+    flush instead of an INSERT per sync call. Flushed once SYNC_JOB_BUFFER_SIZE
+    rows are waiting, after every task once SYNC_JOB_FLUSH_INTERVAL seconds
+    have passed, and when the worker process exits.
+    Rows still buffered when a process is killed outright are lost; audit
+    records are best-effort. created_at is the flush time, completed_at the
+    time the call finished.
+    """
+    def __init__(self):
+        self._rows = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, row):
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= settings.SYNC_JOB_BUFFER_SIZE
+        if full:
+            self.flush()
+
+    def flush_if_due(self):
+        if time.monotonic() - self._last_flush >= settings.SYNC_JOB_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._last_flush = time.monotonic()
+        if not rows:
+            return
+        try:
+            SyncJob.objects.bulk_create(rows, batch_size=500)
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} sync job records: {e}")
+
+_buffer = SyncJobBuffer()
+
+def record_sync_job(**fields):
+    """
+    Queues a SyncJob row for the next flush. Successful jobs are kept at
+    SYNC_JOB_SUCCESS_SAMPLE_RATE (1.0 keeps all of them); failures are always
+    kept.
+    """
+    if fields.get('status') == 'success' and random.random() >= settings.SYNC_JOB_SUCCESS_SAMPLE_RATE:
+        return
+    _buffer.add(SyncJob(**fields))
+
+def flush_sync_jobs():
+    _buffer.flush()
+
+@task_postrun.connect
+def _flush_after_task(**kwargs):
+    _buffer.flush_if_due()
+
+@worker_process_shutdown.connect
+def _flush_on_shutdown(**kwargs):
+    _buffer.flush()
@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from celery.signals import task_postrun, worker_process_shutdown
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from apps.channels.models import SyncMetric
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets; the last is open-ended
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+class _Aggregate:
+    __slots__ = ('success', 'failure', 'retries', 'latency_sum', 'latency_buckets')
+
+    def __init__(self):
+        self.success = 0
+        self.failure = 0
+        self.retries = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, duration, success, retries):
+        if success:
+            self.success += 1
+        else:
+            self.failure += 1
+        self.retries += retries
+        self.latency_sum += duration
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                self.latency_buckets[index] += 1
+                break
+
+class SyncMetricsRegistry:
+    """
+    Per-process counters keyed by (integration, operation, time bucket),
+    folded into SyncMetric rows on flush. Flushed like the SyncJob audit
+    buffer: after a task once SYNC_METRICS_FLUSH_INTERVAL has passed, and when
+    the worker process exits.
+    """
+    def __init__(self):
+        self._aggregates = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def observe(self, integration_id, operation, duration, success, retries=0):
+        bucket_seconds = settings.SYNC_METRICS_BUCKET_SECONDS
+        bucket = int(time.time() // bucket_seconds) * bucket_seconds
+        key = (integration_id, operation, bucket)
+        with self._lock:
+            aggregate = self._aggregates.get(key)
+            if aggregate is None:
+                aggregate = self._aggregates[key] = _Aggregate()
+            aggregate.observe(duration, success, retries)
+
+    def flush_if_due(self):
+        if time.monotonic() - self._last_flush >= settings.SYNC_METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            aggregates, self._aggregates = self._aggregates, {}
+            self._last_flush = time.monotonic()
+        for (integration_id, operation, bucket), aggregate in aggregates.items():
+            try:
+                _merge_into_row(integration_id, operation, bucket, aggregate)
+            except Exception as e:
+                logger.error(f"Failed to write sync metrics for integration {integration_id}: {e}")
+
+def _merge_into_row(integration_id, operation, bucket, aggregate):
+    bucket_start = datetime.fromtimestamp(bucket, tz=dt_timezone.utc)
+    with transaction.atomic():
+        row, _ = SyncMetric.objects.select_for_update().get_or_create(
+            integration_id=integration_id,
+            operation=operation,
+            bucket_start=bucket_start
+        )
+        row.success_count += aggregate.success
+        row.failure_count += aggregate.failure
+        row.retry_count += aggregate.retries
+        row.latency_sum += aggregate.latency_sum
+        existing = row.latency_buckets or [0] * len(LATENCY_BUCKETS)
+        row.latency_buckets = [a + b for a, b in zip(existing, aggregate.latency_buckets)]
+        row.save()
+
+_registry = SyncMetricsRegistry()
+
+def record_sync(integration_id, operation, duration, success, retries=0):
+    """
+    Records one sync call: its duration in seconds, outcome, and how many
+    times it had been retried before.
+    """
+    _registry.observe(integration_id, operation, duration, success, retries)
+
+@contextmanager
+def track_sync(integration_id, operation, retries=0, ignore=()):
+    """
+    Times the block and records it as a success, or as a failure if it raises.
+    Exceptions in `ignore` (e.g. EbayRateLimited) are re-raised unrecorded.
+    """
+    started = time.monotonic()
+    try:
+        yield
+    except ignore:
+        raise
+    except Exception:
+        record_sync(integration_id, operation, time.monotonic() - started, False, retries)
+        raise
+    record_sync(integration_id, operation, time.monotonic() - started, True, retries)
+
+def flush_sync_metrics():
+    _registry.flush()
+
+@task_postrun.connect
+def _flush_after_task(**kwargs):
+    _registry.flush_if_due()
+
+@worker_process_shutdown.connect
+def _flush_on_shutdown(**kwargs):
+    _registry.flush()
+
+def latency_quantile(latency_buckets, quantile):
+    """
+    Estimates a latency quantile as the upper bound of the histogram bucket
+    it falls in. Returns None without samples, or if it's in the open bucket.
+    """
+    total = sum(latency_buckets)
+    if not total:
+        return None
+    rank = quantile * total
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, latency_buckets):
+        seen += count
+        if seen >= rank:
+            return None if bound == float('inf') else bound
+    return None
+
+def summarize(rows):
+    """
+    Folds SyncMetric rows into per-(integration, operation) totals.
+    """
+    totals = {}
+    for row in rows:
+        total = totals.setdefault((row.integration_id, row.operation), {
+            'success': 0, 'failure': 0, 'retries': 0, 'latency_sum': 0.0,
+            'latency_buckets': [0] * len(LATENCY_BUCKETS),
+        })
+        total['success'] += row.success_count
+        total['failure'] += row.failure_count
+        total['retries'] += row.retry_count
+        total['latency_sum'] += row.latency_sum
+        total['latency_buckets'] = [a + b for a, b in zip(total['latency_buckets'], row.latency_buckets or [])]
+    return totals
+
+def get_integration_summary(integration, hours):
+    """
+    Per-operation counts, error rate and latency for an integration over the
+    last `hours`.
+    """
+    since = timezone.now() - timedelta(hours=hours)
+    rows = SyncMetric.objects.filter(integration=integration, bucket_start__gte=since)
+    operations = []
+    for (_, operation), total in sorted(summarize(rows).items()):
+        calls = total['success'] + total['failure']
+        operations.append({
+            'operation': operation,
+            'success': total['success'],
+            'failure': total['failure'],
+            'retries': total['retries'],
+            'error_rate': total['failure'] / calls if calls else 0,
+            'avg_latency': total['latency_sum'] / calls if calls else None,
+            'p50_latency': latency_quantile(total['latency_buckets'], 0.5),
+            'p95_latency': latency_quantile(total['latency_buckets'], 0.95),
+        })
+    return {'integration': integration.id, 'hours': hours, 'operations': operations}
+
+def render_prometheus(window_minutes):
+    """
+    Renders the last `window_minutes` of metrics for every integration in the
+    Prometheus text format. Values cover that window only (rows are pruned),
+    so they are exported as gauges rather than counters.
+    """
+    since = timezone.now() - timedelta(minutes=window_minutes)
+    totals = summarize(SyncMetric.objects.filter(bucket_start__gte=since))
+    window = f"{window_minutes}m"
+    lines = [
+        "# HELP sync_calls Sync calls by outcome over the window.",
+        "# TYPE sync_calls gauge",
+    ]
+    for (integration_id, operation), total in sorted(totals.items()):
+        labels = f'integration="{integration_id}",operation="{operation}",window="{window}"'
+        lines.append(f'sync_calls{{{labels},outcome="success"}} {total["success"]}')
+        lines.append(f'sync_calls{{{labels},outcome="failure"}} {total["failure"]}')
+    lines += [
+        "# HELP sync_retries Retries of sync calls over the window.",
+        "# TYPE sync_retries gauge",
+    ]
+    for (integration_id, operation), total in sorted(totals.items()):
+        lines.append(f'sync_retries{{integration="{integration_id}",operation="{operation}",window="{window}"}} {total["retries"]}')
+    lines += [
+        "# HELP sync_latency_seconds Latency of sync calls over the window.",
+        "# TYPE sync_latency_seconds histogram",
+    ]
+    for (integration_id, operation), total in sorted(totals.items()):
+        labels = f'integration="{integration_id}",operation="{operation}",window="{window}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, total['latency_buckets']):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else bound
+            lines.append(f'sync_latency_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f'sync_latency_seconds_sum{{{labels}}} {total["latency_sum"]}')
+        lines.append(f'sync_latency_seconds_count{{{labels}}} {cumulative}')
+    return "\n".join(lines) + "\n"
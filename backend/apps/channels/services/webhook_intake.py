@@ -0,0 +1,145 @@
+import hashlib
+import logging
+from django.db import transaction
+from django.utils import timezone
+from apps.channels.models import ChannelIntegration, WebhookEvent
+from apps.channels.services.order_ingest import process_order_batch
+from integrations.ebay.auth import invalidate_cached_token
+from integrations.ebay.client import EbayClient
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_DELETION_TOPIC = 'MARKETPLACE_ACCOUNT_DELETION'
+
+# Notifications that mean a sale happened; they're ingested like polled orders
+ORDER_TOPICS = {
+    'ORDER_CONFIRMATION',
+    'ITEM_SOLD',
+    'FIXED_PRICE_TRANSACTION',
+    'AUCTION_CHECKOUT_COMPLETE',
+}
+
+# Attempts before a notification is left as failed for polling to cover
+MAX_WEBHOOK_ATTEMPTS = 5
+
+def record_notification(payload, raw_body):
+    """
+    Writes an eBay notification to the intake queue and schedules its
+    processing once the row is committed. Redelivered notifications (same
+    notificationId) are stored once.
+    """
+    notification = payload.get('notification') or {}
+    notification_id = notification.get('notificationId') or hashlib.sha256(raw_body).hexdigest()
+    topic = (payload.get('metadata') or {}).get('topic') or ''
+
+    with transaction.atomic():
+        event, created = WebhookEvent.objects.get_or_create(
+            notification_id=notification_id,
+            defaults={'provider': 'ebay', 'topic': topic, 'payload': payload}
+        )
+        if created:
+            transaction.on_commit(lambda: schedule_event_processing(event.id))
+    return event
+
+def schedule_event_processing(event_id):
+    """
+    Queues a stored event for processing. If the broker can't be reached the
+    event stays received for process_webhook_backlog: the notification is
+    already durable, so eBay must not be asked to redeliver it (a redelivery
+    finds the row and queues nothing).
+    """
+    from apps.channels.tasks import process_webhook_event
+
+    try:
+        process_webhook_event.delay(event_id)
+    except Exception as e:
+        logger.error(f"Could not queue webhook event {event_id}, leaving it to the backlog sweep: {e}")
+
+def identify_seller(integration):
+    """
+    Looks up the integration's eBay username through the Identity API and
+    records it, so notifications, which only name the seller, can be routed
+    to it from the first one on. Called once OAuth connects the integration.
+    Returns the username.
+    """
+    seller_id = (EbayClient(integration).get_user() or {}).get('username')
+    _set_seller_id(integration, seller_id)
+    return seller_id
+
+def remember_seller_id(integration, orders):
+    """
+    Records the integration's eBay seller id from polled orders, in case it
+    wasn't known from the connection or the seller's username changed.
+    """
+    seller_id = next((order.get('sellerId') for order in orders if order.get('sellerId')), None)
+    _set_seller_id(integration, seller_id)
+
+def _set_seller_id(integration, seller_id):
+    if not seller_id or integration.external_account_id == seller_id:
+        return
+    ChannelIntegration.objects.filter(id=integration.id).update(external_account_id=seller_id)
+    integration.external_account_id = seller_id
+
+def find_integration(seller_id):
+    if not seller_id:
+        return None
+    return ChannelIntegration.objects.filter(provider='ebay', external_account_id=seller_id).first()
+
+def process_event(event):
+    """
+    Applies one intake event and records its outcome. A thin order
+    notification's full order is fetched from eBay first, outside any
+    transaction; the changes and the event's new status then commit together.
+    Returns the recorded status.
+    Raises on failure (including EbayRateLimited) so the caller can retry.
+    """
+    data = (event.payload.get('notification') or {}).get('data') or {}
+    integration = None
+    order = None
+
+    if event.topic == ACCOUNT_DELETION_TOPIC:
+        integration = find_integration(data.get('username'))
+    elif event.topic in ORDER_TOPICS:
+        order = data.get('order') or data
+        integration = find_integration(order.get('sellerId') or data.get('username'))
+        if not integration:
+            logger.warning(f"No integration for eBay notification {event.notification_id}; polling will pick it up")
+    event.integration = integration
+
+    if order is not None and integration and integration.status == 'active' and not order.get('lineItems'):
+        # Thin notification: fetch the full order
+        order = EbayClient(integration).get_order(order['orderId'])
+
+    with transaction.atomic():
+        status = _apply_event(event, integration, order)
+        mark_event(event, status)
+    return status
+
+def _apply_event(event, integration, order):
+    if not integration:
+        return 'ignored'
+    if event.topic == ACCOUNT_DELETION_TOPIC:
+        disconnect_integration(integration)
+        return 'processed'
+    if integration.status != 'active':
+        return 'ignored'
+    process_order_batch([order], integration.id)
+    return 'processed'
+
+def disconnect_integration(integration):
+    """
+    Handles eBay's account deletion notice: drops the stored tokens and stops
+    syncing the integration.
+    """
+    integration.status = 'disconnected'
+    integration.credentials = None
+    integration.token_expiry = None
+    integration.save(update_fields=['status', 'credentials', 'token_expiry'])
+    invalidate_cached_token(integration.id)
+
+def mark_event(event, status, error_message=None):
+    event.status = status
+    event.error_message = error_message
+    if status != 'received':
+        event.processed_at = timezone.now()
+    event.save(update_fields=['status', 'integration', 'attempts', 'error_message', 'processed_at'])
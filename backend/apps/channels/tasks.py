@@ -1,182 +1,379 @@
+import asyncio
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from apps.channels.models import ChannelIntegration, ChannelListing, SyncJob
-from apps.inventory.models import InventoryEvent, InventoryLot
-from integrations.ebay.client import EbayClient
+from django.db import connection, transaction
+from django.db.models import F
+from apps.channels.models import ChannelIntegration, ChannelListing, SyncJob, SyncMetric, WebhookEvent
+from apps.channels.services.order_ingest import process_order_batch
+from apps.channels.services.outbound import claim_outbox_batch, clear_outbox_dispatch_schedule
+from apps.channels.services.poll_cursor import PollCursor, poll_lease
+from apps.channels.services.sync_audit import record_sync_job
+from apps.channels.services.sync_metrics import record_sync
+from apps.channels.services.poll_schedule import claim_due_integrations, schedule_next_poll
+from apps.channels.services.webhook_intake import MAX_WEBHOOK_ATTEMPTS, mark_event, process_event, remember_seller_id
+from integrations.ebay.async_client import OrderPollJob, poll_orders_concurrently
+from integrations.ebay.auth import IntegrationInactive, get_valid_access_token, is_refresh_token_rejected, mark_integration_expired, refresh_access_token_once
+from integrations.ebay.client import EbayClient, EbayRateLimited, BULK_UPDATE_MAX_SKUS
+from core.requeue import requeue_after_rate_limit
 from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
 @shared_task
-def poll_ebay_orders():
+def dispatch_due_polls():
     """
-    Periodic task to poll all active eBay integrations for new orders.
-    Scheduled to run every 5 minutes in Celery Beat.
+    Periodic task that starts a poll for every integration whose next_poll_at
+    has passed. Scheduled to run every minute in Celery Beat; each poll sets
+    the integration's next poll time from its order velocity.
+    """
+    integration_ids = claim_due_integrations()
+    if integration_ids:
+        poll_ebay_orders.delay(integration_ids)
+    return len(integration_ids)
+
+@shared_task
+def poll_ebay_orders(integration_ids=None):
+    """
+    Polls active eBay integrations for new orders: the given ones, or all of
+    them. Started by dispatch_due_polls for the integrations that are due.
+    Orders for all integrations are fetched concurrently (see
+    integrations.ebay.async_client), and each integration's orders are handed
+    to processing as soon as its fetch completes.
     """
     active_integrations = ChannelIntegration.objects.filter(
         provider='ebay', 
         status='active'
     )
+    if integration_ids is not None:
+        active_integrations = active_integrations.filter(id__in=integration_ids)
     
+    jobs = []
     for integration in active_integrations:
-        try:
-            client = EbayClient(integration)
-            
-            # Start polling from the last cursor, or 24 hours ago if none exists
-            from_time = integration.last_poll_cursor
-            if not from_time:
-                from_time = (timezone.now() - timedelta(days=1)).isoformat()
-                
-            response = client.get_orders(created_time_from=from_time)
-            
-            if response and 'orders' in response:
-                orders = response['orders']
-                for order in orders:
-                    process_ebay_order.delay(order, integration.id)
-                    
-            integration.last_poll_cursor = timezone.now().isoformat()
-            integration.save(update_fields=['last_poll_cursor'])
+        lease = poll_lease(integration.id)
+        if not lease.acquire():
+            logger.info(f"eBay poll for integration {integration.id} already running, skipping")
+            continue
             
-        except Exception as e:
-            logger.error(f"Failed to poll eBay orders for integration {integration.id}: {e}")
+        cursor = PollCursor(integration, lease)
+        jobs.append(OrderPollJob(integration, None, cursor.window_start(), cursor=cursor))
+        
+    if not jobs:
+        return
+    try:
+        asyncio.run(poll_orders_concurrently(
+            jobs, enqueue_polled_orders, finish_order_poll, resolve_token=resolve_poll_token
+        ))
+    finally:
+        # finish_order_poll releases each lease; this covers jobs it never
+        # got to because the fetch or another job's callback blew up.
+        # Releasing an already released lease does nothing.
+        for job in jobs:
+            job.cursor.release()
+
+def resolve_poll_token(integration):
+    """
+    Returns the access token for an integration's poll, refreshing it if
+    needed. Runs in a thread of its own during the concurrent fetch, so it
+    closes the database connection it may have opened there.
+    """
+    try:
+        return get_valid_access_token(integration)
+    finally:
+        connection.close()
+
+def enqueue_polled_orders(job, orders):
+    """
+    Queues processing for one page of an integration's polled orders, minus
+    the ones this poll already queued or an earlier poll covered.
+    """
+    remember_seller_id(job.integration, orders)
+    orders = job.cursor.observe(orders)
+    if orders:
+        process_ebay_orders.delay(orders, job.integration.id)
+
+def finish_order_poll(job, error):
+    """
+    Advances an integration's cursor once every page of its poll was queued.
+    On failure the cursor is left alone, so the next poll fetches the window
+    again; orders already queued are skipped by their provider_event_id.
+    """
+    integration = job.integration
+    try:
+        schedule_next_poll(integration)
+        if isinstance(error, EbayRateLimited):
+            logger.warning(f"Skipping eBay poll for integration {integration.id} this cycle: {error}")
+            return
+        record_sync(integration.id, 'poll_orders', job.fetch_seconds, error is None)
+        if error is not None:
+            logger.error(f"Failed to poll eBay orders for integration {integration.id}: {error}")
+        else:
+            job.cursor.save()
+    finally:
+        job.cursor.release()
+
+@shared_task(bind=True, max_retries=5, acks_late=True)
+def process_ebay_orders(self, orders, integration_id):
+    """
+    Idempotent processing of a page of eBay orders (see
+    apps.channels.services.order_ingest.process_order_batch).
+    Acknowledged only once it finishes and retried with backoff on failure,
+    so a crashed worker or a failing database doesn't lose the page.
+    """
+    try:
+        summary = process_order_batch(orders, integration_id)
+    except Exception as e:
+        logger.error(f"Failed to process eBay orders for integration {integration_id}: {e}")
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+    logger.info(f"Processed {len(orders)} eBay orders for integration {integration_id}: {summary}")
+    return summary
 
 @shared_task
 def process_ebay_order(order_data, integration_id):
     """
     Idempotent order processing for eBay.
     """
-    order_id = order_data.get('orderId')
-    if not order_id:
-        logger.error(f"Received order without orderId for integration {integration_id}")
+    return process_order_batch([order_data], integration_id)
+
+@shared_task(bind=True, max_retries=5)
+def push_pending_quantities(self, integration_id):
+    """
+    Pushes the current quantity of every pending listing on an integration
+    through eBay's bulk endpoint, BULK_UPDATE_MAX_SKUS listings per call.
+    Per-SKU results are mapped back onto each listing's sync state.
+    """
+    try:
+        integration = ChannelIntegration.objects.get(id=integration_id)
+    except ChannelIntegration.DoesNotExist:
         return
 
-    # Check if this order is already processed at a high level
-    # We will also enforce idempotency at the line item level
-    line_items = order_data.get('lineItems', [])
-    
-    for item in line_items:
-        line_item_id = item.get('lineItemId')
-        # We use lineItemId as the unique provider_event_id
-        provider_event_id = f"ebay_order_{order_id}_{line_item_id}"
-        
-        # Check idempotency
-        if InventoryEvent.objects.filter(provider_event_id=provider_event_id).exists():
-            logger.info(f"Order line item {provider_event_id} already processed. Skipping.")
-            continue
-            
-        sku = item.get('sku')
-        quantity = item.get('quantity', 1)
-        
+    if integration.provider != 'ebay' or integration.status != 'active':
+        return
+
+    listings = list(
+        ChannelListing.objects.filter(integration=integration, sync_state='pending')
+        .select_related('lot')
+        .order_by('id')
+    )
+
+    # Listings without an external SKU can't be addressed by the Inventory API
+    unaddressable = [listing.id for listing in listings if not listing.external_sku]
+    if unaddressable:
+        ChannelListing.objects.filter(id__in=unaddressable).update(sync_state='error')
+    listings = [listing for listing in listings if listing.external_sku]
+
+    client = EbayClient(integration)
+    failed_listing_ids = []
+
+    for start in range(0, len(listings), BULK_UPDATE_MAX_SKUS):
+        batch = listings[start:start + BULK_UPDATE_MAX_SKUS]
+        quantities = {listing.external_sku: listing.lot.quantity_available for listing in batch}
+
+        started = time.monotonic()
         try:
-            with transaction.atomic():
-                # We need to find the matching lot. Since we link lots to listings, 
-                # we can find the lot via ChannelListing or by SKU directly if SKUs match.
-                # Assuming the external SKU matches the lot SKU or we find it via the listing:
-                listing = ChannelListing.objects.filter(
-                    integration_id=integration_id,
-                    external_sku=sku
-                ).select_related('lot').first()
-                
-                if not listing:
-                    # Fallback to direct lot SKU search within the same shop
-                    integration = ChannelIntegration.objects.get(id=integration_id)
-                    lot = InventoryLot.objects.select_for_update().filter(shop=integration.shop, sku=sku).first()
-                else:
-                    lot = InventoryLot.objects.select_for_update().get(id=listing.lot_id)
-                
-                if not lot:
-                    logger.error(f"Could not find lot for SKU {sku} in order {order_id}")
-                    continue
-
-                if lot.quantity_available < quantity:
-                    logger.warning(f"Oversell detected for {sku}: trying to sell {quantity}, have {lot.quantity_available}")
-                    # In a real app we might still process the sale to reflect reality and leave negative quantity,
-                    # but for MVP constraint requires >=0. We will decrement up to 0 or we might fail.
-                    # Since our constraint requires quantity_available >= 0, we can only sell what we have.
-                    actual_decrement = lot.quantity_available
-                else:
-                    actual_decrement = quantity
-                
-                lot.quantity_available -= actual_decrement
-                lot.save(update_fields=['quantity_available', 'updated_at'])
-                
-                InventoryEvent.objects.create(
-                    lot=lot,
-                    event_type='sale',
-                    quantity_delta=-actual_decrement,
-                    resulting_quantity=lot.quantity_available,
-                    provider_event_id=provider_event_id,
-                    order_id=order_id,
-                    metadata={'ebay_line_item': item}
-                )
-                
-                # Queue tasks to update all listings tied to this lot (including the one just sold, 
-                # since eBay might not auto-sync out-of-stock across other identical listings if any)
-                related_listings = ChannelListing.objects.filter(lot=lot)
-                for rel_listing in related_listings:
-                    push_quantity_to_ebay.delay(rel_listing.id)
-                    
+            response = client.bulk_update_quantities(quantities) or {}
+        except EbayRateLimited as e:
+            # Unsent listings stay pending and go out with the re-queued run
+            requeue_after_rate_limit(self, e)
+            return
         except Exception as e:
-            logger.error(f"Error processing line item {line_item_id} for order {order_id}: {e}")
+            record_sync(integration_id, 'bulk_push_quantity', time.monotonic() - started, False, self.request.retries)
+            logger.error(f"Bulk quantity push failed for integration {integration_id}: {e}")
+            record_sync_job(
+                integration=integration,
+                operation='bulk_push_quantity',
+                direction='outbound',
+                status='failed',
+                request_payload={'quantities': quantities},
+                retries=self.request.retries,
+                error_message=str(e),
+                completed_at=timezone.now()
+            )
+            failed_listing_ids.extend(listing.id for listing in batch)
+            continue
 
-@shared_task(bind=True, max_retries=5)
-def push_quantity_to_ebay(self, listing_id):
+        results = {result.get('sku'): result for result in response.get('responses', [])}
+        synced = {}
+        errored = []
+        for listing in batch:
+            result = results.get(listing.external_sku)
+            if result and 200 <= int(result.get('statusCode', 0)) < 300:
+                synced.setdefault(quantities[listing.external_sku], []).append(listing.id)
+            else:
+                errored.append(listing.id)
+        record_sync(integration_id, 'bulk_push_quantity', time.monotonic() - started, not errored, self.request.retries)
+
+        now = timezone.now()
+        for quantity, listing_ids in synced.items():
+            # Only mark synced if the lot still holds the quantity we sent;
+            # listings whose lot changed meanwhile stay pending for the next push
+            ChannelListing.objects.filter(
+                id__in=listing_ids, lot__quantity_available=quantity
+            ).update(sync_state='synced', listed_quantity=quantity, last_synced_at=now)
+        if errored:
+            ChannelListing.objects.filter(id__in=errored).update(sync_state='error')
+
+        record_sync_job(
+            integration=integration,
+            operation='bulk_push_quantity',
+            direction='outbound',
+            status='failed' if errored else 'success',
+            request_payload={'quantities': quantities},
+            response_payload=response,
+            retries=self.request.retries,
+            error_message=f"{len(errored)} of {len(batch)} SKUs rejected" if errored else None,
+            completed_at=now
+        )
+
+    if failed_listing_ids:
+        if self.request.retries >= self.max_retries:
+            ChannelListing.objects.filter(id__in=failed_listing_ids, sync_state='pending').update(sync_state='error')
+            return
+        # Retry with exponential backoff; listings from failed batches are still pending
+        raise self.retry(countdown=2 ** self.request.retries)
+
+@shared_task
+def dispatch_outbox():
     """
-    Pushes the current quantity_available of a lot to the eBay listing.
+    Drains the outbound sync outbox OUTBOX_DISPATCH_BATCH_SIZE rows at a time,
+    queueing one push_pending_quantities per integration in each batch, on
+    the queue of the entries' lane.
+    Rows are only deleted once their pushes are queued. Also scheduled every
+    minute in Celery Beat, for rows whose debounced dispatch was never queued.
     """
-    try:
-        listing = ChannelListing.objects.select_related('integration', 'lot').get(id=listing_id)
+    # Rows written after this point schedule their own dispatch
+    clear_outbox_dispatch_schedule()
+
+    pushes = 0
+    while True:
+        with transaction.atomic():
+            lanes = claim_outbox_batch(settings.OUTBOX_DISPATCH_BATCH_SIZE)
+            if not lanes:
+                break
+            for integration_id, lane in sorted(lanes.items()):
+                push_pending_quantities.apply_async((integration_id,), queue=settings.CHANNEL_LANE_QUEUES[lane])
+            pushes += len(lanes)
+    return pushes
+
+@shared_task
+def refresh_expiring_tokens():
+    """
+    Periodic task that refreshes every active eBay token expiring within
+    EBAY_TOKEN_REFRESH_WINDOW_MINUTES, so push and poll paths almost never pay
+    for a refresh inline. Scheduled to run every 30 minutes in Celery Beat.
+    Refreshes run in parallel, at most EBAY_TOKEN_REFRESH_CONCURRENCY at a time.
+    """
+    valid_until = timezone.now() + timedelta(minutes=settings.EBAY_TOKEN_REFRESH_WINDOW_MINUTES)
+    expiring = list(ChannelIntegration.objects.filter(
+        provider='ebay',
+        status='active',
+        token_expiry__lt=valid_until
+    ))
+    if not expiring:
+        return {"refreshed": 0, "expired": 0, "skipped": 0, "failed": 0}
         
-        if listing.integration.provider != 'ebay':
-            return
+    def refresh(integration):
+        try:
+            refresh_access_token_once(integration, valid_until=valid_until)
+            return 'refreshed'
+        except IntegrationInactive:
+            # Disconnected or expired since the query above; nothing to refresh
+            return 'skipped'
+        except requests.HTTPError as e:
+            if not is_refresh_token_rejected(e):
+                logger.error(f"Token refresh failed for integration {integration.id}: {e}")
+                return 'failed'
+            # eBay rejected the refresh token: the shop has to reconnect
+            mark_integration_expired(integration, f"token refresh rejected: {e}")
+            return 'expired'
+        except Exception as e:
+            # Transient failure (or a bad response body); the token is still
+            # valid for a while, so retry next run
+            logger.error(f"Token refresh failed for integration {integration.id}: {e}")
+            return 'failed'
+        finally:
+            connection.close()
             
-        client = EbayClient(listing.integration)
-        
-        # We need to send the lot's current available quantity
-        new_quantity = listing.lot.quantity_available
-        
-        # For our MVP mock client, it updates via SKU (assuming external_sku matches)
-        response = client.revise_inventory_status(
-            listing_id=listing.external_listing_id, 
-            sku=listing.external_sku, 
-            quantity=new_quantity
-        )
-        
-        # Update listing state
-        listing.listed_quantity = new_quantity
-        listing.sync_state = 'synced'
-        listing.last_synced_at = timezone.now()
-        listing.save()
-        
-        # Log success SyncJob
-        SyncJob.objects.create(
-            integration=listing.integration,
-            operation='push_quantity',
-            direction='outbound',
-            status='success',
-            request_payload={'sku': listing.external_sku, 'quantity': new_quantity},
-            response_payload=response or {},
-            completed_at=timezone.now()
-        )
+    with ThreadPoolExecutor(max_workers=settings.EBAY_TOKEN_REFRESH_CONCURRENCY) as pool:
+        outcomes = list(pool.map(refresh, expiring))
         
+    summary = {outcome: outcomes.count(outcome) for outcome in ('refreshed', 'expired', 'skipped', 'failed')}
+    logger.info(f"Refreshed expiring eBay tokens: {summary}")
+    return summary
+
+# Received webhook events older than this are assumed to have lost their task
+WEBHOOK_REDRIVE_AFTER = timedelta(minutes=2)
+
+@shared_task(bind=True)
+def process_webhook_event(self, event_id):
+    """
+    Processes one notification from the webhook intake queue. Sales go through
+    the same idempotent batch path as polled orders, so a notification that is
+    also polled later is only counted once.
+    The event is claimed (its attempt counted) in a transaction of its own, so
+    no row lock is held while process_event talks to eBay.
+    """
+    with transaction.atomic():
+        event = WebhookEvent.objects.select_for_update().filter(id=event_id, status='received').first()
+        if not event:
+            return
+        event.attempts += 1
+        event.save(update_fields=['attempts'])
+
+    try:
+        process_event(event)
+    except EbayRateLimited as e:
+        # Not an attempt: the event stays as it was
+        WebhookEvent.objects.filter(id=event_id).update(attempts=F('attempts') - 1)
+        requeue_after_rate_limit(self, e)
     except Exception as e:
-        logger.error(f"Failed to push quantity for listing {listing_id}: {e}")
-        # Log failed SyncJob
-        SyncJob.objects.create(
-            integration=listing.integration if 'listing' in locals() else None,
-            operation='push_quantity',
-            direction='outbound',
-            status='failed',
-            error_message=str(e),
-            completed_at=timezone.now()
-        )
-        
-        # Update listing state
-        if 'listing' in locals():
-            listing.sync_state = 'error'
-            listing.save(update_fields=['sync_state'])
-            
-        # Retry with exponential backoff
-        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        logger.error(f"Failed to process webhook event {event_id}: {e}")
+        # Left as received for process_webhook_backlog to retry, up to MAX_WEBHOOK_ATTEMPTS
+        status = 'failed' if event.attempts >= MAX_WEBHOOK_ATTEMPTS else 'received'
+        mark_event(event, status, str(e))
+
+@shared_task
+def process_webhook_backlog():
+    """
+    Periodic task that re-queues webhook events whose processing task was lost
+    or failed. Scheduled to run every minute in Celery Beat.
+    """
+    event_ids = list(WebhookEvent.objects.filter(
+        status='received',
+        received_at__lt=timezone.now() - WEBHOOK_REDRIVE_AFTER
+    ).order_by('received_at').values_list('id', flat=True)[:500])
+    for event_id in event_ids:
+        process_webhook_event.delay(event_id)
+    return len(event_ids)
+
+def _delete_in_chunks(queryset, chunk_size):
+    """
+    Deletes the queryset's rows chunk_size at a time, so no single delete
+    holds locks for long. Returns the number of rows deleted.
+    """
+    queryset = queryset.order_by('id')
+    deleted = 0
+    while True:
+        chunk = list(queryset.values_list('id', flat=True)[:chunk_size])
+        if not chunk:
+            return deleted
+        deleted += queryset.model.objects.filter(id__in=chunk).delete()[0]
+
+@shared_task
+def prune_sync_jobs():
+    """
+    Periodic task that deletes SyncJob records older than
+    SYNC_JOB_RETENTION_DAYS and SyncMetric buckets older than
+    SYNC_METRICS_RETENTION_DAYS. Scheduled daily in Celery Beat.
+    """
+    now = timezone.now()
+    jobs_cutoff = now - timedelta(days=settings.SYNC_JOB_RETENTION_DAYS)
+    jobs = _delete_in_chunks(SyncJob.objects.filter(created_at__lt=jobs_cutoff), settings.SYNC_JOB_PRUNE_CHUNK)
+    metrics_cutoff = now - timedelta(days=settings.SYNC_METRICS_RETENTION_DAYS)
+    metrics = _delete_in_chunks(SyncMetric.objects.filter(bucket_start__lt=metrics_cutoff), settings.SYNC_JOB_PRUNE_CHUNK)
+    logger.info(f"Pruned {jobs} sync job records and {metrics} sync metric buckets")
+    return {"sync_jobs": jobs, "sync_metrics": metrics}
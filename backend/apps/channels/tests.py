@@ -0,0 +1,1300 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+import requests
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.accounts.models import Membership, Shop, User
+from apps.channels import tasks
+from apps.channels.models import ChannelIntegration, ChannelListing, OutboxEntry, SyncJob, SyncMetric, WebhookEvent
+from apps.channels.services import order_ingest, outbound, poll_schedule, sync_audit, sync_metrics
+from apps.channels.services.outbound import claim_outbox_batch, queue_listing_push, queue_lots_push, schedule_outbox_dispatch
+from apps.channels.services.order_ingest import process_order_batch
+from apps.channels.services.poll_cursor import PollCursor, poll_lease
+from apps.channels.services.webhook_intake import MAX_WEBHOOK_ATTEMPTS, find_integration, remember_seller_id
+from apps.inventory.models import Card, InventoryEvent, InventoryLot
+from config.celery import app as celery_app
+from core import redis_client
+from core.testing import FakeRedisMixin
+from integrations.ebay.async_client import AsyncEbayClient, OrderPollJob, poll_orders_concurrently
+from integrations.ebay import auth, http, standin
+from integrations.ebay.auth import IntegrationInactive
+from integrations.ebay.client import EbayAuth, EbayClient, EbayRateLimited, build_order_params, integration_circuit
+
+
+class ChannelTestCase(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Nothing here talks to the broker
+        patcher = mock.patch('apps.channels.services.outbound.schedule_outbox_dispatch')
+        self.schedule_outbox_dispatch = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.shop = Shop.objects.create(name='Shop')
+        self.integration = ChannelIntegration.objects.create(shop=self.shop, status='active')
+        self.card = Card.objects.create(shop=self.shop, name='Card')
+
+    def make_lot(self, sku, quantity=5):
+        return InventoryLot.objects.create(shop=self.shop, card=self.card, sku=sku, quantity_available=quantity, condition='NM')
+
+    def make_listing(self, lot, sku=None, integration=None):
+        return ChannelListing.objects.create(
+            integration=integration or self.integration, lot=lot,
+            external_listing_id=f"listing_{lot.sku}", external_sku=sku or lot.sku, sync_state='synced'
+        )
+
+
+def order(order_id, *lines, created='2026-01-01T10:00:00.000Z'):
+    return {
+        'orderId': order_id,
+        'creationDate': created,
+        'lineItems': [
+            {'lineItemId': str(n), 'sku': sku, 'quantity': quantity}
+            for n, (sku, quantity) in enumerate(lines)
+        ],
+    }
+
+
+class OrderIngestTests(ChannelTestCase):
+    def test_records_sales(self):
+        lot = self.make_lot('A', quantity=5)
+        summary = process_order_batch([order('o1', ('A', 2)), order('o2', ('A', 1))], self.integration.id)
+        self.assertEqual(summary, {'recorded': 2, 'duplicates': 0, 'unmatched': 0})
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 2)
+        self.assertEqual(InventoryEvent.objects.filter(lot=lot, event_type='sale').count(), 2)
+
+    def test_redelivered_orders_are_recorded_once(self):
+        lot = self.make_lot('A', quantity=5)
+        orders = [order('o1', ('A', 2))]
+        with self.captureOnCommitCallbacks(execute=True):
+            process_order_batch(orders, self.integration.id)
+        with mock.patch.object(order_ingest, '_apply_sales') as apply_sales:
+            summary = process_order_batch(orders, self.integration.id)
+        # Caught by the filter and the lookup before any lot is locked
+        apply_sales.assert_not_called()
+        self.assertEqual(summary, {'recorded': 0, 'duplicates': 1, 'unmatched': 0})
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 3)
+
+    def test_repeats_within_a_batch_collapse(self):
+        lot = self.make_lot('A', quantity=5)
+        summary = process_order_batch([order('o1', ('A', 2)), order('o1', ('A', 2))], self.integration.id)
+        self.assertEqual(summary['recorded'], 1)
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 3)
+
+    def test_listing_sku_takes_precedence_over_lot_sku(self):
+        lot = self.make_lot('A', quantity=5)
+        self.make_listing(lot, sku='EBAY-A')
+        summary = process_order_batch([order('o1', ('EBAY-A', 1), ('MISSING', 1))], self.integration.id)
+        self.assertEqual(summary, {'recorded': 1, 'duplicates': 0, 'unmatched': 1})
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 4)
+
+    def test_oversell_stops_at_zero(self):
+        lot = self.make_lot('A', quantity=1)
+        process_order_batch([order('o1', ('A', 3))], self.integration.id)
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 0)
+        self.assertEqual(InventoryEvent.objects.get(lot=lot).quantity_delta, -1)
+
+    def test_malformed_line_items_are_skipped(self):
+        lot = self.make_lot('A', quantity=5)
+        bad = order('o1', ('A', 1))
+        bad['lineItems'] += [
+            {'lineItemId': '1', 'sku': 'A', 'quantity': 'two'},
+            {'sku': 'A', 'quantity': 1},
+            {'lineItemId': 'x' * 300, 'sku': 'A', 'quantity': 1},
+            'not a line item',
+        ]
+        summary = process_order_batch([bad, 'not an order'], self.integration.id)
+        self.assertEqual(summary['recorded'], 1)
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 4)
+
+    def test_sales_queue_a_push_on_the_sales_lane(self):
+        lot = self.make_lot('A', quantity=5)
+        listing = self.make_listing(lot)
+        process_order_batch([order('o1', ('A', 1))], self.integration.id)
+        self.assertEqual(OutboxEntry.objects.get(listing=listing).lane, 'sales')
+
+    def test_retries_with_a_full_check_when_a_concurrent_insert_wins(self):
+        lot = self.make_lot('A', quantity=5)
+        orders = [order('o1', ('A', 2))]
+        process_order_batch(orders, self.integration.id)
+        # The filter has aged the event out, so the first attempt skips the
+        # duplicate check and runs into the unique constraint
+        with mock.patch.object(order_ingest.RecentBloomFilter, 'might_contain', return_value=set()), \
+                mock.patch.object(order_ingest, '_apply_sales', wraps=order_ingest._apply_sales) as apply_sales:
+            summary = process_order_batch(orders, self.integration.id)
+        self.assertEqual(apply_sales.call_count, 2)
+        self.assertIsNone(apply_sales.call_args_list[1].args[2])
+        self.assertEqual(summary, {'recorded': 0, 'duplicates': 1, 'unmatched': 0})
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 3)
+        self.assertEqual(InventoryEvent.objects.filter(lot=lot).count(), 1)
+
+
+class ProcessEbayOrdersTests(ChannelTestCase):
+    def test_processes_the_page(self):
+        self.make_lot('A')
+        result = tasks.process_ebay_orders.apply(args=([order('o1', ('A', 1))], self.integration.id))
+        self.assertEqual(result.get()['recorded'], 1)
+
+    def test_failed_batch_is_retried(self):
+        lot = self.make_lot('A')
+        failures = [RuntimeError("database went away")]
+
+        def flaky(orders, integration_id):
+            if failures:
+                raise failures.pop()
+            return process_order_batch(orders, integration_id)
+
+        with mock.patch.object(tasks, 'process_order_batch', side_effect=flaky):
+            tasks.process_ebay_orders.apply(args=([order('o1', ('A', 1))], self.integration.id))
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 4)
+
+    def test_batch_that_keeps_failing_gives_up(self):
+        with mock.patch.object(tasks, 'process_order_batch', side_effect=RuntimeError("database went away")) as batch:
+            result = tasks.process_ebay_orders.apply(args=([order('o1', ('A', 1))], self.integration.id))
+        self.assertEqual(result.state, 'FAILURE')
+        self.assertEqual(batch.call_count, tasks.process_ebay_orders.max_retries + 1)
+
+
+def at(hour, minute=0):
+    return datetime(2026, 1, 1, hour, minute, tzinfo=dt_timezone.utc)
+
+
+@override_settings(EBAY_POLL_CURSOR_OVERLAP_SECONDS=600)
+class PollCursorTests(ChannelTestCase):
+    def test_window_starts_an_overlap_before_the_cursor(self):
+        self.integration.last_poll_cursor = '2026-01-01T10:00:00.000Z'
+        self.assertEqual(PollCursor(self.integration).window_start(), '2026-01-01T09:50:00.000Z')
+
+    def test_first_poll_looks_back_a_day(self):
+        with mock.patch('django.utils.timezone.now', return_value=at(10)):
+            self.assertEqual(PollCursor(self.integration).window_start(), '2025-12-31T10:00:00.000Z')
+
+    def test_observe_drops_repeats_and_orders_before_the_window(self):
+        self.integration.last_poll_cursor = '2026-01-01T10:00:00.000Z'
+        cursor = PollCursor(self.integration)
+        page = [
+            order('o0', created='2026-01-01T09:40:00.000Z'),
+            order('o1', created='2026-01-01T09:55:00.000Z'),
+            order('o2', created='2026-01-01T10:05:00.000Z'),
+        ]
+        with self.assertNumQueries(0):
+            self.assertEqual([o['orderId'] for o in cursor.observe(page)], ['o1', 'o2'])
+            self.assertEqual(cursor.observe([order('o2', created='2026-01-01T10:05:00.000Z')]), [])
+        self.assertEqual(cursor.high_water_mark, at(10, 5))
+
+    def test_overlap_repeats_are_skipped_by_the_batch(self):
+        lot = self.make_lot('A', quantity=5)
+        sale = order('o1', ('A', 1), created='2026-01-01T10:05:00.000Z')
+        for _ in range(2):
+            self.integration.refresh_from_db()
+            cursor = PollCursor(self.integration)
+            summary = process_order_batch(cursor.observe([sale]), self.integration.id)
+            cursor.save()
+        self.assertEqual(summary['duplicates'], 1)
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 4)
+
+    def test_mark_follows_received_orders_not_the_clock(self):
+        cursor = PollCursor(self.integration)
+        cursor.observe([order('o1', created='2026-01-01T10:05:00.000Z'), order('o2', created='2026-01-01T09:00:00.000Z')])
+        cursor.save()
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.last_poll_cursor, '2026-01-01T10:05:00.000Z')
+
+    def test_save_leaves_other_fields_alone(self):
+        cursor = PollCursor(self.integration)
+        cursor.observe([order('o1', created='2026-01-01T10:05:00.000Z')])
+        ChannelIntegration.objects.filter(id=self.integration.id).update(external_account_id='seller', metadata={'other': 1})
+        cursor.save()
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.external_account_id, 'seller')
+        self.assertEqual(self.integration.metadata, {'other': 1})
+
+    def test_poll_that_lost_its_lease_keeps_the_cursor(self):
+        lease = poll_lease(self.integration.id)
+        lease.acquire()
+        cursor = PollCursor(self.integration, lease)
+        cursor.observe([order('o1', created='2026-01-01T10:05:00.000Z')])
+        # The lease expired and another poll took it over
+        lease.release()
+        poll_lease(self.integration.id).acquire()
+        with self.assertLogs('apps.channels.services.poll_cursor', 'WARNING'):
+            cursor.save()
+        self.integration.refresh_from_db()
+        self.assertIsNone(self.integration.last_poll_cursor)
+
+    def test_empty_poll_keeps_the_cursor(self):
+        self.integration.last_poll_cursor = '2026-01-01T10:00:00.000Z'
+        self.integration.save()
+        PollCursor(self.integration).save()
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.last_poll_cursor, '2026-01-01T10:00:00.000Z')
+
+
+def fake_poll(pages=(), error=None, complete=True):
+    """
+    Stands in for poll_orders_concurrently: runs the callbacks for every job
+    right away and hands asyncio.run a coroutine with nothing left to do.
+    """
+    def poll(jobs, on_page, on_complete, resolve_token=None):
+        for job in jobs:
+            for orders in pages:
+                on_page(job, orders)
+            if complete:
+                on_complete(job, error)
+        return asyncio.sleep(0)
+    return poll
+
+
+class PollEbayOrdersTests(ChannelTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(tasks.process_ebay_orders, 'delay')
+        self.process_ebay_orders = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def poll(self, poll):
+        # A plain Mock: patching the coroutine function would make an AsyncMock
+        with mock.patch.object(tasks, 'poll_orders_concurrently', new=mock.Mock(side_effect=poll)) as concurrent:
+            tasks.poll_ebay_orders([self.integration.id])
+        return concurrent
+
+    def assert_lease_free(self, integration_id):
+        lease = poll_lease(integration_id)
+        self.assertTrue(lease.acquire())
+        lease.release()
+
+    def test_queues_pages_and_advances_the_cursor(self):
+        self.poll(fake_poll([[order('o1', ('A', 1), created='2026-01-01T10:05:00.000Z')]]))
+        self.process_ebay_orders.assert_called_once()
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.last_poll_cursor, '2026-01-01T10:05:00.000Z')
+        self.assertIsNotNone(self.integration.next_poll_at)
+        self.assert_lease_free(self.integration.id)
+
+    def test_integration_already_being_polled_is_skipped(self):
+        lease = poll_lease(self.integration.id)
+        lease.acquire()
+        concurrent = self.poll(fake_poll())
+        concurrent.assert_not_called()
+        self.assertFalse(poll_lease(self.integration.id).acquire())
+
+    def test_failed_fetch_releases_every_lease(self):
+        other = ChannelIntegration.objects.create(shop=self.shop, status='active')
+        with self.assertRaises(RuntimeError), \
+                mock.patch.object(tasks, 'poll_orders_concurrently', new=mock.Mock(side_effect=RuntimeError("event loop died"))):
+            tasks.poll_ebay_orders()
+        self.assert_lease_free(self.integration.id)
+        self.assert_lease_free(other.id)
+
+    def test_failing_callback_releases_the_lease(self):
+        with self.assertRaises(RuntimeError), \
+                mock.patch.object(tasks, 'schedule_next_poll', side_effect=RuntimeError("database went away")):
+            self.poll(fake_poll())
+        self.assert_lease_free(self.integration.id)
+        self.integration.refresh_from_db()
+        self.assertIsNone(self.integration.last_poll_cursor)
+
+
+class OutboxTests(ChannelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lots = [self.make_lot(f"L{n}") for n in range(3)]
+        self.listings = [self.make_listing(lot) for lot in self.lots]
+
+    def test_push_marks_listings_pending_and_writes_one_row_each(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_lots_push([lot.id for lot in self.lots])
+            queue_lots_push([self.lots[0].id])
+        self.assertEqual(OutboxEntry.objects.count(), 3)
+        self.assertEqual(ChannelListing.objects.filter(sync_state='pending').count(), 3)
+        self.assertTrue(self.schedule_outbox_dispatch.called)
+
+    def test_rolled_back_push_leaves_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            queue_lots_push([lot.id for lot in self.lots])
+            raise RuntimeError
+        self.assertFalse(OutboxEntry.objects.exists())
+        self.assertFalse(ChannelListing.objects.filter(sync_state='pending').exists())
+
+    def test_delisted_listings_are_skipped(self):
+        ChannelListing.objects.filter(id=self.listings[0].id).update(sync_state='delisted')
+        queue_listing_push(self.listings[0].id)
+        self.assertFalse(OutboxEntry.objects.exists())
+
+    def test_sale_moves_a_queued_row_to_the_sales_lane(self):
+        queue_lots_push([self.lots[0].id])
+        queue_lots_push([self.lots[0].id], lane='sales')
+        self.assertEqual(OutboxEntry.objects.get().lane, 'sales')
+        # ...and nothing moves it back
+        queue_lots_push([self.lots[0].id])
+        self.assertEqual(OutboxEntry.objects.get().lane, 'sales')
+
+    def test_claim_picks_the_sales_lane_per_integration(self):
+        other = ChannelIntegration.objects.create(shop=self.shop, status='active')
+        other_listing = self.make_listing(self.make_lot('L9'), integration=other)
+        queue_lots_push([self.lots[0].id, self.lots[1].id])
+        queue_lots_push([self.lots[2].id], lane='sales')
+        queue_listing_push(other_listing.id)
+        self.assertEqual(claim_outbox_batch(10), {self.integration.id: 'sales', other.id: 'interactive'})
+        self.assertFalse(OutboxEntry.objects.exists())
+
+    def test_claim_takes_at_most_a_batch(self):
+        queue_lots_push([lot.id for lot in self.lots])
+        claim_outbox_batch(2)
+        self.assertEqual(OutboxEntry.objects.count(), 1)
+
+    @override_settings(OUTBOX_DISPATCH_BATCH_SIZE=2)
+    def test_dispatch_queues_pushes_on_the_lane_queue(self):
+        other = ChannelIntegration.objects.create(shop=self.shop, status='active')
+        queue_listing_push(self.make_listing(self.make_lot('L9'), integration=other).id)
+        queue_lots_push([lot.id for lot in self.lots], lane='sales')
+        with mock.patch.object(tasks.push_pending_quantities, 'apply_async') as apply_async:
+            # Two batches: the other integration plus one sales row, then the rest
+            self.assertEqual(tasks.dispatch_outbox(), 3)
+        queued = [(call.args[0], call.kwargs['queue']) for call in apply_async.call_args_list]
+        self.assertEqual(sorted(queued), sorted([
+            ((other.id,), 'channel_interactive'),
+            ((self.integration.id,), 'channel_sales'),
+            ((self.integration.id,), 'channel_sales'),
+        ]))
+        self.assertFalse(OutboxEntry.objects.exists())
+
+    @override_settings(CHANNEL_PUSH_DEBOUNCE_SECONDS=5)
+    def test_dispatch_is_scheduled_once_per_window(self):
+        with mock.patch.object(tasks.dispatch_outbox, 'apply_async') as apply_async:
+            schedule_outbox_dispatch()
+            schedule_outbox_dispatch()
+            self.assertEqual(apply_async.call_count, 1)
+            self.assertEqual(apply_async.call_args.kwargs['countdown'], 5)
+            # A dispatch that started clears the marker
+            outbound.clear_outbox_dispatch_schedule()
+            schedule_outbox_dispatch()
+            self.assertEqual(apply_async.call_count, 2)
+
+    def test_unreachable_broker_leaves_rows_for_the_periodic_dispatch(self):
+        with mock.patch.object(tasks.dispatch_outbox, 'apply_async', side_effect=ConnectionError) as apply_async:
+            with self.assertLogs('apps.channels.services.outbound', 'WARNING'):
+                schedule_outbox_dispatch()
+                schedule_outbox_dispatch()
+        self.assertEqual(apply_async.call_count, 2)
+
+
+def bulk_responses(status_codes=None):
+    """
+    Stands in for EbayClient._request on the bulk quantity endpoint: every SKU
+    gets its statusCode from `status_codes` (default 200), SKUs mapped to None
+    are left out of the response. Records each call's SKU -> quantity.
+    """
+    status_codes = status_codes or {}
+    calls = []
+
+    def request(method, endpoint, json=None):
+        calls.append({item['sku']: item['shipToLocationAvailability']['quantity'] for item in json['requests']})
+        responses = []
+        for item in json['requests']:
+            status_code = status_codes.get(item['sku'], 200)
+            if status_code is not None:
+                errors = [] if status_code == 200 else [{'errorId': 25001}]
+                responses.append({'sku': item['sku'], 'statusCode': status_code, 'errors': errors})
+        return {'responses': responses}
+    return request, calls
+
+
+class PushPendingQuantitiesTests(ChannelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.listings = [self.make_listing(self.make_lot(f"S{n:02}", quantity=n)) for n in range(30)]
+        ChannelListing.objects.update(sync_state='pending')
+
+    def push(self, request):
+        with mock.patch.object(EbayClient, '_request', side_effect=request):
+            tasks.push_pending_quantities.apply(args=(self.integration.id,)).get()
+
+    def states(self):
+        return dict(ChannelListing.objects.values_list('external_sku', 'sync_state'))
+
+    def test_pushes_in_batches_of_25(self):
+        request, calls = bulk_responses()
+        self.push(request)
+        self.assertEqual([len(call) for call in calls], [25, 5])
+        self.assertEqual(calls[0]['S07'], 7)
+        self.assertEqual(set(self.states().values()), {'synced'})
+        self.assertEqual(ChannelListing.objects.get(external_sku='S07').listed_quantity, 7)
+
+    def test_maps_per_sku_results_back_to_listings(self):
+        request, _ = bulk_responses({'S01': 400, 'S02': None, 'S27': '500'})
+        self.push(request)
+        states = self.states()
+        self.assertEqual({sku for sku, state in states.items() if state == 'error'}, {'S01', 'S02', 'S27'})
+        self.assertEqual(states['S00'], 'synced')
+        self.assertEqual(states['S26'], 'synced')
+
+    def test_listing_whose_lot_changed_during_the_push_stays_pending(self):
+        request, _ = bulk_responses()
+
+        def sell_during_push(*args, **kwargs):
+            InventoryLot.objects.filter(sku='S03').update(quantity_available=2)
+            return request(*args, **kwargs)
+        self.push(sell_during_push)
+        self.assertEqual(self.states()['S03'], 'pending')
+        self.assertEqual(self.states()['S04'], 'synced')
+
+    def test_rate_limited_push_leaves_unsent_listings_pending(self):
+        request, calls = bulk_responses()
+
+        def rate_limit_second_batch(*args, **kwargs):
+            if calls:
+                raise EbayRateLimited(5)
+            return request(*args, **kwargs)
+        with mock.patch.object(tasks, 'requeue_after_rate_limit') as requeue:
+            self.push(rate_limit_second_batch)
+        requeue.assert_called_once()
+        states = self.states()
+        self.assertEqual(states['S24'], 'synced')
+        self.assertEqual(states['S25'], 'pending')
+
+    def test_refuses_more_than_25_skus(self):
+        with self.assertRaises(ValueError):
+            EbayClient(self.integration).bulk_update_quantities({f"S{n}": 1 for n in range(26)})
+
+
+def http_error(status_code, error=None):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = {'error': error} if error else {}
+    return requests.HTTPError(f"{status_code} error", response=response)
+
+
+class SellerIdentityTests(ChannelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.integration.credentials = json.dumps({'access_token': 'access', 'refresh_token': 'refresh'})
+        self.integration.token_expiry = timezone.now() + timedelta(hours=2)
+        self.integration.save()
+
+    def connect(self, get_user):
+        token_data = {'access_token': 'new', 'refresh_token': 'refresh', 'expires_in': 7200}
+        with mock.patch('apps.channels.views.exchange_code_for_token', return_value=token_data), \
+                mock.patch.object(EbayClient, 'get_user', side_effect=get_user) as fetch:
+            response = self.client.get(reverse('ebay_oauth_callback'), {'code': 'code', 'state': self.integration.id})
+        self.integration.refresh_from_db()
+        return response, fetch
+
+    def test_connecting_records_the_username(self):
+        response, _ = self.connect(lambda: {'userId': 'u1', 'username': 'seller'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('status=success', response.url)
+        self.assertEqual(self.integration.external_account_id, 'seller')
+        self.assertEqual(find_integration('seller'), self.integration)
+
+    def test_failed_lookup_still_connects(self):
+        with self.assertLogs('apps.channels.views', 'WARNING'):
+            response, _ = self.connect(mock.Mock(side_effect=http_error(500)))
+        self.assertIn('status=success', response.url)
+        self.assertEqual(self.integration.status, 'active')
+        self.assertIsNone(self.integration.external_account_id)
+
+    def test_polled_orders_update_the_username(self):
+        remember_seller_id(self.integration, [{'orderId': 'o1'}, {'orderId': 'o2', 'sellerId': 'renamed'}])
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.external_account_id, 'renamed')
+
+    def test_backfill_uses_the_identity_api(self):
+        with mock.patch.object(EbayClient, 'get_user', return_value={'username': 'seller'}):
+            call_command('backfill_ebay_seller_ids', stdout=StringIO())
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.external_account_id, 'seller')
+
+    def test_backfill_falls_back_to_orders_without_the_identity_scope(self):
+        known = ChannelIntegration.objects.create(shop=self.shop, status='active', external_account_id='known')
+        with mock.patch.object(EbayClient, 'get_user', side_effect=http_error(403)), \
+                mock.patch.object(EbayClient, 'get_orders', return_value={'orders': [{'orderId': 'o1', 'sellerId': 'seller'}]}) as get_orders:
+            call_command('backfill_ebay_seller_ids', stdout=StringIO())
+        get_orders.assert_called_once()
+        self.integration.refresh_from_db()
+        known.refresh_from_db()
+        self.assertEqual(self.integration.external_account_id, 'seller')
+        self.assertEqual(known.external_account_id, 'known')
+
+    def test_backfill_reports_integrations_it_cannot_identify(self):
+        out = StringIO()
+        with mock.patch.object(EbayClient, 'get_user', side_effect=http_error(403)), \
+                mock.patch.object(EbayClient, 'get_orders', return_value={'orders': []}):
+            call_command('backfill_ebay_seller_ids', stdout=out)
+        self.assertIn(f"integrations {self.integration.id}", out.getvalue())
+
+
+def notification(notification_id, topic='ORDER_CONFIRMATION', **data):
+    return {
+        'metadata': {'topic': topic},
+        'notification': {'notificationId': notification_id, 'data': data},
+    }
+
+
+@mock.patch.dict(os.environ, {'EBAY_WEBHOOK_TOKEN': 'secret'})
+class WebhookTests(ChannelTestCase):
+    def deliver(self, payload, signature=None):
+        body = json.dumps(payload).encode()
+        if signature is None:
+            signature = base64.b64encode(hmac.new(b'secret', body, hashlib.sha256).digest()).decode()
+        return self.client.post(
+            reverse('ebay_notification_webhook'), body, content_type='application/json',
+            headers={'X-EBAY-SIGNATURE': signature}
+        )
+
+    def test_notification_is_stored_and_queued(self):
+        with mock.patch.object(tasks.process_webhook_event, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.deliver(notification('n1', order={'orderId': 'o1'}))
+        self.assertEqual(response.status_code, 200)
+        event = WebhookEvent.objects.get(notification_id='n1')
+        self.assertEqual((event.topic, event.status), ('ORDER_CONFIRMATION', 'received'))
+        delay.assert_called_once_with(event.id)
+
+    def test_unreachable_broker_still_acknowledges(self):
+        with mock.patch.object(tasks.process_webhook_event, 'delay', side_effect=ConnectionError), \
+                self.assertLogs('apps.channels.services.webhook_intake', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.deliver(notification('n1', order={'orderId': 'o1'}))
+        self.assertEqual(response.status_code, 200)
+        # Left for process_webhook_backlog
+        self.assertEqual(WebhookEvent.objects.get(notification_id='n1').status, 'received')
+
+    def test_bad_signature_is_rejected(self):
+        response = self.deliver(notification('n1'), signature='forged')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_missing_signature_is_rejected(self):
+        response = self.client.post(reverse('ebay_notification_webhook'), notification('n1'), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_unconfigured_token_rejects_everything(self):
+        with mock.patch.dict(os.environ, {'EBAY_WEBHOOK_TOKEN': ''}):
+            response = self.deliver(notification('n1'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_redelivered_notification_is_stored_and_queued_once(self):
+        with mock.patch.object(tasks.process_webhook_event, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.deliver(notification('n1')).status_code, 200)
+            self.assertEqual(self.deliver(notification('n1')).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        delay.assert_called_once()
+
+
+class WebhookProcessingTests(ChannelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.integration.external_account_id = 'seller'
+        self.integration.save()
+
+    def receive(self, payload):
+        event = WebhookEvent.objects.create(
+            notification_id=payload['notification']['notificationId'],
+            topic=payload['metadata']['topic'], payload=payload
+        )
+        tasks.process_webhook_event(event.id)
+        event.refresh_from_db()
+        return event
+
+    def test_sale_goes_through_the_order_batch(self):
+        lot = self.make_lot('A', quantity=5)
+        sale = dict(order('o1', ('A', 2)), sellerId='seller')
+        with mock.patch('apps.channels.services.webhook_intake.process_order_batch', wraps=process_order_batch) as batch:
+            event = self.receive(notification('n1', order=sale))
+        batch.assert_called_once_with([sale], self.integration.id)
+        self.assertEqual((event.status, event.integration, event.attempts), ('processed', self.integration, 1))
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 3)
+
+    def test_sale_already_polled_is_not_counted_again(self):
+        lot = self.make_lot('A', quantity=5)
+        sale = dict(order('o1', ('A', 2)), sellerId='seller')
+        process_order_batch([sale], self.integration.id)
+        event = self.receive(notification('n1', order=sale))
+        self.assertEqual(event.status, 'processed')
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 3)
+
+    def test_thin_notification_fetches_the_order(self):
+        lot = self.make_lot('A', quantity=5)
+        with mock.patch.object(EbayClient, 'get_order', return_value=order('o1', ('A', 1))) as get_order:
+            event = self.receive(notification('n1', order={'orderId': 'o1', 'sellerId': 'seller'}))
+        get_order.assert_called_once_with('o1')
+        self.assertEqual(event.status, 'processed')
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 4)
+
+    def test_unroutable_seller_is_ignored(self):
+        lot = self.make_lot('A', quantity=5)
+        with self.assertLogs('apps.channels.services.webhook_intake', 'WARNING'):
+            event = self.receive(notification('n1', order=dict(order('o1', ('A', 2)), sellerId='stranger')))
+        self.assertEqual(event.status, 'ignored')
+        self.assertIsNone(event.integration)
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity_available, 5)
+
+    def test_sale_for_an_inactive_integration_is_ignored(self):
+        self.integration.status = 'expired'
+        self.integration.save()
+        event = self.receive(notification('n1', order=dict(order('o1', ('A', 2)), sellerId='seller')))
+        self.assertEqual((event.status, event.integration), ('ignored', self.integration))
+
+    def test_account_deletion_disconnects(self):
+        self.integration.credentials = json.dumps({'access_token': 'access'})
+        self.integration.save()
+        event = self.receive(notification('n1', topic='MARKETPLACE_ACCOUNT_DELETION', username='seller'))
+        self.assertEqual(event.status, 'processed')
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.status, 'disconnected')
+        self.assertIsNone(self.integration.credentials)
+
+    def test_failure_is_left_for_the_backlog_until_attempts_run_out(self):
+        payload = notification('n1', order=dict(order('o1', ('A', 2)), sellerId='seller'))
+        with mock.patch('apps.channels.services.webhook_intake.process_order_batch', side_effect=RuntimeError('boom')), \
+                self.assertLogs('apps.channels.tasks', 'ERROR'):
+            event = self.receive(payload)
+            self.assertEqual((event.status, event.attempts, event.error_message), ('received', 1, 'boom'))
+            WebhookEvent.objects.filter(id=event.id).update(attempts=MAX_WEBHOOK_ATTEMPTS - 1)
+            tasks.process_webhook_event(event.id)
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'failed')
+
+    def test_rate_limited_event_is_requeued_without_using_an_attempt(self):
+        with mock.patch.object(EbayClient, 'get_order', side_effect=EbayRateLimited(5)), \
+                mock.patch.object(tasks, 'requeue_after_rate_limit') as requeue:
+            event = self.receive(notification('n1', order={'orderId': 'o1', 'sellerId': 'seller'}))
+        requeue.assert_called_once()
+        self.assertEqual((event.status, event.attempts), ('received', 0))
+
+    def test_backlog_requeues_stale_received_events(self):
+        stale = WebhookEvent.objects.create(notification_id='n1', topic='ORDER_CONFIRMATION')
+        WebhookEvent.objects.filter(id=stale.id).update(received_at=timezone.now() - timedelta(minutes=5))
+        WebhookEvent.objects.create(notification_id='n2', topic='ORDER_CONFIRMATION')
+        with mock.patch.object(tasks.process_webhook_event, 'delay') as delay:
+            self.assertEqual(tasks.process_webhook_backlog(), 1)
+        delay.assert_called_once_with(stale.id)
+
+
+class SyncMetricsTests(ChannelTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(sync_metrics, '_registry', sync_metrics.SyncMetricsRegistry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch.object(sync_metrics.time, 'time', return_value=1_800_000_030)
+    def test_calls_are_folded_into_one_row_per_bucket(self, _):
+        sync_metrics.record_sync(self.integration.id, 'poll_orders', 0.2, True)
+        sync_metrics.record_sync(self.integration.id, 'poll_orders', 3, False, retries=2)
+        sync_metrics.flush_sync_metrics()
+        sync_metrics.record_sync(self.integration.id, 'poll_orders', 0.01, True)
+        sync_metrics.flush_sync_metrics()
+        row = SyncMetric.objects.get()
+        self.assertEqual((row.success_count, row.failure_count, row.retry_count), (2, 1, 2))
+        self.assertEqual(row.latency_buckets, [1, 0, 1, 0, 0, 0, 1, 0, 0])
+
+    def test_track_sync_records_failures_but_not_ignored_errors(self):
+        with self.assertRaises(ValueError), sync_metrics.track_sync(self.integration.id, 'push'):
+            raise ValueError
+        with self.assertRaises(EbayRateLimited), sync_metrics.track_sync(self.integration.id, 'push', ignore=EbayRateLimited):
+            raise EbayRateLimited(5)
+        with sync_metrics.track_sync(self.integration.id, 'push'):
+            pass
+        sync_metrics.flush_sync_metrics()
+        row = SyncMetric.objects.get()
+        self.assertEqual((row.success_count, row.failure_count), (1, 1))
+
+    def test_latency_quantiles(self):
+        self.assertIsNone(sync_metrics.latency_quantile([0] * 9, 0.5))
+        self.assertEqual(sync_metrics.latency_quantile([5, 0, 4, 0, 0, 0, 0, 0, 1], 0.5), 0.05)
+        self.assertEqual(sync_metrics.latency_quantile([5, 0, 4, 0, 0, 0, 0, 0, 1], 0.9), 0.25)
+        self.assertIsNone(sync_metrics.latency_quantile([5, 0, 4, 0, 0, 0, 0, 0, 1], 0.95))
+
+    def test_summary_endpoint(self):
+        user = User.objects.create_user(username='user', password='password')
+        Membership.objects.create(user=user, shop=self.shop)
+        SyncMetric.objects.create(
+            integration=self.integration, operation='bulk_push_quantity', bucket_start=timezone.now(),
+            success_count=3, failure_count=1, latency_sum=2.0, latency_buckets=[0, 0, 4, 0, 0, 0, 0, 0, 0]
+        )
+        response = self.client.get(
+            reverse('integration-metrics', args=[self.integration.id]), {'hours': 2},
+            headers={'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+        )
+        self.assertEqual(response.status_code, 200)
+        operation, = response.json()['operations']
+        self.assertEqual(operation['error_rate'], 0.25)
+        self.assertEqual(operation['avg_latency'], 0.5)
+        self.assertEqual(operation['p95_latency'], 0.25)
+
+
+class SyncMetricsExportTests(ChannelTestCase):
+    def scrape(self, authorization=None):
+        headers = {'Authorization': authorization} if authorization else {}
+        return self.client.get(reverse('sync_metrics_export'), headers=headers)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_hidden_without_a_token(self):
+        self.assertEqual(self.scrape('Bearer anything').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_requires_the_token(self):
+        self.assertEqual(self.scrape().status_code, 401)
+        self.assertEqual(self.scrape('Bearer wrong').status_code, 401)
+        self.assertEqual(self.scrape('Bearer sécret').status_code, 401)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_exports_metrics(self):
+        SyncMetric.objects.create(
+            integration=self.integration, operation='poll_orders', bucket_start=timezone.now(),
+            success_count=3, latency_sum=0.6, latency_buckets=[0, 0, 3, 0, 0, 0, 0, 0, 0]
+        )
+        response = self.scrape('Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'sync_calls{{integration="{self.integration.id}",operation="poll_orders"', response.content.decode())
+
+
+class EbayClientTests(ChannelTestCase):
+    def half_open(self, client):
+        # Opens the integration's breaker and lets its reset timeout pass
+        breaker = client.circuit
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        redis = redis_client.get_redis()
+        redis.hset(breaker.key, 'opened_at', float(redis.hget(breaker.key, 'opened_at')) - breaker.reset_timeout - 1)
+
+    def test_rate_limited_call_gives_back_the_probe(self):
+        client = EbayClient(self.integration)
+        self.half_open(client)
+        with mock.patch('integrations.ebay.client.consume_all', return_value=(False, 3)), \
+                mock.patch.object(EbayClient, '_get_access_token') as get_token:
+            with self.assertRaises(EbayRateLimited):
+                client.get_orders()
+        get_token.assert_not_called()
+        self.assertTrue(integration_circuit(self.integration.id).allow()[0])
+
+    @override_settings(EBAY_POLL_MAX_RATE_WAIT=0)
+    def test_rate_limited_async_call_gives_back_the_probe(self):
+        client = AsyncEbayClient(self.integration, 'token', http=None)
+        self.half_open(client)
+        with mock.patch('integrations.ebay.client.consume_all', return_value=(False, 3)):
+            with self.assertRaises(EbayRateLimited):
+                asyncio.run(client.get_orders())
+        self.assertTrue(integration_circuit(self.integration.id).allow()[0])
+
+    @override_settings(EBAY_RATE_LIMITS={
+        'app': {'capacity': 1, 'refill_rate': 0.1},
+        'integration': {'capacity': 5, 'refill_rate': 1},
+    })
+    def test_integrations_share_the_app_budget(self):
+        other = ChannelIntegration.objects.create(shop=self.shop, status='active')
+        session = mock.Mock()
+        session.request.return_value = mock.Mock(status_code=200, content=b'{}', json=dict)
+        with mock.patch('integrations.ebay.client.get_session', return_value=session), \
+                mock.patch.object(EbayClient, '_get_access_token', return_value='token'):
+            EbayClient(self.integration).get_order('o1')
+            with self.assertRaises(EbayRateLimited) as refused:
+                EbayClient(other).get_order('o2')
+        self.assertGreater(refused.exception.retry_after, 5)
+        self.assertEqual(session.request.call_count, 1)
+
+    def test_ebay_429_raises_instead_of_sleeping(self):
+        session = mock.Mock()
+        session.request.return_value = mock.Mock(status_code=429, headers={'Retry-After': '12'})
+        with mock.patch('integrations.ebay.client.get_session', return_value=session), \
+                mock.patch.object(EbayClient, '_get_access_token', return_value='token'), \
+                mock.patch('time.sleep') as sleep:
+            with self.assertRaises(EbayRateLimited) as refused:
+                EbayClient(self.integration).get_order('o1')
+        self.assertEqual(refused.exception.retry_after, 12)
+        sleep.assert_not_called()
+
+    def test_rejected_refresh_token_expires_the_integration(self):
+        client = EbayClient(self.integration)
+        with mock.patch.object(EbayAuth, 'get_access_token', side_effect=http_error(400, 'invalid_grant')):
+            with self.assertRaises(requests.HTTPError), self.assertLogs('integrations.ebay.auth', 'WARNING'):
+                client.get_orders()
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.status, 'expired')
+
+    def test_refused_app_credentials_leave_the_integration_active(self):
+        client = EbayClient(self.integration)
+        for error in (http_error(401, 'invalid_client'), http_error(400, 'invalid_scope'), http_error(503)):
+            with mock.patch.object(EbayAuth, 'get_access_token', side_effect=error):
+                with self.assertRaises(requests.HTTPError):
+                    client.get_orders()
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.status, 'active')
+
+
+class RefreshExpiringTokensTests(ChannelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.integration.token_expiry = timezone.now() + timedelta(minutes=10)
+        self.integration.save()
+
+    def refresh(self, error=None):
+        with mock.patch.object(tasks, 'refresh_access_token_once', side_effect=error) as refresh_once, \
+                mock.patch.object(tasks, 'mark_integration_expired') as mark_expired:
+            summary = tasks.refresh_expiring_tokens()
+        return summary, refresh_once, mark_expired
+
+    def test_refreshes_tokens_expiring_within_the_window(self):
+        ChannelIntegration.objects.create(shop=self.shop, status='active', token_expiry=timezone.now() + timedelta(hours=2))
+        summary, refresh_once, _ = self.refresh()
+        self.assertEqual(summary, {'refreshed': 1, 'expired': 0, 'skipped': 0, 'failed': 0})
+        self.assertEqual(refresh_once.call_args.args[0].id, self.integration.id)
+
+    def test_rejected_refresh_token_expires_the_integration(self):
+        summary, _, mark_expired = self.refresh(http_error(400, 'invalid_grant'))
+        self.assertEqual(summary['expired'], 1)
+        mark_expired.assert_called_once()
+
+    def test_other_failures_are_retried_next_run(self):
+        for error in (http_error(401, 'invalid_client'), http_error(500), ValueError('bad response')):
+            with self.assertLogs('apps.channels.tasks', 'ERROR'):
+                summary, _, mark_expired = self.refresh(error)
+            self.assertEqual(summary['failed'], 1)
+            mark_expired.assert_not_called()
+
+    def test_integration_disconnected_mid_run_is_skipped(self):
+        summary, _, mark_expired = self.refresh(IntegrationInactive("Integration is not active"))
+        self.assertEqual(summary['skipped'], 1)
+        mark_expired.assert_not_called()
+
+
+def token_response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    response.url = auth.EBAY_TOKEN_URL
+    return response
+
+
+class TokenRefreshTests(ChannelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(auth._token_cache.clear)
+        self.integration.credentials = json.dumps({'access_token': 'old', 'refresh_token': 'refresh'})
+        self.integration.token_expiry = timezone.now() - timedelta(minutes=1)
+        self.integration.save()
+        self.lock_name = f"ebay_token_refresh_{self.integration.id}"
+
+    def store_token(self, access_token):
+        # What the worker holding the lock does once its refresh succeeds
+        ChannelIntegration.objects.filter(id=self.integration.id).update(
+            credentials=json.dumps({'access_token': access_token, 'refresh_token': 'refresh'}),
+            token_expiry=timezone.now() + timedelta(hours=2)
+        )
+
+    def test_refreshes_once_under_the_lock(self):
+        redis = redis_client.get_redis()
+
+        def refresh(integration):
+            self.assertTrue(redis.exists(self.lock_name))
+            return 'new'
+        with mock.patch.object(auth, 'refresh_access_token', side_effect=refresh) as refresh_token:
+            self.assertEqual(auth.refresh_access_token_once(self.integration), 'new')
+        refresh_token.assert_called_once()
+        self.assertFalse(redis.exists(self.lock_name))
+
+    def test_waiter_reads_the_token_the_lock_holder_stored(self):
+        lock = redis_client.get_redis().lock(self.lock_name)
+        take_lock = lock.acquire
+
+        def acquire():
+            # The holder finishes its refresh while we wait
+            self.store_token('new')
+            return take_lock(blocking=False)
+        with mock.patch.object(lock, 'acquire', side_effect=acquire), \
+                mock.patch.object(redis_client.get_redis(), 'lock', return_value=lock), \
+                mock.patch.object(auth, 'refresh_access_token') as refresh_token:
+            self.assertEqual(auth.refresh_access_token_once(self.integration), 'new')
+        refresh_token.assert_not_called()
+        self.assertEqual(auth.get_valid_access_token(self.integration), 'new')
+
+    @mock.patch.object(auth, 'TOKEN_REFRESH_LOCK_TIMEOUT', 0.2)
+    def test_lock_held_by_another_worker_is_not_refreshed_around(self):
+        held = redis_client.get_redis().lock(self.lock_name, timeout=5)
+        held.acquire()
+        with mock.patch.object(auth, 'refresh_access_token') as refresh_token:
+            with self.assertRaises(auth.TokenRefreshTimeout):
+                auth.refresh_access_token_once(self.integration)
+        refresh_token.assert_not_called()
+        self.assertTrue(held.owned())
+
+    def test_refreshes_without_the_lock_while_redis_is_down(self):
+        self.server.connected = False
+        with mock.patch.object(auth, 'refresh_access_token', return_value='new') as refresh_token, \
+                self.assertLogs('integrations.ebay.auth', 'WARNING'):
+            self.assertEqual(auth.refresh_access_token_once(self.integration), 'new')
+        refresh_token.assert_called_once()
+
+    def test_rejected_refresh_expires_the_integration(self):
+        session = mock.Mock()
+        session.post.return_value = token_response(400, {'error': 'invalid_grant'})
+        with mock.patch.object(auth, 'get_session', return_value=session), \
+                self.assertLogs('integrations.ebay.auth', 'WARNING'):
+            with self.assertRaises(requests.HTTPError):
+                EbayClient(self.integration).get_orders()
+        self.integration.refresh_from_db()
+        self.assertEqual(self.integration.status, 'expired')
+        self.assertFalse(redis_client.get_redis().exists(self.lock_name))
+        with self.assertRaises(auth.IntegrationInactive):
+            auth.get_valid_access_token(self.integration)
+
+    def test_successful_refresh_is_stored_and_cached(self):
+        session = mock.Mock()
+        session.post.return_value = token_response(200, {'access_token': 'new', 'expires_in': 7200})
+        with mock.patch.object(auth, 'get_session', return_value=session):
+            self.assertEqual(auth.get_valid_access_token(self.integration), 'new')
+        self.integration.refresh_from_db()
+        self.assertEqual(json.loads(self.integration.credentials)['access_token'], 'new')
+        with self.assertNumQueries(0):
+            self.assertEqual(auth.get_valid_access_token(self.integration), 'new')
+
+
+class EbayHttpSessionTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(http._sessions, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_session_per_process(self):
+        session = http.get_session()
+        self.assertIs(http.get_session(), session)
+        with mock.patch.object(http.os, 'getpid', return_value=-1):
+            # A forked worker child gets its own sockets
+            self.assertIsNot(http.get_session(), session)
+
+    @override_settings(EBAY_HTTP_POOL_MAXSIZE=7, EBAY_HTTP_MAX_RETRIES=2)
+    def test_pool_and_retries_come_from_settings(self):
+        adapter = http.get_session().get_adapter('https://api.ebay.com')
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+        self.assertNotIn(429, adapter.max_retries.status_forcelist)
+
+    @override_settings(EBAY_HTTP_CONNECT_TIMEOUT=1, EBAY_HTTP_READ_TIMEOUT=2)
+    def test_client_calls_go_through_the_session(self):
+        session = mock.Mock()
+        session.request.return_value = mock.Mock(status_code=200, content=b'{}', json=dict)
+        client = EbayClient(ChannelIntegration(id=1))
+        with mock.patch('integrations.ebay.client.get_session', return_value=session), \
+                mock.patch.object(EbayClient, '_check_circuit'), \
+                mock.patch.object(EbayClient, '_acquire_rate_limit'), \
+                mock.patch.object(EbayClient, '_record_outcome'), \
+                mock.patch.object(EbayClient, '_get_access_token', return_value='token'):
+            client.get_order('o1')
+        self.assertEqual(session.request.call_args.kwargs['timeout'], (1, 2))
+
+
+def order_pages(*pages):
+    """
+    Responses for consecutive getOrders calls, each page linking to the next.
+    """
+    responses = []
+    for n, page in enumerate(pages):
+        response = {'orders': [{'orderId': order_id} for order_id in page]}
+        if n + 1 < len(pages):
+            response['next'] = f"/next/{n + 1}"
+        responses.append(response)
+    return responses
+
+
+class OrderPaginationTests(SimpleTestCase):
+    def setUp(self):
+        self.integration = ChannelIntegration(id=1)
+
+    def test_first_page_params(self):
+        self.assertEqual(build_order_params(page_size=500), {'limit': 200})
+        self.assertEqual(
+            build_order_params('2026-01-01T00:00:00.000Z', page_size=50),
+            {'limit': 50, 'filter': 'creationdate:[2026-01-01T00:00:00.000Z..]'}
+        )
+
+    def test_follows_next_links_one_page_at_a_time(self):
+        with mock.patch.object(EbayClient, '_request', side_effect=order_pages(['o1', 'o2'], ['o3'], ['o4'])) as request:
+            pages = EbayClient(self.integration).iter_order_pages(page_size=2)
+            self.assertEqual(next(pages), [{'orderId': 'o1'}, {'orderId': 'o2'}])
+            self.assertEqual(request.call_count, 1)
+            self.assertEqual([order['orderId'] for page in pages for order in page], ['o3', 'o4'])
+        self.assertEqual([call.args[1] for call in request.call_args_list[1:]], ['/next/1', '/next/2'])
+
+    def test_stops_at_an_empty_page(self):
+        responses = order_pages(['o1'], [], ['o3'])
+        with mock.patch.object(EbayClient, '_request', side_effect=responses) as request:
+            orders = list(EbayClient(self.integration).iter_orders())
+        self.assertEqual(orders, [{'orderId': 'o1'}])
+        self.assertEqual(request.call_count, 2)
+
+    def test_async_client_follows_next_links(self):
+        client = AsyncEbayClient(self.integration, 'token', http=None)
+
+        async def collect():
+            return [page async for page in client.iter_order_pages(semaphore=asyncio.Semaphore(1))]
+        with mock.patch.object(AsyncEbayClient, '_request', side_effect=order_pages(['o1'], ['o2'])) as request:
+            pages = asyncio.run(collect())
+        self.assertEqual(pages, [[{'orderId': 'o1'}], [{'orderId': 'o2'}]])
+        self.assertEqual(request.call_args_list[1].args[1], '/next/1')
+
+
+class EbayStandinTests(FakeRedisMixin, SimpleTestCase):
+    def start(self, **config):
+        self.standin = standin.EbayStandin(standin.StandinConfig(latency=0, backlog_orders=45, skus=['A', 'B'], **config))
+        server = standin.make_server(self.standin, port=0)
+        threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def call(self, method, path, token='seller', **kwargs):
+        headers = {'Authorization': f"Bearer {token}"} if token else {}
+        return requests.request(method, f"{self.base_url}{path}", headers=headers, timeout=5, **kwargs)
+
+    def ebay_client(self):
+        client = EbayClient(ChannelIntegration(id=1))
+        client.base_url = self.base_url
+        patcher = mock.patch.object(EbayClient, '_get_access_token', return_value='seller')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return client
+
+    def test_client_streams_every_order_through_next_links(self):
+        self.start()
+        orders = list(self.ebay_client().iter_orders(page_size=20))
+        self.assertEqual(len({order['orderId'] for order in orders}), 45)
+        self.assertEqual(self.standin.stats[('GET', 'orders', 200)], 3)
+        self.assertEqual({order['sellerId'] for order in orders}, {'seller'})
+
+    def test_orders_are_filtered_by_creation_date(self):
+        self.start(backlog_hours=10)
+        since = standin.format_timestamp(self.standin.started_at - timedelta(hours=1))
+        orders = list(self.ebay_client().iter_orders(created_time_from=since))
+        self.assertTrue(0 < len(orders) < 45)
+        self.assertTrue(all(order['creationDate'] >= since for order in orders))
+
+    def test_same_seed_generates_the_same_orders(self):
+        self.start(seed=7)
+        first = self.call('GET', standin.ORDERS_PATH).json()['orders'][0]
+        self.assertEqual(self.call('GET', f"{standin.ORDERS_PATH}/{first['orderId']}").json(), first)
+        rerun = standin.EbayStandin(self.standin.config)
+        rerun.started_at = self.standin.started_at
+        self.assertEqual(rerun.build_order('seller', 0), first)
+
+    def test_bulk_update_sets_quantities(self):
+        self.start()
+        response = self.ebay_client().bulk_update_quantities({'A': 3, 'B': 0})
+        self.assertEqual([result['statusCode'] for result in response['responses']], [200, 200])
+        items = self.ebay_client().get_inventory_items()['inventoryItems']
+        quantities = {item['sku']: item['availability']['shipToLocationAvailability']['quantity'] for item in items}
+        self.assertEqual(quantities, {'A': 3, 'B': 0})
+        oversized = {'requests': [{'sku': f"S{n}"} for n in range(26)]}
+        self.assertEqual(self.call('POST', standin.BULK_UPDATE_PATH, json=oversized).status_code, 400)
+
+    def test_injects_rate_limits(self):
+        self.start(rate_limit_ratio=1, retry_after=7)
+        with self.assertRaises(EbayRateLimited) as refused:
+            self.ebay_client().get_orders()
+        self.assertEqual(refused.exception.retry_after, 7)
+
+    def poll(self, jobs, resolve_token=None):
+        pages, completed = [], {}
+        with mock.patch('integrations.ebay.client.EBAY_API_BASE_URL', self.base_url):
+            asyncio.run(poll_orders_concurrently(
+                jobs,
+                lambda job, orders: pages.append((job.integration.id, len(orders))),
+                lambda job, error: completed.setdefault(job.integration.id, error),
+                concurrency=2, resolve_token=resolve_token
+            ))
+        return pages, completed
+
+    @override_settings(EBAY_ORDER_PAGE_SIZE=20)
+    def test_polls_integrations_concurrently(self):
+        self.start()
+        jobs = [OrderPollJob(ChannelIntegration(id=n), f"seller{n}", None) for n in range(1, 5)]
+        pages, completed = self.poll(jobs)
+        self.assertEqual(completed, {n: None for n in range(1, 5)})
+        for n in range(1, 5):
+            self.assertEqual([size for integration_id, size in pages if integration_id == n], [20, 20, 5])
+        self.assertTrue(all(job.fetch_seconds > 0 for job in jobs))
+
+    def test_token_failure_fails_only_its_own_job(self):
+        self.start()
+
+        def resolve_token(integration):
+            if integration.id == 2:
+                raise IntegrationInactive("Integration is not active")
+            return f"seller{integration.id}"
+        jobs = [OrderPollJob(ChannelIntegration(id=n), None, None) for n in (1, 2)]
+        pages, completed = self.poll(jobs, resolve_token)
+        self.assertIsNone(completed[1])
+        self.assertIsInstance(completed[2], IntegrationInactive)
+        self.assertEqual({integration_id for integration_id, _ in pages}, {1})
+        self.assertEqual(jobs[0].access_token, 'seller1')
+
+    def test_issues_tokens_and_requires_them(self):
+        self.start()
+        form = {'grant_type': 'refresh_token', 'refresh_token': 'shop1'}
+        token = self.call('POST', standin.TOKEN_PATH, token=None, data=form).json()
+        self.assertEqual(self.standin.seller_for_token(token['access_token']), 'shop1')
+        self.assertEqual(self.call('GET', standin.IDENTITY_USER_PATH, token=token['access_token']).json()['username'], 'shop1')
+        self.assertEqual(self.call('GET', standin.ORDERS_PATH, token=None).status_code, 401)
+
+
+@override_settings(
+    EBAY_POLL_MIN_INTERVAL=120, EBAY_POLL_MAX_INTERVAL=1800, EBAY_POLL_TARGET_ORDERS=1,
+    EBAY_POLL_VELOCITY_WINDOW_HOURS=24, EBAY_POLL_CLAIM_SECONDS=600
+)
+class PollScheduleTests(ChannelTestCase):
+    def record_sales(self, count, provider='ebay', hours_ago=1, shop=None):
+        lot = self.make_lot(f"V{InventoryLot.objects.count()}")
+        if shop:
+            InventoryLot.objects.filter(id=lot.id).update(shop=shop)
+        events = InventoryEvent.objects.bulk_create(
+            InventoryEvent(lot=lot, event_type='sale', quantity_delta=-1, resulting_quantity=0,
+                           provider_event_id=f"{provider}_{lot.sku}_{n}")
+            for n in range(count)
+        )
+        InventoryEvent.objects.filter(id__in=[event.id for event in events]).update(
+            created_at=timezone.now() - timedelta(hours=hours_ago)
+        )
+
+    def test_interval_follows_order_velocity_within_bounds(self):
+        self.assertEqual(poll_schedule.get_poll_interval(0), 1800)
+        self.assertEqual(poll_schedule.get_poll_interval(6), 600)
+        self.assertEqual(poll_schedule.get_poll_interval(1000), 120)
+        self.assertEqual(poll_schedule.get_poll_interval(0.1), 1800)
+
+    def test_velocity_counts_recent_ebay_sales_of_the_shop(self):
+        self.record_sales(48)
+        self.record_sales(10, hours_ago=30)
+        self.record_sales(10, provider='manual')
+        self.record_sales(10, shop=Shop.objects.create(name='Other'))
+        self.assertEqual(poll_schedule.get_sales_per_hour(self.integration), 2)
+
+    def test_busy_shop_is_polled_sooner(self):
+        poll_schedule.schedule_next_poll(self.integration)
+        idle = (self.integration.next_poll_at - timezone.now()).total_seconds()
+        self.record_sales(24 * 12)
+        poll_schedule.schedule_next_poll(self.integration)
+        busy = (self.integration.next_poll_at - timezone.now()).total_seconds()
+        self.assertTrue(1800 * 0.9 - 1 <= idle <= 1800)
+        self.assertTrue(270 - 1 <= busy <= 300)
+
+    def test_claims_due_integrations_oldest_first(self):
+        now = timezone.now()
+        later = ChannelIntegration.objects.create(shop=self.shop, status='active', next_poll_at=now - timedelta(minutes=1))
+        earlier = ChannelIntegration.objects.create(shop=self.shop, status='active', next_poll_at=now - timedelta(minutes=5))
+        ChannelIntegration.objects.create(shop=self.shop, status='active', next_poll_at=now + timedelta(minutes=1))
+        ChannelIntegration.objects.create(shop=self.shop, status='expired', next_poll_at=now - timedelta(minutes=1))
+        self.assertEqual(poll_schedule.claim_due_integrations(now), [self.integration.id, earlier.id, later.id])
+        later.refresh_from_db()
+        self.assertEqual(later.next_poll_at, now + timedelta(seconds=600))
+        self.assertEqual(poll_schedule.claim_due_integrations(now), [])
+
+    def test_dispatch_polls_the_due_integrations(self):
+        with mock.patch.object(tasks.poll_ebay_orders, 'delay') as poll:
+            self.assertEqual(tasks.dispatch_due_polls(), 1)
+            self.assertEqual(tasks.dispatch_due_polls(), 0)
+        poll.assert_called_once_with([self.integration.id])
+
+
+@override_settings(SYNC_JOB_BUFFER_SIZE=3, SYNC_JOB_FLUSH_INTERVAL=60, SYNC_JOB_SUCCESS_SAMPLE_RATE=1.0)
+class SyncAuditTests(ChannelTestCase):
+    def setUp(self):
+        super().setUp()
+        # Leave rows other tests buffered out of it
+        patcher = mock.patch.object(sync_audit, '_buffer', sync_audit.SyncJobBuffer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, status='success'):
+        sync_audit.record_sync_job(integration=self.integration, operation='bulk_push_quantity', direction='outbound', status=status)
+
+    def test_rows_are_written_together_once_the_buffer_fills(self):
+        with self.assertNumQueries(0):
+            self.record()
+            self.record()
+        with self.assertNumQueries(1):
+            self.record()
+        self.assertEqual(SyncJob.objects.count(), 3)
+
+    def test_flushes_after_a_task_once_the_interval_passed(self):
+        self.record()
+        sync_audit._flush_after_task()
+        self.assertEqual(SyncJob.objects.count(), 0)
+        with override_settings(SYNC_JOB_FLUSH_INTERVAL=0):
+            sync_audit._flush_after_task()
+        self.assertEqual(SyncJob.objects.count(), 1)
+
+    @override_settings(SYNC_JOB_SUCCESS_SAMPLE_RATE=0)
+    def test_sampling_keeps_every_failure(self):
+        self.record()
+        self.record('failed')
+        sync_audit.flush_sync_jobs()
+        self.assertEqual(list(SyncJob.objects.values_list('status', flat=True)), ['failed'])
+
+    def test_failed_write_is_logged_not_raised(self):
+        self.record()
+        with mock.patch.object(SyncJob.objects, 'bulk_create', side_effect=RuntimeError('database is locked')), \
+                self.assertLogs('apps.channels.services.sync_audit', 'ERROR'):
+            sync_audit.flush_sync_jobs()
+
+    @override_settings(SYNC_JOB_RETENTION_DAYS=30, SYNC_METRICS_RETENTION_DAYS=7, SYNC_JOB_PRUNE_CHUNK=2)
+    def test_prune_deletes_old_rows_in_chunks(self):
+        now = timezone.now()
+        for age in (40, 35, 31, 10):
+            job = SyncJob.objects.create(integration=self.integration, operation='push', direction='outbound')
+            SyncJob.objects.filter(id=job.id).update(created_at=now - timedelta(days=age))
+        for age in (8, 1):
+            SyncMetric.objects.create(integration=self.integration, operation='push', bucket_start=now - timedelta(days=age))
+        with mock.patch.object(SyncJob.objects, 'filter', wraps=SyncJob.objects.filter) as filter_jobs:
+            self.assertEqual(tasks.prune_sync_jobs(), {'sync_jobs': 3, 'sync_metrics': 1})
+        chunks = [call.kwargs['id__in'] for call in filter_jobs.call_args_list if 'id__in' in call.kwargs]
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual(SyncJob.objects.count(), 1)
+        self.assertEqual(SyncMetric.objects.count(), 1)
+
+
+class QueueLaneTests(SimpleTestCase):
+    def queue_for(self, task_name):
+        return celery_app.amqp.router.route({}, task_name)['queue'].name
+
+    def test_sale_driven_work_has_its_own_lane(self):
+        for name in ('process_webhook_event', 'process_ebay_orders', 'dispatch_outbox', 'push_pending_quantities'):
+            self.assertEqual(self.queue_for(f"apps.channels.tasks.{name}"), 'channel_sales')
+        self.assertEqual(self.queue_for('apps.channels.tasks.poll_ebay_orders'), 'channel_polling')
+        self.assertEqual(self.queue_for('apps.reconciliation.tasks.reconcile_ebay_listings'), 'channel_bulk')
+        self.assertEqual(self.queue_for('apps.inventory.tasks.parse_and_import_csv'), 'channel_bulk')
+
+    def test_every_queue_has_a_worker(self):
+        celery_app.loader.import_default_modules()
+        queues = {self.queue_for(name) for name in celery_app.tasks if name.startswith('apps.')}
+        queues |= set(settings.CHANNEL_LANE_QUEUES.values()) | {settings.CELERY_TASK_DEFAULT_QUEUE}
+        for deployment in ('docker-compose.yml', 'render.yaml'):
+            with open(settings.BASE_DIR.parent / deployment) as f:
+                consumed = {queue for match in re.findall(r'celery .*worker .*-Q (\S+)', f.read()) for queue in match.split(',')}
+            self.assertEqual(queues - consumed, set(), deployment)
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ChannelIntegrationViewSet, ChannelListingViewSet, SyncJobViewSet, EbayOAuthCallbackView
+from integrations.ebay.webhooks import ebay_notification_webhook
+from .views import ChannelIntegrationViewSet, ChannelListingViewSet, SyncJobViewSet, SyncMetricsExportView, EbayOAuthCallbackView
 
 router = DefaultRouter()
 router.register(r'integrations', ChannelIntegrationViewSet, basename='integration')
@@ -9,5 +10,7 @@ router.register(r'sync-jobs', SyncJobViewSet, basename='syncjob')
 
 urlpatterns = [
     path('oauth/ebay/callback/', EbayOAuthCallbackView.as_view(), name='ebay_oauth_callback'),
+    path('metrics/', SyncMetricsExportView.as_view(), name='sync_metrics_export'),
+    path('webhooks/ebay/', ebay_notification_webhook, name='ebay_notification_webhook'),
     path('', include(router.urls)),
 ]
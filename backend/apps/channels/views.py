@@ -2,16 +2,23 @@ from rest_framework import viewsets, status, views
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.http import Http404, HttpResponse
 from django.shortcuts import redirect
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
+import hmac
 import json
 import logging
+from apps.accounts.services.shop_resolver import get_active_shop_id
 from .models import ChannelIntegration, ChannelListing, SyncJob
 from .serializers import ChannelIntegrationSerializer, ChannelListingSerializer, SyncJobSerializer
-from .tasks import push_quantity_to_ebay
-from integrations.ebay.auth import get_authorization_url, exchange_code_for_token
+from .services.outbound import queue_listing_push
+from .services.sync_metrics import get_integration_summary, render_prometheus
+from .services.webhook_intake import identify_seller
+from integrations.ebay.auth import get_authorization_url, exchange_code_for_token, invalidate_cached_token
+from integrations.ebay.client import integration_circuit
 
 logger = logging.getLogger(__name__)
 
@@ -20,28 +27,13 @@ class ChannelIntegrationViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        shop = getattr(user, 'active_shop', None)
-        if not shop:
-            from apps.accounts.models import Membership
-            first_membership = Membership.objects.filter(user=user).first()
-            if first_membership:
-                shop = first_membership.shop
-        
-        if shop:
-            return ChannelIntegration.objects.filter(shop=shop)
+        shop_id = get_active_shop_id(self.request)
+        if shop_id:
+            return ChannelIntegration.objects.filter(shop_id=shop_id)
         return ChannelIntegration.objects.none()
 
     def perform_create(self, serializer):
-        user = self.request.user
-        shop = getattr(user, 'active_shop', None)
-        if not shop:
-            from apps.accounts.models import Membership
-            first_membership = Membership.objects.filter(user=user).first()
-            if first_membership:
-                shop = first_membership.shop
-        
-        serializer.save(shop=shop)
+        serializer.save(shop_id=get_active_shop_id(self.request))
 
     @action(detail=True, methods=['post'])
     def connect(self, request, pk=None):
@@ -56,6 +48,42 @@ class ChannelIntegrationViewSet(viewsets.ModelViewSet):
             
         return Response({'error': 'Unsupported provider'}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['get'])
+    def metrics(self, request, pk=None):
+        """
+        Sync call counts, error rate and latency per operation over the last
+        `hours` (default 24).
+        """
+        integration = self.get_object()
+        try:
+            hours = int(request.query_params.get('hours', 24))
+        except ValueError:
+            return Response({'error': 'hours must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        hours = max(1, min(hours, settings.SYNC_METRICS_RETENTION_DAYS * 24))
+        return Response(get_integration_summary(integration, hours))
+
+class SyncMetricsExportView(views.APIView):
+    """
+    Prometheus scrape endpoint for sync metrics across all integrations.
+    Authenticated with METRICS_TOKEN as a bearer token; hidden when unset.
+    """
+    permission_classes = []
+    authentication_classes = []
+
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        if not token:
+            raise Http404
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            window = int(request.query_params.get('window', 5))
+        except ValueError:
+            window = 5
+        window = max(1, min(window, 24 * 60))
+        return HttpResponse(render_prometheus(window), content_type='text/plain; version=0.0.4')
+
 class EbayOAuthCallbackView(views.APIView):
     permission_classes = [] # Allow anonymous callback
 
@@ -84,6 +112,16 @@ class EbayOAuthCallbackView(views.APIView):
             integration.token_expiry = timezone.now() + timedelta(seconds=expires_in)
             integration.status = 'active'
             integration.save()
+            # Failures recorded against the old credentials don't apply any more
+            integration_circuit(integration.id).reset()
+            # Nor does a token this process cached for the previous connection
+            invalidate_cached_token(integration.id)
+            try:
+                identify_seller(integration)
+            except Exception as e:
+                # Not fatal: polled orders name the seller too, and
+                # backfill_ebay_seller_ids can be run later
+                logger.warning(f"Could not look up the eBay username for integration {integration.id}: {e}")
             
             # Redirect back to frontend
             frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
@@ -101,16 +139,9 @@ class ChannelListingViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        shop = getattr(user, 'active_shop', None)
-        if not shop:
-            from apps.accounts.models import Membership
-            first_membership = Membership.objects.filter(user=user).first()
-            if first_membership:
-                shop = first_membership.shop
-        
-        if shop:
-            return ChannelListing.objects.filter(integration__shop=shop)
+        shop_id = get_active_shop_id(self.request)
+        if shop_id:
+            return ChannelListing.objects.filter(integration__shop_id=shop_id)
         return ChannelListing.objects.none()
 
     @action(detail=False, methods=['post'])
@@ -120,9 +151,10 @@ class ChannelListingViewSet(viewsets.ModelViewSet):
         """
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            listing = serializer.save()
-            # Push initial quantity to channel upon linking
-            push_quantity_to_ebay.delay(listing.id)
+            with transaction.atomic():
+                listing = serializer.save()
+                # Push initial quantity to channel upon linking
+                queue_listing_push(listing.id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -132,22 +164,15 @@ class ChannelListingViewSet(viewsets.ModelViewSet):
         Force push internal qty to channel.
         """
         listing = self.get_object()
-        push_quantity_to_ebay.delay(listing.id)
-        return Response({"status": "Push task queued"})
+        queue_listing_push(listing.id)
+        return Response({"status": "Push queued"})
 
 class SyncJobViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = SyncJobSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        shop = getattr(user, 'active_shop', None)
-        if not shop:
-            from apps.accounts.models import Membership
-            first_membership = Membership.objects.filter(user=user).first()
-            if first_membership:
-                shop = first_membership.shop
-        
-        if shop:
-            return SyncJob.objects.filter(integration__shop=shop)
+        shop_id = get_active_shop_id(self.request)
+        if shop_id:
+            return SyncJob.objects.filter(integration__shop_id=shop_id).order_by('-created_at')
         return SyncJob.objects.none()
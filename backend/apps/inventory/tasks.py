@@ -3,6 +3,10 @@ from .services.csv_importer import CSVImporter
 from .models import InventoryLot, InventoryEvent
 from django.core.cache import cache
 
+def import_status_key(shop_id, task_id):
+    # Scoped to the shop so one shop can't read another's import results
+    return f"csv_import_{shop_id}_{task_id}"
+
 @shared_task
 def parse_and_import_csv(task_id, shop_id, user_id, file_content, column_mapping):
     """
@@ -13,6 +17,6 @@ def parse_and_import_csv(task_id, shop_id, user_id, file_content, column_mapping
     summary = importer.parse_and_import(file_content, column_mapping)
     
     # Store summary in cache for 1 hour
-    cache.set(f"csv_import_{task_id}", summary, timeout=3600)
+    cache.set(import_status_key(shop_id, task_id), summary, timeout=3600)
     
     return summary
\ No newline at end of file
@@ -1,3 +1,126 @@
-from django.test import TestCase
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.accounts.models import Membership, Shop, User
+from apps.channels import tasks as channel_tasks
+from apps.channels.models import ChannelIntegration, ChannelListing, OutboxEntry
+from apps.inventory.models import Card, InventoryLot
+from apps.inventory.tasks import import_status_key
+from core.testing import FakeRedisMixin
+from integrations.ebay.client import EbayClient
 
-# Create your tests here.
+
+class InventoryTestCase(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+        self.shop = Shop.objects.create(name='Shop')
+        self.other_shop = Shop.objects.create(name='Other')
+        self.user = self.make_user('user', self.shop)
+        self.other_user = self.make_user('other', self.other_shop)
+
+    def make_user(self, username, shop):
+        user = User.objects.create_user(username=username, password='password')
+        Membership.objects.create(user=user, shop=shop)
+        return user
+
+    def make_lot(self, shop, sku):
+        card = Card.objects.create(shop=shop, name='Card')
+        return InventoryLot.objects.create(shop=shop, card=card, sku=sku, quantity_available=1, condition='NM')
+
+    def get(self, url, user=None, **headers):
+        if user is not None:
+            headers['Authorization'] = f"Bearer {AccessToken.for_user(user)}"
+        return self.client.get(url, headers=headers)
+
+    def post(self, url, user, data=None):
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+        return self.client.post(url, data, content_type='application/json', headers=headers)
+
+
+class AsyncAPIViewTests(InventoryTestCase):
+
+    def test_unauthenticated_gets_401(self):
+        for url in (reverse('dashboard-summary'), reverse('csv-import-status', args=['t1'])):
+            response = self.get(url)
+            self.assertEqual(response.status_code, 401)
+            self.assertIn('Bearer', response['WWW-Authenticate'])
+
+    def test_invalid_token_gets_401(self):
+        response = self.get(reverse('dashboard-summary'), Authorization='Bearer invalid')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+    def test_dashboard_counts_the_active_shop_only(self):
+        self.make_lot(self.shop, 'A')
+        self.make_lot(self.other_shop, 'B')
+        self.make_lot(self.other_shop, 'C')
+        response = self.get(reverse('dashboard-summary'), self.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_lots'], 1)
+
+    def test_dashboard_ignores_another_shops_id(self):
+        self.make_lot(self.other_shop, 'B')
+        response = self.get(reverse('dashboard-summary'), self.user, **{'X-Shop-ID': str(self.other_shop.id)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_lots'], 0)
+
+    def test_import_status_is_scoped_to_the_shop(self):
+        cache.set(import_status_key(self.other_shop.id, 't1'), {'status': 'completed'})
+        url = reverse('csv-import-status', args=['t1'])
+        self.assertEqual(self.get(url, self.other_user).json(), {'status': 'completed'})
+        self.assertEqual(self.get(url, self.user).json(), {'status': 'pending'})
+        self.assertEqual(self.get(url, self.user, **{'X-Shop-ID': str(self.other_shop.id)}).json(), {'status': 'pending'})
+
+    @override_settings(SHOP_THROTTLE_RATES={'read': {'capacity': 1, 'refill_rate': 0.1, 'cost': 1}})
+    def test_throttled_gets_429_with_retry_after(self):
+        self.assertEqual(self.get(reverse('dashboard-summary'), self.user).status_code, 200)
+        # Both views draw on the shop's 'read' bucket
+        for url in (reverse('dashboard-summary'), reverse('csv-import-status', args=['t1'])):
+            response = self.get(url, self.user)
+            self.assertEqual(response.status_code, 429)
+            self.assertGreater(int(response['Retry-After']), 0)
+
+
+@override_settings(CHANNEL_PUSH_DEBOUNCE_SECONDS=30)
+class LotPushTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lot = self.make_lot(self.shop, 'A')
+        integration = ChannelIntegration.objects.create(shop=self.shop, status='active')
+        self.listing = ChannelListing.objects.create(
+            integration=integration, lot=self.lot, external_listing_id='listing_A', external_sku='A', sync_state='synced'
+        )
+
+    def change(self, action, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post(reverse(f'inventorylot-{action}', args=[self.lot.id]), self.user, data)
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_in_the_debounce_window_coalesce_into_one_push(self):
+        with mock.patch.object(channel_tasks.dispatch_outbox, 'apply_async') as schedule_dispatch:
+            self.change('adjust', {'quantity_delta': 4})
+            self.change('grading-send', {'quantity': 2})
+            self.change('adjust', {'quantity_delta': -1})
+        schedule_dispatch.assert_called_once_with(countdown=30)
+        self.assertEqual(OutboxEntry.objects.count(), 1)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.sync_state, 'pending')
+
+        with mock.patch.object(channel_tasks.push_pending_quantities, 'apply_async') as queue_push:
+            channel_tasks.dispatch_outbox()
+        queue_push.assert_called_once()
+
+    def test_push_sends_the_latest_quantity(self):
+        with mock.patch.object(channel_tasks.dispatch_outbox, 'apply_async'):
+            self.change('adjust', {'quantity_delta': 4})
+            self.change('adjust', {'quantity_delta': -2})
+        with mock.patch.object(EbayClient, 'bulk_update_quantities', return_value={
+            'responses': [{'sku': 'A', 'statusCode': 200}]
+        }) as bulk_update:
+            channel_tasks.push_pending_quantities.apply(args=(self.listing.integration_id,)).get()
+        bulk_update.assert_called_once_with({'A': 3})
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.sync_state, self.listing.listed_quantity), ('synced', 3))
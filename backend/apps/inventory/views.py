@@ -1,74 +1,76 @@
 import uuid
+import datetime
 from rest_framework import viewsets, status, views
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.db import transaction
 from django.core.cache import cache
+from django.db.models import Sum, F
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.accounts.async_views import AsyncAPIView, json_response
+from apps.accounts.services.shop_resolver import get_active_shop_id
+from apps.channels.services.outbound import queue_lot_push
 from .models import Card, InventoryLot, InventoryEvent
 from .serializers import CardSerializer, InventoryLotSerializer, InventoryEventSerializer
-from .tasks import parse_and_import_csv
+from .tasks import import_status_key, parse_and_import_csv
 
-class DashboardSummaryView(views.APIView):
-    def get(self, request, *args, **kwargs):
-        shop_id = getattr(request, 'active_shop_id', None)
+class DashboardSummaryView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        shop_id = request.active_shop_id
+        if shop_id and not request.user.active_shop_id and str(shop_id) != request.headers.get('X-Shop-ID'):
+            # Remember the first-shop fallback as the user's active shop for
+            # future requests; an X-Shop-ID override only applies to this request
+            request.user.active_shop_id = shop_id
+            await request.user.asave(update_fields=['active_shop'])
         if not shop_id:
-            # Check if user has any shops at all
-            from apps.accounts.models import Membership
-            first_membership = Membership.objects.filter(user=request.user).first()
-            if first_membership:
-                shop_id = first_membership.shop_id
-                # Update user's active shop for future requests
-                request.user.active_shop_id = shop_id
-                request.user.save()
-            else:
-                return Response({
-                    'total_inventory_value': 0,
-                    'total_cards': 0,
-                    'total_lots': 0,
-                    'recent_sales_30d': 0,
-                    'sync_errors': 0,
-                    'recent_activity': [],
-                    'no_shop': True
-                })
+            # User has no shops at all
+            return json_response({
+                'total_inventory_value': 0,
+                'total_cards': 0,
+                'total_lots': 0,
+                'recent_sales_30d': 0,
+                'sync_errors': 0,
+                'recent_activity': [],
+                'no_shop': True
+            })
             
         # Get total lots and cards
-        total_lots = InventoryLot.objects.filter(shop_id=shop_id).count()
-        total_cards = Card.objects.filter(shop_id=shop_id).count()
+        total_lots = await InventoryLot.objects.filter(shop_id=shop_id).acount()
+        total_cards = await Card.objects.filter(shop_id=shop_id).acount()
         
         # Calculate total inventory value based on cost basis
-        from django.db.models import Sum, F
-        value_agg = InventoryLot.objects.filter(shop_id=shop_id).aggregate(
+        value_agg = await InventoryLot.objects.filter(shop_id=shop_id).aaggregate(
             total_value=Sum(F('quantity_available') * F('cost_basis'))
         )
         total_value = value_agg['total_value'] or 0
         
         # Recent sales (30d)
-        from django.utils import timezone
-        import datetime
         thirty_days_ago = timezone.now() - datetime.timedelta(days=30)
-        recent_sales = InventoryEvent.objects.filter(
+        recent_sales = await InventoryEvent.objects.filter(
             lot__shop_id=shop_id,
             event_type='sale',
             created_at__gte=thirty_days_ago
-        ).count()
+        ).acount()
         
         # Sync errors
         from apps.channels.models import ChannelListing
-        sync_errors = ChannelListing.objects.filter(
+        sync_errors = await ChannelListing.objects.filter(
             integration__shop_id=shop_id,
             sync_state='error'
-        ).count()
+        ).acount()
         
         # Recent activity
-        recent_activity = InventoryEvent.objects.filter(
-            lot__shop_id=shop_id
-        ).order_by('-created_at')[:5]
+        recent_activity = [
+            event async for event in InventoryEvent.objects.filter(
+                lot__shop_id=shop_id
+            ).order_by('-created_at')[:5]
+        ]
         
         activity_data = InventoryEventSerializer(recent_activity, many=True).data
         
-        return Response({
+        return json_response({
             'total_inventory_value': total_value,
             'total_cards': total_cards,
             'total_lots': total_lots,
@@ -82,6 +84,7 @@ class CSVImportView(views.APIView):
     API endpoint for handling CSV file uploads.
     """
     parser_classes = (MultiPartParser, FormParser)
+    throttle_scope = 'bulk'
 
     def post(self, request, *args, **kwargs):
         file_obj = request.FILES.get('file')
@@ -96,7 +99,7 @@ class CSVImportView(views.APIView):
         if not file_obj.name.endswith('.csv'):
             return Response({'error': 'File must be a CSV'}, status=status.HTTP_400_BAD_REQUEST)
             
-        shop_id = getattr(request, 'active_shop_id', None)
+        shop_id = get_active_shop_id(request)
         if not shop_id:
             return Response({'error': 'Shop context required'}, status=status.HTTP_400_BAD_REQUEST)
             
@@ -116,52 +119,40 @@ class CSVImportView(views.APIView):
         
         return Response({'task_id': task_id}, status=status.HTTP_202_ACCEPTED)
 
-class CSVImportStatusView(views.APIView):
+class CSVImportStatusView(AsyncAPIView):
     """
     Endpoint for polling the status of a CSV import task.
+    Async so a single ASGI worker can serve many concurrent pollers.
     """
-    def get(self, request, task_id, *args, **kwargs):
-        cache_key = f"csv_import_{task_id}"
-        result = cache.get(cache_key)
+    async def get(self, request, task_id, *args, **kwargs):
+        result = await cache.aget(import_status_key(request.active_shop_id, task_id))
         
         if result:
-            return Response(result)
+            return json_response(result)
             
         # Note: We aren't checking Celery's actual AsyncResult here for simplicity
         # and because we cached the result. In a production app with long tasks,
         # we might want to check the actual task status.
-        return Response({'status': 'pending'})
+        return json_response({'status': 'pending'})
 
 class BaseShopViewSet(viewsets.ModelViewSet):
     """
     Base ViewSet that automatically filters by active shop.
-    Assumes ShopScopingMiddleware is setting request.active_shop_id
+    The shop is resolved once per request by the shop resolver service.
     """
     def get_queryset(self):
         user = self.request.user
         if not user or not user.is_authenticated:
             return super().get_queryset().none()
 
-        shop_id = getattr(self.request, 'active_shop_id', None)
-        if not shop_id:
-            from apps.accounts.models import Membership
-            first_membership = Membership.objects.filter(user=user).first()
-            if first_membership:
-                shop_id = first_membership.shop_id
-        
+        shop_id = get_active_shop_id(self.request)
         if shop_id:
             return super().get_queryset().filter(shop_id=shop_id)
         return super().get_queryset().none()
 
     def perform_create(self, serializer):
-        shop_id = getattr(self.request, 'active_shop_id', None)
-        if not shop_id:
-            # Fallback to user's first shop if middleware hasn't set it
-            from apps.accounts.models import Membership
-            first_membership = Membership.objects.filter(user=self.request.user).first()
-            if first_membership:
-                shop_id = first_membership.shop_id
-        
+        # Falls back to the user's first shop if none is selected
+        shop_id = get_active_shop_id(self.request)
         serializer.save(shop_id=shop_id)
 
 class CardViewSet(BaseShopViewSet):
@@ -208,6 +199,8 @@ class InventoryLotViewSet(BaseShopViewSet):
             metadata={"reason": request.data.get('reason', '')}
         )
 
+        queue_lot_push(lot.id)
+
         return Response(self.get_serializer(lot).data)
 
     @action(detail=True, methods=['post'], url_path='grading/send')
@@ -236,6 +229,8 @@ class InventoryLotViewSet(BaseShopViewSet):
             actor=request.user,
         )
         
+        queue_lot_push(lot.id)
+        
         return Response(self.get_serializer(lot).data)
 
     @action(detail=True, methods=['post'], url_path='grading/return')
@@ -265,6 +260,8 @@ class InventoryLotViewSet(BaseShopViewSet):
             metadata={"grade": request.data.get('grade', '')}
         )
         
+        queue_lot_push(lot.id)
+        
         return Response(self.get_serializer(lot).data)
 
 class InventoryEventViewSet(viewsets.ReadOnlyModelViewSet):
@@ -278,13 +275,7 @@ class InventoryEventViewSet(viewsets.ReadOnlyModelViewSet):
         if not user or not user.is_authenticated:
             return super().get_queryset().none()
 
-        shop_id = getattr(self.request, 'active_shop_id', None)
-        if not shop_id:
-            from apps.accounts.models import Membership
-            first_membership = Membership.objects.filter(user=user).first()
-            if first_membership:
-                shop_id = first_membership.shop_id
-
+        shop_id = get_active_shop_id(self.request)
         if shop_id:
             # Events are linked to lots, which are linked to shops
             return super().get_queryset().filter(lot__shop_id=shop_id)
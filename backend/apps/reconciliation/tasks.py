@@ -1,88 +1,136 @@
 import logging
+import time
+from itertools import islice
 from celery import shared_task
+from django.conf import settings
 from apps.channels.models import ChannelIntegration, ChannelListing
 from apps.reconciliation.models import Mismatch
-from integrations.ebay.client import EbayClient
+from apps.channels.services.sync_metrics import record_sync
+from integrations.ebay.client import EbayClient, EbayRateLimited
 from integrations.ebay.auth import get_valid_access_token
+from core.locks import Lease
+from core.requeue import requeue_after_rate_limit
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def reconcile_ebay_listings(integration_id):
+@shared_task(bind=True)
+def reconcile_ebay_listings(self, integration_id, offset=0):
     """
     Fetches active eBay listings, compares quantity to internal, and flags mismatches.
+    A run that hits the rate limit is re-queued to resume at `offset`, the
+    number of eBay inventory items already compared.
     """
     try:
         integration = ChannelIntegration.objects.get(id=integration_id, status='active')
     except ChannelIntegration.DoesNotExist:
         return {"status": "error", "message": "Integration not found or not active"}
 
+    with Lease(f"ebay_reconcile_{integration_id}", ttl=settings.EBAY_RECONCILE_LEASE_SECONDS) as lease:
+        if not lease.acquired:
+            # Another run is still reconciling this integration; it covers this one
+            logger.info(f"Reconciliation for integration {integration_id} already running, skipping")
+            return {"status": "skipped", "message": "Reconciliation already running"}
+        started = time.monotonic()
+        result = _reconcile_ebay_listings(self, integration, lease, offset)
+        if result["status"] in ("success", "error"):
+            record_sync(integration.id, 'reconcile', time.monotonic() - started, result["status"] == "success")
+        return result
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _reconcile_ebay_listings(task, integration, lease, offset=0):
+    """
+    Reconciliation body, run while holding the integration's reconcile lease.
+    eBay inventory is streamed page by page and compared in chunks of
+    RECONCILE_CHUNK_SIZE items, so memory stays flat however many SKUs the
+    seller has.
+    """
+    compared = 0
+    mismatches_found = 0
     try:
         token = get_valid_access_token(integration)
         client = EbayClient(integration)
         
         # Get active inventory from eBay
-        # Assuming get_inventory_items() returns a list of items with SKU and quantity
-        # (Using a mock implementation based on EbayClient class in client.py)
-        ebay_items = client._request('GET', '/sell/inventory/v1/inventory_item')
-        if ebay_items and 'inventoryItems' in ebay_items:
-            ebay_items = ebay_items['inventoryItems']
-        else:
-            ebay_items = []
-            
-        mismatches_found = 0
-        
-        for item in ebay_items:
-            sku = item.get('sku')
-            
-            # The structure of availability depends on the eBay API response
-            ebay_qty = 0
-            if 'availability' in item and 'shipToLocationAvailability' in item['availability']:
-                ebay_qty = item['availability']['shipToLocationAvailability'].get('quantity', 0)
-                
-            ebay_id = item.get('listingId', '') # Might not be present in Inventory Item directly
-            
-            # We don't have title in inventory_item necessarily, but keeping for logic
-            ebay_title = item.get('product', {}).get('title', '')
-            
-            # Find listing by sku
-            listing = ChannelListing.objects.filter(integration=integration, external_sku=sku).first()
-            lot = None
-            internal_qty = 0
-            
-            if listing:
-                lot = listing.lot
-                internal_qty = lot.quantity_available
-            else:
-                # Try to find lot by sku directly if listing isn't linked
-                from apps.inventory.models import InventoryLot
-                lot = InventoryLot.objects.filter(shop=integration.shop, sku=sku).first()
-                if lot:
-                    internal_qty = lot.quantity_available
-            
-            if ebay_qty != internal_qty:
-                # Create or update mismatch
-                Mismatch.objects.update_or_create(
-                    integration=integration,
-                    listing=listing,
-                    lot=lot,
-                    external_listing_id=ebay_id,
-                    defaults={
-                        'internal_quantity': internal_qty,
-                        'channel_quantity': ebay_qty,
-                        'external_sku': sku,
-                        'external_title': ebay_title,
-                        'status': 'pending',
-                        'resolved_at': None
-                    }
-                )
-                mismatches_found += 1
+        for chunk in _chunked(client.iter_inventory_items(offset=offset), settings.RECONCILE_CHUNK_SIZE):
+            if not lease.renew_if_due():
+                # Our lease expired and a newer run took over; leave the rest to it
+                return {"status": "skipped", "message": "Lease lost", "mismatches_found": mismatches_found}
+            mismatches_found += _reconcile_chunk(integration, chunk)
+            compared += len(chunk)
                 
         return {"status": "success", "mismatches_found": mismatches_found}
         
+    except EbayRateLimited as e:
+        # Resume after the items already compared instead of starting over
+        if requeue_after_rate_limit(task, e, offset=offset + compared):
+            return {"status": "requeued", "message": str(e)}
+        return {"status": "error", "message": str(e)}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def _reconcile_chunk(integration, items):
+    """
+    Compares one chunk of eBay inventory items against our listings, or lots
+    with the same SKU where no listing is linked, and flags mismatches.
+    Returns the number of mismatches found.
+    """
+    from apps.inventory.models import InventoryLot
+
+    skus = {item.get('sku') for item in items}
+    listings = {}
+    for listing in ChannelListing.objects.filter(integration=integration, external_sku__in=skus).select_related('lot').order_by('id'):
+        listings.setdefault(listing.external_sku, listing)
+    lots = {}
+    unlinked = skus - listings.keys()
+    if unlinked:
+        for lot in InventoryLot.objects.filter(shop=integration.shop, sku__in=unlinked).order_by('id'):
+            lots.setdefault(lot.sku, lot)
+
+    mismatches_found = 0
+    for item in items:
+        sku = item.get('sku')
+        
+        # The structure of availability depends on the eBay API response
+        ebay_qty = 0
+        if 'availability' in item and 'shipToLocationAvailability' in item['availability']:
+            ebay_qty = item['availability']['shipToLocationAvailability'].get('quantity', 0)
+            
+        ebay_id = item.get('listingId', '') # Might not be present in Inventory Item directly
+        
+        # We don't have title in inventory_item necessarily, but keeping for logic
+        ebay_title = item.get('product', {}).get('title', '')
+        
+        # Find listing by sku, else the lot by sku directly if no listing is linked
+        listing = listings.get(sku)
+        lot = listing.lot if listing else lots.get(sku)
+        internal_qty = lot.quantity_available if lot else 0
+        
+        if ebay_qty != internal_qty:
+            # Create or update mismatch
+            Mismatch.objects.update_or_create(
+                integration=integration,
+                listing=listing,
+                lot=lot,
+                external_listing_id=ebay_id,
+                defaults={
+                    'internal_quantity': internal_qty,
+                    'channel_quantity': ebay_qty,
+                    'external_sku': sku,
+                    'external_title': ebay_title,
+                    'status': 'pending',
+                    'resolved_at': None
+                }
+            )
+            mismatches_found += 1
+    return mismatches_found
+
 @shared_task
 def reconcile_all_integrations():
     """
@@ -0,0 +1,106 @@
+from unittest import mock
+from django.test import TestCase, override_settings
+from apps.accounts.models import Shop
+from apps.channels.models import ChannelIntegration
+from apps.reconciliation import tasks
+from apps.reconciliation.models import Mismatch
+from core.testing import FakeRedisMixin
+from integrations.ebay.client import EbayClient, EbayRateLimited
+
+
+def inventory(count, page_size=3, rate_limited_at=None, report_total=True):
+    """
+    Stands in for EbayClient.get_inventory_items over `count` items, each one
+    short of our (missing) stock. Pages from `rate_limited_at` on raise
+    EbayRateLimited.
+    """
+    items = [
+        {'sku': f"S{n}", 'listingId': f"L{n}", 'availability': {'shipToLocationAvailability': {'quantity': 1}}}
+        for n in range(count)
+    ]
+
+    def get_inventory_items(offset=0, limit=None):
+        if rate_limited_at is not None and offset >= rate_limited_at:
+            raise EbayRateLimited(5)
+        response = {'inventoryItems': items[offset:offset + page_size]}
+        if report_total:
+            response['total'] = count
+        return response
+    return get_inventory_items
+
+
+@override_settings(RECONCILE_CHUNK_SIZE=2)
+class ReconcileEbayListingsTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.integration = ChannelIntegration.objects.create(shop=Shop.objects.create(name='Shop'), status='active')
+        patcher = mock.patch.object(tasks, 'get_valid_access_token', return_value='token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reconcile(self, get_inventory_items, **kwargs):
+        with mock.patch.object(EbayClient, 'get_inventory_items', side_effect=get_inventory_items) as fetch, \
+                mock.patch.object(tasks.reconcile_ebay_listings, 'apply_async') as apply_async:
+            result = tasks.reconcile_ebay_listings.apply(kwargs={'integration_id': self.integration.id, **kwargs}).get()
+        return result, fetch, apply_async
+
+    def flagged_skus(self):
+        return set(Mismatch.objects.values_list('external_sku', flat=True))
+
+    def test_compares_every_page(self):
+        result, fetch, _ = self.reconcile(inventory(10))
+        self.assertEqual(result, {'status': 'success', 'mismatches_found': 10})
+        self.assertEqual(self.flagged_skus(), {f"S{n}" for n in range(10)})
+        self.assertEqual([call.args[0] for call in fetch.call_args_list], [0, 3, 6, 9])
+
+    def test_rate_limited_run_resumes_after_compared_items(self):
+        # The first chunk (S0, S1) is compared; the second needs the page at
+        # offset 3, so S2 is fetched again by the resumed run
+        result, _, apply_async = self.reconcile(inventory(10, rate_limited_at=3))
+        self.assertEqual(result['status'], 'requeued')
+        self.assertEqual(self.flagged_skus(), {'S0', 'S1'})
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['kwargs']['offset'], 2)
+
+    def test_requeue_from_resumed_run_adds_to_its_offset(self):
+        # Pages are fetched from offset 2; S2, S3 are compared before the page at 5 fails
+        _, _, apply_async = self.reconcile(inventory(10, rate_limited_at=5), offset=2)
+        self.assertEqual(apply_async.call_args.kwargs['kwargs']['offset'], 4)
+
+    def test_resumed_run_starts_at_offset(self):
+        result, fetch, _ = self.reconcile(inventory(10), offset=4)
+        self.assertEqual(result, {'status': 'success', 'mismatches_found': 6})
+        self.assertEqual(self.flagged_skus(), {f"S{n}" for n in range(4, 10)})
+        self.assertEqual(fetch.call_args_list[0].args[0], 4)
+
+    @override_settings(RATE_LIMIT_MAX_REQUEUES=0)
+    def test_gives_up_after_max_requeues(self):
+        with self.assertLogs('core.requeue', 'WARNING'):
+            result, _, apply_async = self.reconcile(inventory(10, rate_limited_at=0))
+        self.assertEqual(result['status'], 'error')
+        apply_async.assert_not_called()
+
+
+class IterInventoryItemsTests(TestCase):
+    def setUp(self):
+        self.client = EbayClient(ChannelIntegration(id=1))
+
+    def iterate(self, get_inventory_items, offset=0):
+        with mock.patch.object(EbayClient, 'get_inventory_items', side_effect=get_inventory_items) as fetch:
+            skus = [item['sku'] for item in self.client.iter_inventory_items(offset=offset)]
+        return skus, [call.args[0] for call in fetch.call_args_list]
+
+    def test_stops_at_reported_total(self):
+        skus, offsets = self.iterate(inventory(6))
+        self.assertEqual(skus, [f"S{n}" for n in range(6)])
+        self.assertEqual(offsets, [0, 3])
+
+    def test_stops_at_empty_page_without_total(self):
+        skus, offsets = self.iterate(inventory(5, report_total=False))
+        self.assertEqual(len(skus), 5)
+        self.assertEqual(offsets, [0, 3, 5])
+
+    def test_starts_at_offset(self):
+        skus, offsets = self.iterate(inventory(6), offset=4)
+        self.assertEqual(skus, ['S4', 'S5'])
+        self.assertEqual(offsets, [4])
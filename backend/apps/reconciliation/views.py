@@ -2,26 +2,20 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.utils import timezone
+from apps.accounts.services.shop_resolver import get_active_shop_id
 from .models import Mismatch
 from .serializers import MismatchSerializer
-from apps.channels.tasks import push_quantity_to_ebay
+from apps.channels.services.outbound import queue_listing_push
 
 class MismatchViewSet(viewsets.ModelViewSet):
     serializer_class = MismatchSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        shop = getattr(user, 'active_shop', None)
-        if not shop:
-            from apps.accounts.models import Membership
-            first_membership = Membership.objects.filter(user=user).first()
-            if first_membership:
-                shop = first_membership.shop
-        
-        if not shop:
+        shop_id = get_active_shop_id(self.request)
+        if not shop_id:
             return Mismatch.objects.none()
             
-        queryset = Mismatch.objects.filter(integration__shop=shop)
+        queryset = Mismatch.objects.filter(integration__shop_id=shop_id)
         
         status_filter = self.request.query_params.get('status')
         if status_filter:
@@ -51,8 +45,7 @@ class MismatchViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Create a sync job or queue the task
-            push_quantity_to_ebay.delay(mismatch.listing.id)
+            queue_listing_push(mismatch.listing.id)
             
             mismatch.status = 'push_internal'
             mismatch.notes = "Queued push to channel."
@@ -71,6 +71,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
 
 DATABASES = {
     'default': {
@@ -101,7 +102,7 @@ AUTH_USER_MODEL = 'accounts.User'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -109,10 +110,23 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'apps.accounts.throttling.ShopRateThrottle',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
 
+# Per-shop token buckets by endpoint class (see apps.accounts.throttling).
+# capacity is the burst size, refill_rate the tokens regained per second and
+# cost the tokens taken per request.
+SHOP_THROTTLE_RATES = {
+    'read': {'capacity': 300, 'refill_rate': 5, 'cost': 1},
+    'write': {'capacity': 120, 'refill_rate': 2, 'cost': 2},
+    'bulk': {'capacity': 20, 'refill_rate': 0.1, 'cost': 10},
+    'anon': {'capacity': 30, 'refill_rate': 0.5, 'cost': 1},
+}
+
 # Simple JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -135,27 +149,90 @@ CSRF_TRUSTED_ORIGINS = [
     'https://slabtracker-backend.onrender.com',
 ]
 
+# Redis
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+# Cache
+# Shared across web and worker processes when Redis is configured, so cached
+# membership sets and import results are visible (and invalidated) everywhere.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+MEMBERSHIP_CACHE_TIMEOUT = int(os.environ.get('MEMBERSHIP_CACHE_TIMEOUT', 300))
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 60))
+
 # Celery
-CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
-CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
-# Task routing
+# Workers take one message per process at a time, so a long task can't hold
+# queued messages hostage in its worker's prefetch buffer
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+
+# Task routing. Each lane has its own workers (see docker-compose.yml), so
+# pushes after a sale never wait behind polling or an hourly reconciliation:
+#   channel_sales        order intake and the quantity pushes it causes
+#   channel_interactive  pushes for changes made by users (adjustments, linking, resolving)
+#   channel_polling      periodic polls, webhook backlog, token refresh
+#   channel_bulk         reconciliation, imports and housekeeping
+# push_pending_quantities is queued by dispatch_outbox on the lane of the
+# outbox entries it drains (CHANNEL_LANE_QUEUES).
 CELERY_TASK_ROUTES = {
-    'apps.channels.tasks.*': {'queue': 'channel_queue'},
-    'apps.inventory.tasks.*': {'queue': 'default'},
+    'apps.channels.tasks.process_webhook_event': {'queue': 'channel_sales'},
+    'apps.channels.tasks.process_ebay_orders': {'queue': 'channel_sales'},
+    'apps.channels.tasks.process_ebay_order': {'queue': 'channel_sales'},
+    'apps.channels.tasks.dispatch_outbox': {'queue': 'channel_sales'},
+    'apps.channels.tasks.push_pending_quantities': {'queue': 'channel_sales'},
+    'apps.channels.tasks.dispatch_due_polls': {'queue': 'channel_polling'},
+    'apps.channels.tasks.poll_ebay_orders': {'queue': 'channel_polling'},
+    'apps.channels.tasks.process_webhook_backlog': {'queue': 'channel_polling'},
+    'apps.channels.tasks.refresh_expiring_tokens': {'queue': 'channel_polling'},
+    'apps.channels.tasks.prune_sync_jobs': {'queue': 'channel_bulk'},
+    'apps.reconciliation.tasks.*': {'queue': 'channel_bulk'},
+    'apps.inventory.tasks.*': {'queue': 'channel_bulk'},
+}
+CHANNEL_LANE_QUEUES = {
+    'sales': 'channel_sales',
+    'interactive': 'channel_interactive',
 }
 
 from celery.schedules import crontab
 
 # Beat Schedule
 CELERY_BEAT_SCHEDULE = {
-    'poll_ebay_orders': {
-        'task': 'apps.channels.tasks.poll_ebay_orders',
-        'schedule': crontab(minute='*/5'),
+    # Sales arrive through the eBay webhook; polling is a safety net for missed
+    # notifications, paced per integration by order velocity (EBAY_POLL_*_INTERVAL)
+    'dispatch_due_polls': {
+        'task': 'apps.channels.tasks.dispatch_due_polls',
+        'schedule': crontab(),  # Every minute
+    },
+    'prune_sync_jobs': {
+        'task': 'apps.channels.tasks.prune_sync_jobs',
+        'schedule': crontab(minute='15', hour='3'),  # Daily
+    },
+    'dispatch_outbox': {
+        'task': 'apps.channels.tasks.dispatch_outbox',
+        'schedule': crontab(),  # Every minute
+    },
+    'process_webhook_backlog': {
+        'task': 'apps.channels.tasks.process_webhook_backlog',
+        'schedule': crontab(),  # Every minute
     },
     'reconcile_all_integrations': {
         'task': 'apps.reconciliation.tasks.reconcile_all_integrations',
@@ -167,6 +244,105 @@ CELERY_BEAT_SCHEDULE = {
     },
 }
 
+# eBay HTTP client (pooled keep-alive sessions, see integrations.ebay.http)
+EBAY_HTTP_POOL_CONNECTIONS = int(os.environ.get('EBAY_HTTP_POOL_CONNECTIONS', 10))
+EBAY_HTTP_POOL_MAXSIZE = int(os.environ.get('EBAY_HTTP_POOL_MAXSIZE', 20))
+EBAY_HTTP_CONNECT_TIMEOUT = float(os.environ.get('EBAY_HTTP_CONNECT_TIMEOUT', 5))
+EBAY_HTTP_READ_TIMEOUT = float(os.environ.get('EBAY_HTTP_READ_TIMEOUT', 30))
+EBAY_HTTP_MAX_RETRIES = int(os.environ.get('EBAY_HTTP_MAX_RETRIES', 3))
+
+# Shared eBay call budgets (token buckets in Redis, see integrations.ebay.client).
+# 'app' is the whole eBay application's budget across all shops, 'integration'
+# a single shop's share of it.
+EBAY_RATE_LIMITS = {
+    'app': {
+        'capacity': int(os.environ.get('EBAY_APP_RATE_BURST', 50)),
+        'refill_rate': float(os.environ.get('EBAY_APP_RATE_PER_SECOND', 20)),
+    },
+    'integration': {
+        'capacity': int(os.environ.get('EBAY_INTEGRATION_RATE_BURST', 10)),
+        'refill_rate': float(os.environ.get('EBAY_INTEGRATION_RATE_PER_SECOND', 2)),
+    },
+}
+
+# A task refused by the rate limit is re-queued (core.requeue) at most this
+# many times in a row before its work is left to the next periodic run
+RATE_LIMIT_MAX_REQUEUES = int(os.environ.get('RATE_LIMIT_MAX_REQUEUES', 20))
+
+# Per-integration circuit breaker (see integrations.ebay.client): opens after
+# this many consecutive failed calls, then probes once per reset period while
+# the integration's work waits in the queue
+EBAY_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('EBAY_CIRCUIT_FAILURE_THRESHOLD', 5))
+EBAY_CIRCUIT_RESET_SECONDS = int(os.environ.get('EBAY_CIRCUIT_RESET_SECONDS', 60))
+
+# Adaptive poll cadence: each integration is polled about once per
+# EBAY_POLL_TARGET_ORDERS sales over the velocity window, within the interval
+# bounds (seconds). A claimed integration isn't dispatched again for
+# EBAY_POLL_CLAIM_SECONDS unless its poll reschedules it first.
+EBAY_POLL_MIN_INTERVAL = int(os.environ.get('EBAY_POLL_MIN_INTERVAL', 120))
+EBAY_POLL_MAX_INTERVAL = int(os.environ.get('EBAY_POLL_MAX_INTERVAL', 1800))
+EBAY_POLL_TARGET_ORDERS = float(os.environ.get('EBAY_POLL_TARGET_ORDERS', 1))
+EBAY_POLL_VELOCITY_WINDOW_HOURS = int(os.environ.get('EBAY_POLL_VELOCITY_WINDOW_HOURS', 24))
+EBAY_POLL_CLAIM_SECONDS = int(os.environ.get('EBAY_POLL_CLAIM_SECONDS', 600))
+
+# Each order poll starts this far before the newest order creationDate seen,
+# to catch orders that become visible on eBay's side late
+EBAY_POLL_CURSOR_OVERLAP_SECONDS = int(os.environ.get('EBAY_POLL_CURSOR_OVERLAP_SECONDS', 120))
+
+# Leases (see core.locks) held per integration while a poll or reconciliation
+# runs; overlapping runs of the same job are skipped. Renewed while work continues.
+EBAY_POLL_LEASE_SECONDS = int(os.environ.get('EBAY_POLL_LEASE_SECONDS', 300))
+EBAY_RECONCILE_LEASE_SECONDS = int(os.environ.get('EBAY_RECONCILE_LEASE_SECONDS', 900))
+
+# Orders fetched per getOrders page (eBay allows at most 200)
+EBAY_ORDER_PAGE_SIZE = int(os.environ.get('EBAY_ORDER_PAGE_SIZE', 100))
+
+# Reconciliation pages through getInventoryItems (eBay allows at most 200 per
+# page) and compares the items against our listings and lots in chunks
+EBAY_INVENTORY_PAGE_SIZE = int(os.environ.get('EBAY_INVENTORY_PAGE_SIZE', 200))
+RECONCILE_CHUNK_SIZE = int(os.environ.get('RECONCILE_CHUNK_SIZE', 500))
+
+# Order polling: concurrent fetches per poll cycle, and how long a fetch may
+# wait on our own rate limit budget before skipping the integration this cycle
+EBAY_POLL_CONCURRENCY = int(os.environ.get('EBAY_POLL_CONCURRENCY', 50))
+EBAY_POLL_MAX_RATE_WAIT = float(os.environ.get('EBAY_POLL_MAX_RATE_WAIT', 30))
+
+# Proactive token refresh (refresh_expiring_tokens runs every 30 minutes, so the
+# window must cover the interval plus the 5 minute inline refresh margin)
+EBAY_TOKEN_REFRESH_WINDOW_MINUTES = int(os.environ.get('EBAY_TOKEN_REFRESH_WINDOW_MINUTES', 45))
+EBAY_TOKEN_REFRESH_CONCURRENCY = int(os.environ.get('EBAY_TOKEN_REFRESH_CONCURRENCY', 8))
+
+# SyncJob audit records are buffered per worker process and bulk inserted
+# (see apps.channels.services.sync_audit). Successful jobs can be sampled;
+# failures are always kept. Records older than the retention are pruned daily.
+SYNC_JOB_BUFFER_SIZE = int(os.environ.get('SYNC_JOB_BUFFER_SIZE', 200))
+SYNC_JOB_FLUSH_INTERVAL = float(os.environ.get('SYNC_JOB_FLUSH_INTERVAL', 5))
+SYNC_JOB_SUCCESS_SAMPLE_RATE = float(os.environ.get('SYNC_JOB_SUCCESS_SAMPLE_RATE', 1.0))
+SYNC_JOB_RETENTION_DAYS = int(os.environ.get('SYNC_JOB_RETENTION_DAYS', 30))
+SYNC_JOB_PRUNE_CHUNK = 5000
+
+# Per-integration sync latency/error counters, aggregated per worker process
+# into SYNC_METRICS_BUCKET_SECONDS buckets (see apps.channels.services.sync_metrics).
+# The Prometheus export at /api/channels/metrics/ is disabled unless
+# METRICS_TOKEN is set, and then requires it as a bearer token.
+SYNC_METRICS_BUCKET_SECONDS = int(os.environ.get('SYNC_METRICS_BUCKET_SECONDS', 300))
+SYNC_METRICS_FLUSH_INTERVAL = float(os.environ.get('SYNC_METRICS_FLUSH_INTERVAL', 10))
+SYNC_METRICS_RETENTION_DAYS = int(os.environ.get('SYNC_METRICS_RETENTION_DAYS', 30))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Bloom filter of recently recorded provider event ids per integration, used to
+# skip duplicate checks for ids that are certainly new. 2**20 bits (128 KB) per
+# period keeps false positives near 1% up to ~100k line items a day.
+PROVIDER_EVENT_FILTER_BITS = int(os.environ.get('PROVIDER_EVENT_FILTER_BITS', 2 ** 20))
+PROVIDER_EVENT_FILTER_HASHES = 7
+PROVIDER_EVENT_FILTER_PERIOD = int(os.environ.get('PROVIDER_EVENT_FILTER_PERIOD', 24 * 3600))
+
+# Outbound quantity sync: changes are recorded in an outbox table and drained
+# by dispatch_outbox once per debounce window, so changes within it coalesce
+# into a single bulk push per integration (see apps.channels.services.outbound)
+CHANNEL_PUSH_DEBOUNCE_SECONDS = int(os.environ.get('CHANNEL_PUSH_DEBOUNCE_SECONDS', 5))
+OUTBOX_DISPATCH_BATCH_SIZE = int(os.environ.get('OUTBOX_DISPATCH_BATCH_SIZE', 500))
+
 # Encrypted Model Fields
 FIELD_ENCRYPTION_KEY = os.environ.get('FIELD_ENCRYPTION_KEY', 'xK_0J6N1y8Fv7b5zB-YV3E4Hw9RmW_TqX2aPcDdG_Uo=')
 
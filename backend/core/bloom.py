@@ -0,0 +1,79 @@
+import hashlib
+import logging
+import time
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+class RecentBloomFilter:
+    """
+    Redis-backed Bloom filter of the values added over roughly the last two
+    `period`s (seconds). Values are added to the current period's bitmap and
+    looked up in the current and previous one, so old values age out without
+    ever clearing a live bitmap.
+    A Bloom filter never misses a value it holds, but may claim to hold one it
+    doesn't (about 1% of the time at `bits` = 10 x values per period with 7
+    hashes). "Not present" is therefore certain and "present" is only a maybe.
+    If Redis is unreachable every value counts as a maybe, so callers fall back
+    to their authoritative check.
+    """
+    def __init__(self, name, bits, hashes, period):
+        self.name = name
+        self.bits = bits
+        self.hashes = hashes
+        self.period = period
+
+    def _keys(self):
+        current = int(time.time() // self.period)
+        return f"bloom_{self.name}_{current}", f"bloom_{self.name}_{current - 1}"
+
+    def _offsets(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def might_contain(self, values):
+        """
+        Returns the subset of `values` that may have been added before.
+        Everything else was definitely never added (within the window).
+        """
+        values = list(values)
+        if not values:
+            return set()
+        keys = self._keys()
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for value in values:
+                for key in keys:
+                    for offset in self._offsets(value):
+                        pipe.getbit(key, offset)
+            bits = pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Bloom filter {self.name} unavailable, treating all values as seen: {e}")
+            return set(values)
+
+        maybe = set()
+        per_key = self.hashes
+        per_value = per_key * len(keys)
+        for index, value in enumerate(values):
+            value_bits = bits[index * per_value:(index + 1) * per_value]
+            if any(all(value_bits[k * per_key:(k + 1) * per_key]) for k in range(len(keys))):
+                maybe.add(value)
+        return maybe
+
+    def add(self, values):
+        values = list(values)
+        if not values:
+            return
+        key = self._keys()[0]
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for value in values:
+                for offset in self._offsets(value):
+                    pipe.setbit(key, offset, 1)
+            pipe.expire(key, self.period * 2)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Could not add to bloom filter {self.name}: {e}")
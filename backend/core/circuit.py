@@ -0,0 +1,163 @@
+import logging
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Breaker state lives in one hash: 'failures' (consecutive), 'opened_at' while
+# open and 'probe_at' once a half-open probe has been let through. 'kind' and
+# 'kind_failures' track the current run of failures of one kind (see
+# record_failure). Times come from the Redis server clock so all hosts agree.
+
+# Returns {allowed, seconds until the next probe, failures so far, probe id}.
+# An open breaker lets a single call through as the probe once `reset`
+# seconds have passed, then waits another `reset` for that probe's outcome.
+# The probe id ('' for other calls) lets the caller give the probe back.
+ALLOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'failures', 'opened_at', 'probe_at')
+local failures = tonumber(state[1]) or 0
+local opened_at = tonumber(state[2])
+if opened_at == nil then
+    return {1, '0', failures, ''}
+end
+local reset = tonumber(ARGV[1])
+local wait_until = opened_at + reset
+local probe_at = tonumber(state[3])
+if probe_at ~= nil then
+    wait_until = math.max(wait_until, probe_at + reset)
+end
+if now < wait_until then
+    return {0, tostring(wait_until - now), failures, ''}
+end
+local probe = string.format('%.6f', now)
+redis.call('HSET', KEYS[1], 'probe_at', probe)
+return {1, '0', failures, probe}
+"""
+
+# Gives back a probe that was never made, unless a newer one was let through
+RELEASE_PROBE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'probe_at') == ARGV[1] then
+    redis.call('HDEL', KEYS[1], 'probe_at')
+end
+return 0
+"""
+
+# Counts a failure. Opens the breaker at `threshold` consecutive failures; a
+# failure while open (a failed probe) restarts the wait. ARGV[3] is the
+# failure's kind, or '' for none; a failure of another kind ends the current
+# run of that kind. Returns {1 only when this failure opened the breaker,
+# consecutive failures of this kind}.
+FAILURE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+local opened = 0
+if redis.call('HEXISTS', KEYS[1], 'opened_at') == 1 then
+    redis.call('HSET', KEYS[1], 'opened_at', now)
+    redis.call('HDEL', KEYS[1], 'probe_at')
+elseif failures >= tonumber(ARGV[1]) then
+    redis.call('HSET', KEYS[1], 'opened_at', now)
+    opened = 1
+end
+local kind_failures = 0
+if ARGV[3] == '' then
+    redis.call('HDEL', KEYS[1], 'kind', 'kind_failures')
+elseif redis.call('HGET', KEYS[1], 'kind') == ARGV[3] then
+    kind_failures = redis.call('HINCRBY', KEYS[1], 'kind_failures', 1)
+else
+    redis.call('HSET', KEYS[1], 'kind', ARGV[3], 'kind_failures', 1)
+    kind_failures = 1
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {opened, kind_failures}
+"""
+
+# Failure counts of a breaker that sees no calls are forgotten after this long
+STATE_TTL = 24 * 3600
+
+class CircuitBreaker:
+    """
+    Redis-backed circuit breaker shared by every process. Opens after
+    `failure_threshold` consecutive failures and then refuses calls; after
+    `reset_timeout` seconds one call is let through as a probe (half-open).
+    A successful probe closes the breaker, a failed one keeps it open for
+    another `reset_timeout`.
+    If Redis is unreachable the breaker fails open (allows every call), like
+    TokenBucket.
+    """
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.key = f"circuit_{name}"
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # Whether the last allow() saw state a success has to clear
+        self._dirty = True
+        # Set while the call the last allow() let through is the probe
+        self._probe = None
+
+    def allow(self):
+        """
+        Returns (allowed, retry_after) where retry_after is the number of
+        seconds until the next probe.
+        """
+        self._probe = None
+        try:
+            allowed, wait, failures, probe = get_redis().eval(ALLOW_SCRIPT, 1, self.key, self.reset_timeout)
+        except RedisError as e:
+            logger.warning(f"Circuit breaker {self.key} unavailable, allowing call: {e}")
+            return True, 0
+        self._dirty = bool(failures) or not allowed
+        self._probe = probe or None
+        return bool(allowed), float(wait)
+
+    def release_probe(self):
+        """
+        Called when the call allow() let through is abandoned before it was
+        made (e.g. our own rate limit refused it). If it was the half-open
+        probe, the next call may probe instead of waiting another
+        `reset_timeout` for an outcome that will never come.
+        """
+        probe, self._probe = self._probe, None
+        if probe is None:
+            return
+        try:
+            get_redis().eval(RELEASE_PROBE_SCRIPT, 1, self.key, probe)
+        except RedisError as e:
+            logger.warning(f"Could not release probe of circuit breaker {self.key}: {e}")
+
+    def record_success(self):
+        """
+        Closes the breaker and clears the failure count. Skips the Redis call
+        when the last allow() saw a clean breaker.
+        """
+        self._probe = None
+        if not self._dirty:
+            return
+        self.reset()
+
+    def record_failure(self, kind=None):
+        """
+        Counts a failure. `kind` optionally names what went wrong, so a caller
+        can react to a run of one kind of failure without counting the others.
+        Returns (opened, kind_failures): whether this failure opened the
+        breaker, and how many failures of `kind` happened in a row (0 without
+        a kind).
+        """
+        self._dirty = True
+        self._probe = None
+        try:
+            opened, kind_failures = get_redis().eval(
+                FAILURE_SCRIPT, 1, self.key, self.failure_threshold, STATE_TTL, kind or ''
+            )
+        except RedisError as e:
+            logger.warning(f"Could not record failure on circuit breaker {self.key}: {e}")
+            return False, 0
+        return bool(opened), int(kind_failures)
+
+    def reset(self):
+        try:
+            get_redis().delete(self.key)
+        except RedisError as e:
+            logger.warning(f"Could not reset circuit breaker {self.key}: {e}")
+        self._dirty = False
@@ -0,0 +1,116 @@
+import logging
+import time
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Takes the lease if nobody holds it. Every grant gets the next value of a
+# per-lease counter as its fencing token, so a holder whose lease expired can
+# always tell that a newer holder exists.
+ACQUIRE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return false
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('SET', KEYS[1], token, 'PX', ARGV[1])
+return token
+"""
+
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class Lease:
+    """
+    Redis-backed mutual-exclusion lease that expires after `ttl` seconds
+    unless renewed. Each acquisition gets a fencing token (a number that
+    increases with every grant). A holder calls is_valid() before committing
+    results, which fails once the lease has expired or passed to someone else.
+    If Redis is unreachable the lease fails open, like TokenBucket, so
+    coordination trouble delays nothing.
+    """
+    def __init__(self, name, ttl):
+        self.key = f"lease_{name}"
+        self.fence_key = f"lease_fence_{name}"
+        self.ttl = ttl
+        self.token = None
+        self.acquired = False
+        self._renewed_at = None
+
+    def acquire(self):
+        try:
+            token = get_redis().eval(ACQUIRE_SCRIPT, 2, self.key, self.fence_key, int(self.ttl * 1000))
+        except RedisError as e:
+            logger.warning(f"Lease {self.key} unavailable, proceeding without it: {e}")
+            self.acquired = True
+            return True
+        if token is None:
+            return False
+        self.token = int(token)
+        self.acquired = True
+        self._renewed_at = time.monotonic()
+        return True
+
+    def renew(self):
+        """
+        Extends the lease by another `ttl`. Returns False if it was lost.
+        """
+        if self.token is None:
+            return self.acquired
+        try:
+            renewed = get_redis().eval(RENEW_SCRIPT, 1, self.key, self.token, int(self.ttl * 1000))
+        except RedisError as e:
+            logger.warning(f"Could not renew lease {self.key}: {e}")
+            return True
+        self._renewed_at = time.monotonic()
+        return bool(renewed)
+
+    def renew_if_due(self):
+        """
+        Renews once half the ttl has passed since the last renewal, so long
+        loops can call this on every iteration.
+        """
+        if self._renewed_at is not None and time.monotonic() - self._renewed_at >= self.ttl / 2:
+            return self.renew()
+        return True
+
+    def is_valid(self):
+        """
+        True while this holder's fencing token is still the current one.
+        """
+        if self.token is None:
+            return self.acquired
+        try:
+            current = get_redis().get(self.key)
+        except RedisError as e:
+            logger.warning(f"Could not check lease {self.key}: {e}")
+            return True
+        return current is not None and int(current) == self.token
+
+    def release(self):
+        if self.token is not None:
+            try:
+                get_redis().eval(RELEASE_SCRIPT, 1, self.key, self.token)
+            except RedisError as e:
+                logger.warning(f"Could not release lease {self.key}, it will expire: {e}")
+        self.token = None
+        self.acquired = False
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.acquired:
+            self.release()
@@ -0,0 +1,89 @@
+import logging
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Refills each bucket in KEYS from the time elapsed since its last call, then
+# takes `cost` tokens from all of them, or from none if any is short, so a
+# refusal by one bucket never costs another its tokens. ARGV holds the cost
+# followed by a capacity and refill rate per key. Uses the Redis server clock
+# so all hosts agree on time.
+# Returns {allowed, seconds until every bucket has `cost` tokens}.
+TOKEN_BUCKET_SCRIPT = """
+local cost = tonumber(ARGV[1])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1])
+    local ts = tonumber(bucket[2])
+    if tokens == nil or ts == nil then
+        tokens = capacity
+        ts = now
+    end
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+    levels[i] = tokens
+end
+
+local allowed = 0
+if wait == 0 then
+    allowed = 1
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local tokens = levels[i]
+    if allowed == 1 then
+        tokens = tokens - cost
+    end
+    redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {allowed, tostring(wait)}
+"""
+
+def consume_all(buckets, cost=1):
+    """
+    Takes `cost` tokens from every bucket in one atomic step, or from none of
+    them if any bucket is short. Use it where a call counts against several
+    budgets at once. Returns (allowed, retry_after) like TokenBucket.consume,
+    retry_after being the wait for the slowest bucket.
+    """
+    keys = [bucket.key for bucket in buckets]
+    limits = []
+    for bucket in buckets:
+        limits += [bucket.capacity, bucket.refill_rate]
+    try:
+        allowed, wait = get_redis().eval(TOKEN_BUCKET_SCRIPT, len(keys), *keys, cost, *limits)
+    except RedisError as e:
+        logger.warning(f"Token buckets {', '.join(keys)} unavailable, allowing request: {e}")
+        return True, 0
+    return bool(allowed), float(wait)
+
+class TokenBucket:
+    """
+    Redis-backed token bucket shared by every process.
+    `capacity` is the burst size and `refill_rate` the tokens added per second.
+    If Redis is unreachable the bucket fails open, so rate limiting never
+    takes the API down with it.
+    """
+    def __init__(self, key, capacity, refill_rate):
+        self.key = f"token_bucket_{key}"
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+
+    def consume(self, cost=1):
+        """
+        Takes `cost` tokens if available.
+        Returns (allowed, retry_after) where retry_after is in seconds.
+        """
+        return consume_all([self], cost)
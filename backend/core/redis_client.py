@@ -0,0 +1,19 @@
+import redis
+from django.conf import settings
+
+_client = None
+
+def get_redis():
+    """
+    Returns the process-wide Redis client used for shared coordination state
+    (rate limits, locks). redis-py resets its pool after a fork, so the client
+    is safe to create before Celery forks its workers.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 1.0),
+            socket_connect_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 1.0),
+        )
+    return _client
@@ -0,0 +1,37 @@
+import logging
+import math
+import random
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Message header counting how often an invocation has been re-queued
+REQUEUE_HEADER = 'rate_limit_requeues'
+
+def requeue_after_rate_limit(task, exc, **kwargs):
+    """
+    Re-queues the current task invocation once the rate limit has cleared,
+    instead of sleeping in the worker slot. Jittered so throttled tasks don't
+    all come back at the same instant. Does not count as a failed attempt.
+    The invocation goes back to the queue it came from. `kwargs` replace the
+    invocation's keyword arguments, e.g. to resume where it stopped.
+    An invocation is re-queued at most RATE_LIMIT_MAX_REQUEUES times; after
+    that it's dropped and its work is left to the next periodic run.
+    Returns whether it was re-queued.
+    """
+    requeues = (task.request.headers or {}).get(REQUEUE_HEADER, 0)
+    if requeues >= settings.RATE_LIMIT_MAX_REQUEUES:
+        logger.warning(f"{task.name} still rate limited after {requeues} re-queues, giving up")
+        return False
+    countdown = math.ceil(exc.retry_after) + random.uniform(0, 1)
+    logger.info(f"{task.name} rate limited, re-queued in {countdown:.1f}s")
+    options = {}
+    queue = (task.request.delivery_info or {}).get('routing_key')
+    if queue:
+        options['queue'] = queue
+    task_kwargs = dict(task.request.kwargs or {}, **kwargs)
+    task.apply_async(
+        args=task.request.args, kwargs=task_kwargs, countdown=countdown,
+        headers={REQUEUE_HEADER: requeues + 1}, **options
+    )
+    return True
@@ -0,0 +1,16 @@
+from unittest import mock
+import fakeredis
+from core import redis_client
+
+
+class FakeRedisMixin:
+    """
+    Test case mixin that points get_redis() at a fresh in-memory Redis for
+    each test. Set self.server.connected = False to simulate an outage.
+    """
+    def setUp(self):
+        super().setUp()
+        self.server = fakeredis.FakeServer()
+        patcher = mock.patch.object(redis_client, '_client', fakeredis.FakeRedis(server=self.server))
+        patcher.start()
+        self.addCleanup(patcher.stop)
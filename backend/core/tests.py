@@ -0,0 +1,277 @@
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from core import redis_client
+from core.bloom import RecentBloomFilter
+from core.circuit import CircuitBreaker
+from core.locks import Lease
+from core.ratelimit import TokenBucket, consume_all
+from core.requeue import REQUEUE_HEADER, requeue_after_rate_limit
+from core.testing import FakeRedisMixin
+
+
+class RecentBloomFilterTests(FakeRedisMixin, SimpleTestCase):
+    def make_filter(self):
+        return RecentBloomFilter('test', bits=2 ** 16, hashes=7, period=3600)
+
+    def test_added_values_might_be_contained(self):
+        bloom = self.make_filter()
+        added = [f"event_{n}" for n in range(100)]
+        bloom.add(added)
+        self.assertEqual(bloom.might_contain(added), set(added))
+
+    def test_values_never_added_are_absent(self):
+        bloom = self.make_filter()
+        bloom.add(f"event_{n}" for n in range(100))
+        self.assertEqual(bloom.might_contain(f"other_{n}" for n in range(100)), set())
+
+    def test_empty_input(self):
+        bloom = self.make_filter()
+        bloom.add([])
+        self.assertEqual(bloom.might_contain([]), set())
+
+    def test_values_age_out_after_two_periods(self):
+        bloom = self.make_filter()
+        with mock.patch('core.bloom.time.time', return_value=10 * 3600):
+            bloom.add(['event_1'])
+        with mock.patch('core.bloom.time.time', return_value=11 * 3600):
+            self.assertEqual(bloom.might_contain(['event_1']), {'event_1'})
+        with mock.patch('core.bloom.time.time', return_value=12 * 3600):
+            self.assertEqual(bloom.might_contain(['event_1']), set())
+
+    def test_unreachable_redis_treats_everything_as_seen(self):
+        bloom = self.make_filter()
+        self.server.connected = False
+        with self.assertLogs('core.bloom', 'WARNING'):
+            bloom.add(['event_1'])
+            self.assertEqual(bloom.might_contain(['event_1', 'event_2']), {'event_1', 'event_2'})
+
+
+class TokenBucketTests(FakeRedisMixin, SimpleTestCase):
+    def rewind(self, bucket, seconds):
+        # Moves the bucket's last refill back as if `seconds` had passed
+        redis = redis_client.get_redis()
+        redis.hset(bucket.key, 'ts', float(redis.hget(bucket.key, 'ts')) - seconds)
+
+    def test_allows_a_burst_up_to_capacity(self):
+        bucket = TokenBucket('test', capacity=3, refill_rate=0.5)
+        for _ in range(3):
+            self.assertEqual(bucket.consume(), (True, 0.0))
+        allowed, retry_after = bucket.consume()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 2, delta=0.1)
+
+    def test_refills_over_time(self):
+        bucket = TokenBucket('test', capacity=3, refill_rate=0.5)
+        bucket.consume(3)
+        self.rewind(bucket, 4)
+        self.assertTrue(bucket.consume(2)[0])
+        self.assertFalse(bucket.consume()[0])
+
+    def test_refusal_by_one_bucket_costs_the_others_nothing(self):
+        shop = TokenBucket('shop', capacity=1, refill_rate=1)
+        app = TokenBucket('app', capacity=5, refill_rate=1)
+        self.assertTrue(consume_all([shop, app])[0])
+        for _ in range(3):
+            self.assertFalse(consume_all([shop, app])[0])
+        self.assertAlmostEqual(float(redis_client.get_redis().hget(app.key, 'tokens')), 4, delta=0.1)
+
+    def test_unreachable_redis_allows_the_call(self):
+        self.server.connected = False
+        with self.assertLogs('core.ratelimit', 'WARNING'):
+            self.assertEqual(TokenBucket('test', capacity=1, refill_rate=1).consume(5), (True, 0))
+
+
+class RequeueTests(SimpleTestCase):
+    def make_task(self, requeues=0):
+        task = mock.Mock()
+        task.name = 'test_task'
+        task.request.args = (1,)
+        task.request.kwargs = {'offset': 0, 'full': True}
+        task.request.headers = {REQUEUE_HEADER: requeues} if requeues else None
+        task.request.delivery_info = {'routing_key': 'channel_sales'}
+        return task
+
+    def test_requeues_on_the_same_queue_after_the_wait(self):
+        task = self.make_task()
+        self.assertTrue(requeue_after_rate_limit(task, mock.Mock(retry_after=2.5), offset=40))
+        options = task.apply_async.call_args.kwargs
+        self.assertEqual(options['args'], (1,))
+        self.assertEqual(options['kwargs'], {'offset': 40, 'full': True})
+        self.assertEqual(options['queue'], 'channel_sales')
+        self.assertGreaterEqual(options['countdown'], 3)
+        self.assertLess(options['countdown'], 4)
+        self.assertEqual(options['headers'], {REQUEUE_HEADER: 1})
+
+    def test_counts_requeues(self):
+        task = self.make_task(requeues=4)
+        requeue_after_rate_limit(task, mock.Mock(retry_after=1))
+        self.assertEqual(task.apply_async.call_args.kwargs['headers'], {REQUEUE_HEADER: 5})
+
+    @override_settings(RATE_LIMIT_MAX_REQUEUES=3)
+    def test_gives_up_after_max_requeues(self):
+        task = self.make_task(requeues=3)
+        with self.assertLogs('core.requeue', 'WARNING'):
+            self.assertFalse(requeue_after_rate_limit(task, mock.Mock(retry_after=1)))
+        task.apply_async.assert_not_called()
+
+
+class LeaseTests(FakeRedisMixin, SimpleTestCase):
+    def expire(self, lease):
+        redis_client.get_redis().delete(lease.key)
+
+    def test_only_one_holder(self):
+        first, second = Lease('job', ttl=60), Lease('job', ttl=60)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+
+    def test_newer_holder_fences_out_expired_one(self):
+        old, new = Lease('job', ttl=60), Lease('job', ttl=60)
+        old.acquire()
+        self.expire(old)
+        self.assertTrue(new.acquire())
+        self.assertGreater(new.token, old.token)
+        self.assertFalse(old.is_valid())
+        self.assertFalse(old.renew())
+        # The expired holder's release leaves the new lease alone
+        old.release()
+        self.assertTrue(new.is_valid())
+
+    def test_renew_if_due_waits_for_half_the_ttl(self):
+        lease = Lease('job', ttl=60)
+        lease.acquire()
+        with mock.patch.object(lease, 'renew') as renew:
+            self.assertTrue(lease.renew_if_due())
+            renew.assert_not_called()
+            lease._renewed_at -= 31
+            lease.renew_if_due()
+            renew.assert_called_once()
+
+    def test_context_manager_releases(self):
+        with Lease('job', ttl=60) as lease:
+            self.assertTrue(lease.acquired)
+        self.assertTrue(Lease('job', ttl=60).acquire())
+
+    def test_unreachable_redis_fails_open(self):
+        self.server.connected = False
+        lease = Lease('job', ttl=60)
+        with self.assertLogs('core.locks', 'WARNING'):
+            self.assertTrue(lease.acquire())
+        self.assertTrue(lease.is_valid())
+        self.assertTrue(lease.renew())
+
+
+class CircuitBreakerTests(FakeRedisMixin, SimpleTestCase):
+    def make_breaker(self):
+        return CircuitBreaker('test', failure_threshold=3, reset_timeout=60)
+
+    def open_breaker(self, breaker):
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+    def wait_out(self, breaker, field='opened_at'):
+        # Moves the breaker's clock reading back past reset_timeout
+        redis = redis_client.get_redis()
+        redis.hset(breaker.key, field, float(redis.hget(breaker.key, field)) - breaker.reset_timeout - 1)
+
+    def test_opens_at_threshold(self):
+        breaker = self.make_breaker()
+        self.assertEqual(breaker.record_failure(), (False, 0))
+        self.assertEqual(breaker.record_failure(), (False, 0))
+        self.assertEqual(breaker.allow(), (True, 0.0))
+        self.assertEqual(breaker.record_failure(), (True, 0))
+        allowed, retry_after = breaker.allow()
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 55)
+
+    def test_success_resets_the_count(self):
+        breaker = self.make_breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        self.assertEqual(breaker.record_failure(), (False, 0))
+        self.assertTrue(breaker.allow()[0])
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = self.make_breaker()
+        self.open_breaker(breaker)
+        self.wait_out(breaker)
+        self.assertTrue(breaker.allow()[0])
+        self.assertFalse(breaker.allow()[0])
+
+    def test_failed_probe_keeps_it_open(self):
+        breaker = self.make_breaker()
+        self.open_breaker(breaker)
+        self.wait_out(breaker)
+        breaker.allow()
+        # Failures while open never report opening it again
+        self.assertEqual(breaker.record_failure(), (False, 0))
+        allowed, retry_after = breaker.allow()
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 55)
+
+    def test_successful_probe_closes_it(self):
+        breaker = self.make_breaker()
+        self.open_breaker(breaker)
+        self.wait_out(breaker)
+        breaker.allow()
+        breaker.record_success()
+        self.assertTrue(breaker.allow()[0])
+        self.assertTrue(breaker.allow()[0])
+
+    def test_probe_that_never_reports_is_retried_after_reset_timeout(self):
+        breaker = self.make_breaker()
+        self.open_breaker(breaker)
+        self.wait_out(breaker)
+        breaker.allow()
+        self.wait_out(breaker, 'probe_at')
+        self.assertTrue(breaker.allow()[0])
+
+    def test_released_probe_lets_the_next_call_probe(self):
+        breaker = self.make_breaker()
+        self.open_breaker(breaker)
+        self.wait_out(breaker)
+        self.assertTrue(breaker.allow()[0])
+        breaker.release_probe()
+        self.assertTrue(self.make_breaker().allow()[0])
+
+    def test_stale_release_leaves_a_newer_probe_alone(self):
+        breaker, other = self.make_breaker(), self.make_breaker()
+        self.open_breaker(breaker)
+        self.wait_out(breaker)
+        breaker.allow()
+        self.wait_out(breaker, 'probe_at')
+        self.assertTrue(other.allow()[0])
+        breaker.release_probe()
+        self.assertFalse(self.make_breaker().allow()[0])
+
+    def test_release_without_a_probe_does_nothing(self):
+        breaker = self.make_breaker()
+        breaker.allow()
+        with mock.patch.object(redis_client.get_redis(), 'eval') as eval_script:
+            breaker.release_probe()
+        eval_script.assert_not_called()
+
+    def test_counts_consecutive_failures_of_one_kind(self):
+        breaker = self.make_breaker()
+        self.assertEqual(breaker.record_failure(kind='unauthorized')[1], 1)
+        self.assertEqual(breaker.record_failure(kind='unauthorized')[1], 2)
+        self.assertEqual(breaker.record_failure()[1], 0)
+        self.assertEqual(breaker.record_failure(kind='unauthorized')[1], 1)
+        breaker.record_success()
+        self.assertEqual(breaker.record_failure(kind='unauthorized')[1], 1)
+
+    def test_clean_breaker_skips_the_success_write(self):
+        breaker = self.make_breaker()
+        breaker.allow()
+        with mock.patch.object(breaker, 'reset') as reset:
+            breaker.record_success()
+        reset.assert_not_called()
+
+    def test_unreachable_redis_fails_open(self):
+        breaker = self.make_breaker()
+        self.server.connected = False
+        with self.assertLogs('core.circuit', 'WARNING'):
+            self.assertEqual(breaker.allow(), (True, 0))
+            self.assertEqual(breaker.record_failure(), (False, 0))
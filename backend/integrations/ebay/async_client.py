@@ -0,0 +1,163 @@
+import asyncio
+import contextlib
+import time
+from dataclasses import dataclass
+from urllib.parse import urljoin
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .auth import invalidate_cached_token
+from .client import EbayClient, EbayRateLimited, ORDERS_ENDPOINT, build_order_params
+
+class AsyncEbayClient(EbayClient):
+    """
+    Async counterpart of EbayClient for fanning out read calls across many
+    integrations from one worker. Shares the sync client's base URL and rate
+    limit buckets. The access token is resolved in sync code, since refreshing
+    it writes to the database (see poll_orders_concurrently).
+    """
+    def __init__(self, integration, access_token, http):
+        super().__init__(integration)
+        self.access_token = access_token
+        self.http = http
+        # Time spent waiting on eBay's responses, excluding our own rate limit waits
+        self.request_seconds = 0.0
+
+    async def _acquire_rate_limit_async(self):
+        # Waiting on our own budget is cheap here: it parks a coroutine, not a
+        # worker slot. Give up after EBAY_POLL_MAX_RATE_WAIT seconds.
+        waited = 0
+        while True:
+            try:
+                return await asyncio.to_thread(self._acquire_rate_limit)
+            except EbayRateLimited as e:
+                if waited + e.retry_after > settings.EBAY_POLL_MAX_RATE_WAIT:
+                    raise
+                waited += e.retry_after
+                await asyncio.sleep(e.retry_after)
+
+    async def _request(self, method, endpoint, **kwargs):
+        """
+        Base async request handler. Raises EbayRateLimited when eBay returns 429
+        and EbayCircuitOpen while the integration's circuit breaker is open.
+        """
+        url = urljoin(self.base_url, endpoint)
+        await asyncio.to_thread(self._check_circuit)
+        try:
+            await self._acquire_rate_limit_async()
+        except EbayRateLimited:
+            # Never sent, so it can't count as the breaker's probe
+            await asyncio.to_thread(self.circuit.release_probe)
+            raise
+
+        headers = kwargs.pop('headers', {})
+        headers['Authorization'] = f"Bearer {self.access_token}"
+        headers['Content-Type'] = 'application/json'
+
+        started = time.monotonic()
+        try:
+            response = await self.http.request(method, url, headers=headers, **kwargs)
+        except httpx.TransportError:
+            await sync_to_async(self._record_outcome)(None)
+            raise
+        finally:
+            self.request_seconds += time.monotonic() - started
+        await sync_to_async(self._record_outcome)(response.status_code)
+
+        if response.status_code == 401:
+            invalidate_cached_token(self.integration.id)
+        if response.status_code == 429: # Too Many Requests
+            retry_after = int(response.headers.get('Retry-After', 5))
+            raise EbayRateLimited(retry_after, message="eBay returned 429")
+
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    async def get_orders(self, created_time_from=None, created_time_to=None, page_size=None):
+        """
+        Fetches the first page of orders from the eBay Fulfillment API.
+        """
+        params = build_order_params(created_time_from, created_time_to, page_size)
+        return await self._request('GET', ORDERS_ENDPOINT, params=params)
+
+    async def iter_order_pages(self, created_time_from=None, created_time_to=None, page_size=None, semaphore=None):
+        """
+        Async counterpart of EbayClient.iter_order_pages. When a semaphore is
+        given it is held only while a page is being fetched, so one
+        integration with many pages doesn't hold a slot while its orders are
+        handled.
+        """
+        semaphore = semaphore or contextlib.nullcontext()
+        async with semaphore:
+            response = await self.get_orders(created_time_from, created_time_to, page_size)
+        while response:
+            orders = response.get('orders') or []
+            if orders:
+                yield orders
+            next_url = response.get('next')
+            if not next_url or not orders:
+                break
+            async with semaphore:
+                response = await self._request('GET', next_url)
+
+@dataclass
+class OrderPollJob:
+    integration: object
+    # None until poll_orders_concurrently resolves it
+    access_token: str
+    created_time_from: str
+    created_time_to: str = None
+    # Caller's poll state, passed back to the callbacks untouched
+    cursor: object = None
+    # Seconds the job's eBay calls took, set before on_complete is called
+    fetch_seconds: float = 0.0
+
+def _build_http_client(concurrency):
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        timeout=httpx.Timeout(settings.EBAY_HTTP_READ_TIMEOUT, connect=settings.EBAY_HTTP_CONNECT_TIMEOUT),
+        transport=httpx.AsyncHTTPTransport(retries=settings.EBAY_HTTP_MAX_RETRIES),
+    )
+
+async def poll_orders_concurrently(jobs, on_page, on_complete, concurrency=None, resolve_token=None):
+    """
+    Fetches orders for every job at once, with at most `concurrency` calls in
+    flight. A job without an access token gets one from
+    `resolve_token(integration)`, called in a worker thread as part of the
+    job, so a slow token refresh holds up only its own integration; a failure
+    there is reported to on_complete like a failed fetch. Each page is handed
+    to `on_page(job, orders)` as soon as it arrives, and
+    `on_complete(job, error)` is called once a job's last page has been
+    handled or its fetch failed. Both callbacks are sync, so they run
+    through sync_to_async and may use the ORM. A poll cycle therefore takes
+    about as long as the slowest integration's pages.
+    Each job's fetch_seconds counts only its own eBay calls, not the time it
+    spent waiting for a semaphore slot, the rate limit or its callbacks.
+    """
+    concurrency = concurrency or settings.EBAY_POLL_CONCURRENCY
+    semaphore = asyncio.Semaphore(concurrency)
+    handle_page = sync_to_async(on_page)
+    handle_complete = sync_to_async(on_complete)
+    # Not thread-sensitive: token refreshes run side by side, not one at a time
+    get_token = sync_to_async(resolve_token, thread_sensitive=False) if resolve_token else None
+
+    async with _build_http_client(concurrency) as http:
+        async def poll(job):
+            client = None
+            try:
+                if job.access_token is None:
+                    async with semaphore:
+                        job.access_token = await get_token(job.integration)
+                client = AsyncEbayClient(job.integration, job.access_token, http)
+                pages = client.iter_order_pages(job.created_time_from, job.created_time_to, semaphore=semaphore)
+                async for orders in pages:
+                    await handle_page(job, orders)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            if client is not None:
+                job.fetch_seconds = client.request_seconds
+            await handle_complete(job, error)
+
+        await asyncio.gather(*(poll(job) for job in jobs))
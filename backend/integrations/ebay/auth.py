@@ -1,22 +1,48 @@
 import os
+import logging
 import urllib.parse
 from django.conf import settings
 from django.urls import reverse
 from datetime import datetime, timedelta
-import requests
 import base64
 import json
 from apps.channels.models import ChannelIntegration
 from django.utils import timezone
+from redis.exceptions import LockError, RedisError
+from core.redis_client import get_redis
+from .http import get_session, get_timeout
+
+logger = logging.getLogger(__name__)
 
 EBAY_ENV = os.environ.get('EBAY_ENV', 'sandbox')  # 'sandbox' or 'production'
 
 if EBAY_ENV == 'sandbox':
     EBAY_OAUTH_URL = 'https://auth.sandbox.ebay.com/oauth2/authorize'
-    EBAY_TOKEN_URL = 'https://api.sandbox.ebay.com/identity/v1/oauth2/token'
+    EBAY_API_BASE_URL = 'https://api.sandbox.ebay.com'
+    EBAY_IDENTITY_BASE_URL = 'https://apiz.sandbox.ebay.com'
 else:
     EBAY_OAUTH_URL = 'https://auth.ebay.com/oauth2/authorize'
-    EBAY_TOKEN_URL = 'https://api.ebay.com/identity/v1/oauth2/token'
+    EBAY_API_BASE_URL = 'https://api.ebay.com'
+    EBAY_IDENTITY_BASE_URL = 'https://apiz.ebay.com'
+
+# Point API and token calls elsewhere, e.g. at the local stand-in in standin.py,
+# which also serves the Identity API
+if 'EBAY_API_BASE_URL' in os.environ:
+    EBAY_API_BASE_URL = EBAY_IDENTITY_BASE_URL = os.environ['EBAY_API_BASE_URL'].rstrip('/')
+EBAY_TOKEN_URL = f"{EBAY_API_BASE_URL}/identity/v1/oauth2/token"
+
+# Refresh tokens this long before they expire
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+TOKEN_REFRESH_LOCK_TIMEOUT = 30
+
+class IntegrationInactive(ValueError):
+    """The integration was disconnected or expired; there is no token to use"""
+
+class TokenRefreshTimeout(Exception):
+    """Another worker held the token refresh lock longer than we could wait"""
+
+# Decrypted access tokens by integration id: (access_token, token_expiry)
+_token_cache = {}
 
 def get_ebay_credentials():
     app_id = os.environ.get(f'EBAY_{EBAY_ENV.upper()}_APP_ID')
@@ -28,12 +54,16 @@ def get_authorization_url(integration_id):
     """Generates the eBay OAuth URL for a user to authorize the app"""
     app_id, _, ru_name = get_ebay_credentials()
     
-    # Required scopes for inventory and fulfillment
+    # Required scopes for inventory and fulfillment, plus identity to learn
+    # the seller's username notifications are addressed to. Refreshes keep
+    # asking for the other scopes only, so integrations connected before it
+    # was added can still refresh.
     scopes = [
         'https://api.ebay.com/oauth/api_scope',
         'https://api.ebay.com/oauth/api_scope/sell.inventory',
         'https://api.ebay.com/oauth/api_scope/sell.fulfillment',
         'https://api.ebay.com/oauth/api_scope/sell.finances',
+        'https://api.ebay.com/oauth/api_scope/commerce.identity.readonly',
     ]
     
     params = {
@@ -65,7 +95,7 @@ def exchange_code_for_token(code):
         'redirect_uri': ru_name
     }
     
-    response = requests.post(EBAY_TOKEN_URL, headers=headers, data=data)
+    response = get_session().post(EBAY_TOKEN_URL, headers=headers, data=data, timeout=get_timeout())
     response.raise_for_status()
     return response.json()
 
@@ -103,7 +133,7 @@ def refresh_access_token(integration):
         'scope': ' '.join(scopes)
     }
     
-    response = requests.post(EBAY_TOKEN_URL, headers=headers, data=data)
+    response = get_session().post(EBAY_TOKEN_URL, headers=headers, data=data, timeout=get_timeout())
     response.raise_for_status()
     
     token_data = response.json()
@@ -115,18 +145,118 @@ def refresh_access_token(integration):
         
     integration.credentials = json.dumps(creds)
     integration.token_expiry = timezone.now() + timedelta(seconds=token_data['expires_in'])
-    integration.save()
+    # Only touch the token fields so a concurrent status change isn't overwritten
+    integration.save(update_fields=['credentials', 'token_expiry'])
     
+    _cache_token(integration, token_data['access_token'])
     return token_data['access_token']
 
+def _token_is_fresh(expiry, valid_until=None):
+    if valid_until is None:
+        valid_until = timezone.now() + TOKEN_REFRESH_MARGIN
+    return expiry is None or expiry >= valid_until
+
+def _cache_token(integration, access_token):
+    _token_cache[integration.id] = (access_token, integration.token_expiry)
+
+def invalidate_cached_token(integration_id):
+    """Drops this process's cached token, e.g. after eBay rejects it"""
+    _token_cache.pop(integration_id, None)
+
+def mark_integration_expired(integration, reason):
+    """
+    Flags an integration whose credentials eBay no longer accepts. Its polls
+    and pushes stop until the shop reconnects through OAuth. Only an active
+    integration is flagged, so a disconnect or a reconnect that happened in
+    the meantime isn't overwritten.
+    """
+    logger.warning(f"Marking integration {integration.id} expired: {reason}")
+    ChannelIntegration.objects.filter(id=integration.id, status='active').update(status='expired')
+    integration.status = 'expired'
+    invalidate_cached_token(integration.id)
+
+def is_refresh_token_rejected(error):
+    """
+    Whether a failed refresh (an HTTPError) means eBay no longer accepts the
+    refresh token, e.g. consent was revoked. Other 4xx such as invalid_client
+    point at our app credentials, not the shop's, and mustn't expire it.
+    """
+    response = error.response
+    if response is None or response.status_code != 400:
+        return False
+    try:
+        return response.json().get('error') == 'invalid_grant'
+    except ValueError:
+        return False
+
+def refresh_access_token_once(integration, valid_until=None):
+    """
+    Refreshes the token behind a distributed lock so only one worker calls the
+    token endpoint per expiry. Workers that waited on the lock pick up the
+    token the winner stored instead of refreshing again.
+    A token that is already valid past `valid_until` (default: now plus
+    TOKEN_REFRESH_MARGIN) is left alone. Raises TokenRefreshTimeout if the
+    lock couldn't be had in time and the stored token is still stale.
+    """
+    lock = None
+    acquired = False
+    try:
+        lock = get_redis().lock(
+            f"ebay_token_refresh_{integration.id}",
+            timeout=TOKEN_REFRESH_LOCK_TIMEOUT,
+            blocking_timeout=TOKEN_REFRESH_LOCK_TIMEOUT,
+        )
+        acquired = lock.acquire()
+    except RedisError as e:
+        # Redis is down: refresh without the lock rather than not at all
+        logger.warning(f"Token refresh lock unavailable for integration {integration.id}: {e}")
+        lock = None
+
+    try:
+        integration.refresh_from_db(fields=['credentials', 'token_expiry', 'status'])
+        if integration.status != 'active':
+            raise IntegrationInactive("Integration is not active")
+        if not integration.credentials:
+            raise ValueError("Integration is missing credentials")
+        if _token_is_fresh(integration.token_expiry, valid_until):
+            # Another worker refreshed while we waited on the lock
+            access_token = json.loads(integration.credentials).get('access_token')
+            _cache_token(integration, access_token)
+            return access_token
+        if lock is not None and not acquired:
+            # The lock holder is still refreshing; a second refresh could
+            # invalidate the token it's about to store
+            raise TokenRefreshTimeout(
+                f"Token refresh for integration {integration.id} still in progress after {TOKEN_REFRESH_LOCK_TIMEOUT}s"
+            )
+        return refresh_access_token(integration)
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except (LockError, RedisError):
+                pass
+
 def get_valid_access_token(integration):
-    """Returns a valid access token, refreshing if necessary"""
-    if integration.status != 'active' or not integration.credentials:
-        raise ValueError("Integration is not active or missing credentials")
+    """
+    Returns a valid access token, refreshing if necessary.
+    Tokens are cached per process until TOKEN_REFRESH_MARGIN before expiry,
+    so the common case is a dictionary lookup.
+    """
+    if integration.status != 'active':
+        raise IntegrationInactive("Integration is not active")
+    if not integration.credentials:
+        raise ValueError("Integration is missing credentials")
+        
+    cached = _token_cache.get(integration.id)
+    if cached and _token_is_fresh(cached[1]):
+        return cached[0]
         
     # Add a 5 minute buffer before expiry
-    if integration.token_expiry and integration.token_expiry < timezone.now() + timedelta(minutes=5):
-        return refresh_access_token(integration)
+    if not _token_is_fresh(integration.token_expiry):
+        return refresh_access_token_once(integration)
         
     creds = json.loads(integration.credentials)
-    return creds.get('access_token')
+    access_token = creds.get('access_token')
+    _cache_token(integration, access_token)
+    return access_token
@@ -1,7 +1,64 @@
-import requests
-import time
 from urllib.parse import urljoin
-from .auth import get_valid_access_token
+import requests
+from django.conf import settings
+from core.circuit import CircuitBreaker
+from core.ratelimit import TokenBucket, consume_all
+from .auth import EBAY_API_BASE_URL, EBAY_ENV, EBAY_IDENTITY_BASE_URL, get_valid_access_token, get_ebay_credentials, invalidate_cached_token, is_refresh_token_rejected, mark_integration_expired
+from .http import get_session, get_timeout
+
+# Maximum number of SKUs eBay accepts per bulkUpdatePriceQuantity request
+BULK_UPDATE_MAX_SKUS = 25
+
+# Largest page the Fulfillment API's getOrders accepts
+ORDERS_MAX_PAGE_SIZE = 200
+
+ORDERS_ENDPOINT = '/sell/fulfillment/v1/order'
+
+# Largest page the Inventory API's getInventoryItems accepts
+INVENTORY_MAX_PAGE_SIZE = 200
+
+INVENTORY_ITEMS_ENDPOINT = '/sell/inventory/v1/inventory_item'
+
+IDENTITY_USER_ENDPOINT = '/commerce/identity/v1/user/'
+
+def build_order_params(created_time_from=None, created_time_to=None, page_size=None):
+    """
+    Query parameters for the first page of a getOrders call. The page size is
+    capped at ORDERS_MAX_PAGE_SIZE; later pages are fetched through the `next`
+    link eBay returns, which carries the same filter and limit.
+    """
+    params = {'limit': min(page_size or settings.EBAY_ORDER_PAGE_SIZE, ORDERS_MAX_PAGE_SIZE)}
+    if created_time_from or created_time_to:
+        params['filter'] = f"creationdate:[{created_time_from or ''}..{created_time_to or ''}]"
+    return params
+
+class EbayRateLimited(Exception):
+    """
+    Raised instead of sleeping when our shared call budget is exhausted or eBay
+    answers 429. Callers should re-queue their work after `retry_after` seconds.
+    """
+    def __init__(self, retry_after, message="eBay API rate limit reached"):
+        super().__init__(f"{message}, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class EbayCircuitOpen(EbayRateLimited):
+    """
+    Raised without calling eBay while an integration's circuit breaker is open.
+    A subclass of EbayRateLimited, so callers park and re-queue the work the
+    same way until the next probe is due.
+    """
+    def __init__(self, retry_after):
+        super().__init__(retry_after, message="eBay circuit open for this integration")
+
+def integration_circuit(integration_id):
+    """
+    Circuit breaker shared by every call made for one integration.
+    """
+    return CircuitBreaker(
+        f"ebay_integration_{integration_id}",
+        failure_threshold=settings.EBAY_CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=settings.EBAY_CIRCUIT_RESET_SECONDS
+    )
 
 class EbayAuth:
     def __init__(self, integration):
@@ -13,66 +70,193 @@ class EbayAuth:
 class EbayClient:
     """
     eBay REST API client wrapper.
-    Handles authentication, rate limiting (429 retries), and basic requests.
+    Handles authentication, rate limiting and basic requests.
+    Every call draws from Redis token buckets shared by all workers: one for
+    the eBay application and one for the integration (see EBAY_RATE_LIMITS).
+    Calls also go through a per-integration circuit breaker: after
+    EBAY_CIRCUIT_FAILURE_THRESHOLD consecutive connection errors, 5xx or 401
+    responses the integration's calls are refused with EbayCircuitOpen, and
+    one probe is let through every EBAY_CIRCUIT_RESET_SECONDS. If the
+    failures that opened it were auth failures the integration is marked
+    expired.
     """
     def __init__(self, integration):
+        self.integration = integration
         self.auth = EbayAuth(integration)
-        self.env = 'sandbox' # config driven in reality
-        self.base_url = 'https://api.sandbox.ebay.com' if self.env == 'sandbox' else 'https://api.ebay.com'
+        self.env = EBAY_ENV
+        self.base_url = EBAY_API_BASE_URL
+        self.circuit = integration_circuit(integration.id)
         
+    def get_rate_limit_buckets(self):
+        limits = settings.EBAY_RATE_LIMITS
+        app_id, _, _ = get_ebay_credentials()
+        return [
+            TokenBucket(f"ebay_integration_{self.integration.id}", **limits['integration']),
+            TokenBucket(f"ebay_app_{app_id}", **limits['app']),
+        ]
+
+    def _acquire_rate_limit(self):
+        # Both budgets in one step: a call refused by one doesn't spend the other
+        allowed, retry_after = consume_all(self.get_rate_limit_buckets())
+        if not allowed:
+            raise EbayRateLimited(retry_after)
+
+    def _check_circuit(self):
+        allowed, retry_after = self.circuit.allow()
+        if not allowed:
+            raise EbayCircuitOpen(retry_after)
+
+    def _record_outcome(self, status_code=None):
+        """
+        Feeds a call's outcome to the circuit breaker. status_code is None when
+        the call never got a response. 429s and other 4xx say nothing about
+        the connection's health. A run of failure_threshold 401s in a row
+        expires the integration.
+        """
+        if status_code == 429:
+            return
+        if status_code is not None and status_code < 500 and status_code != 401:
+            self.circuit.record_success()
+            return
+        _, rejected_tokens = self.circuit.record_failure(kind='unauthorized' if status_code == 401 else None)
+        if rejected_tokens >= self.circuit.failure_threshold:
+            # eBay kept rejecting tokens we believe are valid: consent revoked
+            mark_integration_expired(self.integration, "eBay rejected its access token repeatedly")
+
+    def _get_access_token(self):
+        try:
+            return self.auth.get_access_token()
+        except requests.HTTPError as e:
+            if is_refresh_token_rejected(e):
+                mark_integration_expired(self.integration, f"token refresh rejected: {e}")
+            raise
+
     def _request(self, method, endpoint, **kwargs):
         """
-        Base request handler with retry logic for rate limits.
+        Base request handler. Raises EbayRateLimited rather than blocking the
+        worker when the shared budget is spent or eBay returns 429.
         """
         url = urljoin(self.base_url, endpoint)
-        max_retries = 3
+        self._check_circuit()
+        try:
+            self._acquire_rate_limit()
+        except EbayRateLimited:
+            # Never sent, so it can't count as the breaker's probe
+            self.circuit.release_probe()
+            raise
         
-        for attempt in range(max_retries):
-            # Always get fresh/valid token
-            headers = kwargs.pop('headers', {})
-            headers['Authorization'] = f"Bearer {self.auth.get_access_token()}"
-            headers['Content-Type'] = 'application/json'
-            kwargs['headers'] = headers
-            
-            response = requests.request(method, url, **kwargs)
-            
-            if response.status_code == 429: # Too Many Requests
-                retry_after = int(response.headers.get('Retry-After', 5))
-                time.sleep(retry_after)
-                continue
-                
-            response.raise_for_status()
-            return response.json() if response.content else None
+        # Always get fresh/valid token
+        headers = kwargs.pop('headers', {})
+        headers['Authorization'] = f"Bearer {self._get_access_token()}"
+        headers['Content-Type'] = 'application/json'
+        kwargs['headers'] = headers
+        
+        try:
+            response = get_session().request(method, url, timeout=get_timeout(), **kwargs)
+        except requests.RequestException:
+            self._record_outcome(None)
+            raise
+        self._record_outcome(response.status_code)
+        
+        if response.status_code == 401:
+            # Token was revoked or replaced; don't keep serving it from cache
+            invalidate_cached_token(self.integration.id)
+        if response.status_code == 429: # Too Many Requests
+            retry_after = int(response.headers.get('Retry-After', 5))
+            raise EbayRateLimited(retry_after, message="eBay returned 429")
             
-        raise Exception("Max retries exceeded for eBay API request")
+        response.raise_for_status()
+        return response.json() if response.content else None
 
-    def get_orders(self, created_time_from=None):
+    def get_orders(self, created_time_from=None, created_time_to=None, page_size=None):
         """
-        Polls for new orders from the eBay Fulfillment API.
+        Fetches the first page of orders from the eBay Fulfillment API.
+        Use iter_orders to walk every page.
         """
-        endpoint = '/sell/fulfillment/v1/order'
-        params = {}
-        if created_time_from:
-            params['filter'] = f"creationdate:[{created_time_from}..]"
-            
-        return self._request('GET', endpoint, params=params)
+        params = build_order_params(created_time_from, created_time_to, page_size)
+        return self._request('GET', ORDERS_ENDPOINT, params=params)
 
-    def revise_inventory_status(self, listing_id, sku, quantity):
+    def iter_order_pages(self, created_time_from=None, created_time_to=None, page_size=None):
         """
-        Updates the available quantity for a listing using the Trading API or Inventory API.
-        Assuming Inventory API for REST-based approach here.
-        Note: This is a simplified representation of the Inventory API call.
+        Yields the orders of each page in turn, following eBay's `next` links
+        until the last page. Only one page is held in memory at a time.
         """
-        endpoint = f'/sell/inventory/v1/inventory_item/{sku}'
-        # Real implementation depends heavily on whether they are using Trading API (XML/JSON)
-        # or the new REST Inventory API. The plan says "Trading API for inventory".
-        # For MVP we will mock the REST equivalent.
-        
+        response = self.get_orders(created_time_from, created_time_to, page_size)
+        while response:
+            orders = response.get('orders') or []
+            if orders:
+                yield orders
+            next_url = response.get('next')
+            if not next_url or not orders:
+                break
+            response = self._request('GET', next_url)
+
+    def iter_orders(self, created_time_from=None, created_time_to=None, page_size=None):
+        """
+        Yields every order in the window, one at a time.
+        """
+        for orders in self.iter_order_pages(created_time_from, created_time_to, page_size):
+            yield from orders
+
+    def get_order(self, order_id):
+        """
+        Fetches a single order from the eBay Fulfillment API.
+        """
+        return self._request('GET', f"{ORDERS_ENDPOINT}/{order_id}")
+
+    def get_user(self):
+        """
+        Fetches the connected seller's account from the eBay Identity API,
+        including the username notifications and orders name as the seller.
+        """
+        return self._request('GET', f"{EBAY_IDENTITY_BASE_URL}{IDENTITY_USER_ENDPOINT}")
+
+    def get_inventory_items(self, offset=0, page_size=None):
+        """
+        Fetches one page of inventory items from the eBay Inventory API,
+        starting at `offset`. The page size is capped at INVENTORY_MAX_PAGE_SIZE.
+        """
+        params = {
+            'limit': min(page_size or settings.EBAY_INVENTORY_PAGE_SIZE, INVENTORY_MAX_PAGE_SIZE),
+            'offset': offset,
+        }
+        return self._request('GET', INVENTORY_ITEMS_ENDPOINT, params=params)
+
+    def iter_inventory_items(self, offset=0, page_size=None):
+        """
+        Yields every inventory item from `offset` on, one at a time, paging
+        with limit/offset until eBay's reported total is reached. Only one
+        page is held in memory at a time.
+        """
+        while True:
+            response = self.get_inventory_items(offset, page_size) or {}
+            items = response.get('inventoryItems') or []
+            yield from items
+            offset += len(items)
+            total = response.get('total')
+            if not items or (total is not None and offset >= total):
+                break
+
+    def bulk_update_quantities(self, quantities):
+        """
+        Updates the available quantity of up to BULK_UPDATE_MAX_SKUS SKUs in a
+        single call to the Inventory API's bulkUpdatePriceQuantity.
+        `quantities` maps SKU -> quantity. The response holds one entry per SKU
+        under 'responses', each with its own statusCode and errors.
+        """
+        if len(quantities) > BULK_UPDATE_MAX_SKUS:
+            raise ValueError(f"bulk_update_quantities accepts at most {BULK_UPDATE_MAX_SKUS} SKUs")
+
+        endpoint = '/sell/inventory/v1/bulk_update_price_quantity'
         payload = {
-            "availability": {
-                "shipToLocationAvailability": {
-                    "quantity": quantity
+            "requests": [
+                {
+                    "sku": sku,
+                    "shipToLocationAvailability": {
+                        "quantity": quantity
+                    }
                 }
-            }
+                for sku, quantity in quantities.items()
+            ]
         }
-        return self._request('PUT', endpoint, json=payload)
+        return self._request('POST', endpoint, json=payload)
@@ -0,0 +1,53 @@
+import os
+import threading
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# One keep-alive session per process. Keyed by pid so a Celery prefork child
+# never reuses sockets inherited from its parent.
+_sessions = {}
+_lock = threading.Lock()
+
+def get_timeout():
+    """(connect, read) timeout applied to every eBay call."""
+    return (
+        getattr(settings, 'EBAY_HTTP_CONNECT_TIMEOUT', 5),
+        getattr(settings, 'EBAY_HTTP_READ_TIMEOUT', 30),
+    )
+
+def _build_session():
+    # Transport-level retries only: connection errors and gateway failures on
+    # idempotent methods. 429s are left to the client's rate limit handling.
+    retry = Retry(
+        total=getattr(settings, 'EBAY_HTTP_MAX_RETRIES', 3),
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'PUT', 'DELETE', 'HEAD', 'OPTIONS']),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=getattr(settings, 'EBAY_HTTP_POOL_CONNECTIONS', 10),
+        pool_maxsize=getattr(settings, 'EBAY_HTTP_POOL_MAXSIZE', 20),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session():
+    """
+    Returns this process's pooled session for eBay API and OAuth calls, so
+    repeated calls reuse warm TCP/TLS connections.
+    """
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _lock:
+            session = _sessions.get(pid)
+            if session is None:
+                session = _sessions[pid] = _build_session()
+    return session
@@ -0,0 +1,304 @@
+"""
+Local stand-in for the eBay endpoints EbayClient and auth.py call, for load
+testing and benchmarks on one machine. Run it with
+`python manage.py ebay_standin` and point the app at it by setting
+EBAY_API_BASE_URL (e.g. http://127.0.0.1:8765).
+
+Each seller is identified by its bearer token, and its orders and inventory
+are generated from the seed. The same settings therefore always give the same
+data, and nothing is kept in memory beyond the current inventory quantities.
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+ORDERS_PATH = '/sell/fulfillment/v1/order'
+INVENTORY_ITEMS_PATH = '/sell/inventory/v1/inventory_item'
+BULK_UPDATE_PATH = '/sell/inventory/v1/bulk_update_price_quantity'
+TOKEN_PATH = '/identity/v1/oauth2/token'
+IDENTITY_USER_PATH = '/commerce/identity/v1/user/'
+
+ORDERS_MAX_PAGE_SIZE = 200
+INVENTORY_MAX_PAGE_SIZE = 200
+BULK_UPDATE_MAX_SKUS = 25
+
+# Access tokens we issue embed the refresh token, so a seller keeps its data across refreshes
+TOKEN_PREFIX = 'standin-'
+
+CREATION_DATE_FILTER = re.compile(r'creationdate:\[([^\]]*)\]')
+
+@dataclass
+class StandinConfig:
+    # Added to every response: latency plus up to `jitter` seconds, both in seconds
+    latency: float = 0.05
+    jitter: float = 0.0
+    # Share of API calls (not token calls) answered with 429
+    rate_limit_ratio: float = 0.0
+    retry_after: int = 1
+    # Orders created in the `backlog_hours` before the server started
+    backlog_orders: int = 100
+    backlog_hours: float = 24
+    # New orders per second per seller once the server is running
+    order_rate: float = 0.0
+    max_line_items: int = 3
+    skus: list = field(default_factory=lambda: [f"STANDIN-{i:05d}" for i in range(500)])
+    max_quantity: int = 10
+    seed: int = 0
+    token_lifetime: int = 7200
+
+def format_timestamp(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}Z"
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+class EbayStandin:
+    """
+    Generated order and inventory data plus request counters, shared by every
+    handler thread.
+    """
+    def __init__(self, config=None):
+        self.config = config or StandinConfig()
+        self.started_at = datetime.now(timezone.utc)
+        self.stats = Counter()
+        self._quantities = {}
+        self._lock = threading.Lock()
+
+    def seller_for_token(self, access_token):
+        if access_token.startswith(TOKEN_PREFIX):
+            return access_token[len(TOKEN_PREFIX):]
+        return access_token
+
+    def issue_token(self, refresh_token):
+        return {
+            'access_token': f"{TOKEN_PREFIX}{refresh_token}",
+            'expires_in': self.config.token_lifetime,
+            'token_type': 'User Access Token',
+        }
+
+    def order_count(self, now=None):
+        elapsed = ((now or datetime.now(timezone.utc)) - self.started_at).total_seconds()
+        return self.config.backlog_orders + int(max(elapsed, 0) * self.config.order_rate)
+
+    def order_created_at(self, index):
+        config = self.config
+        if index < config.backlog_orders:
+            backlog = timedelta(hours=config.backlog_hours)
+            return self.started_at - backlog + backlog * (index / config.backlog_orders)
+        return self.started_at + timedelta(seconds=(index - config.backlog_orders + 1) / config.order_rate)
+
+    def build_order(self, seller, index):
+        config = self.config
+        rng = random.Random(f"{config.seed}:{seller}:order:{index}")
+        order_id = f"{zlib.crc32(f'{config.seed}:{seller}'.encode()) % 10**6:06d}-{index:08d}"
+        created = format_timestamp(self.order_created_at(index))
+        line_items = []
+        for line in range(rng.randint(1, config.max_line_items)):
+            line_items.append({
+                'lineItemId': f"{order_id}-{line}",
+                'legacyItemId': str(rng.randint(10**11, 10**12 - 1)),
+                'sku': rng.choice(config.skus),
+                'quantity': rng.randint(1, 2),
+                'title': 'Stand-in trading card',
+                'lineItemCost': {'value': f"{rng.uniform(1, 200):.2f}", 'currency': 'USD'},
+            })
+        return {
+            'orderId': order_id,
+            'sellerId': seller,
+            'creationDate': created,
+            'lastModifiedDate': created,
+            'orderFulfillmentStatus': 'NOT_STARTED',
+            'orderPaymentStatus': 'PAID',
+            'lineItems': line_items,
+        }
+
+    def find_orders(self, seller, created_from=None, created_to=None):
+        """
+        Returns the indexes of the seller's orders created in the window.
+        """
+        indexes = []
+        for index in range(self.order_count()):
+            created = self.order_created_at(index)
+            if created_from and created < created_from:
+                continue
+            if created_to and created > created_to:
+                break
+            indexes.append(index)
+        return indexes
+
+    def _seller_quantities(self, seller):
+        quantities = self._quantities.get(seller)
+        if quantities is None:
+            rng = random.Random(f"{self.config.seed}:{seller}:inventory")
+            quantities = {sku: rng.randint(0, self.config.max_quantity) for sku in self.config.skus}
+            self._quantities[seller] = quantities
+        return quantities
+
+    def inventory_page(self, seller, offset, limit):
+        with self._lock:
+            items = list(self._seller_quantities(seller).items())
+        return len(items), items[offset:offset + limit]
+
+    def set_quantity(self, seller, sku, quantity):
+        with self._lock:
+            self._seller_quantities(seller)[sku] = quantity
+
+def make_handler(standin):
+    class StandinHandler(BaseHTTPRequestHandler):
+        # Keep-alive, so the app's connection pools behave as they do against eBay
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def do_PUT(self):
+            self._dispatch('PUT')
+
+        def _dispatch(self, method):
+            config = standin.config
+            url = urlparse(self.path)
+            self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            delay = config.latency + random.uniform(0, config.jitter)
+            if delay > 0:
+                time.sleep(delay)
+
+            if method == 'POST' and url.path == TOKEN_PATH:
+                form = {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+                refresh_token = form.get('refresh_token') or form.get('code') or 'seller'
+                return self._respond(method, 'token', 200, standin.issue_token(refresh_token))
+
+            authorization = self.headers.get('Authorization', '')
+            if not authorization.startswith('Bearer '):
+                return self._respond(method, url.path, 401, {'errors': [{'message': 'Invalid access token'}]})
+            seller = standin.seller_for_token(authorization[len('Bearer '):])
+
+            if config.rate_limit_ratio and random.random() < config.rate_limit_ratio:
+                return self._respond(method, url.path, 429, {'errors': [{'message': 'Request limit exceeded'}]},
+                                     headers={'Retry-After': str(config.retry_after)})
+
+            payload = json.loads(body) if body else None
+            if method == 'GET' and url.path == IDENTITY_USER_PATH:
+                user = {'userId': f"{zlib.crc32(seller.encode()):08x}", 'username': seller, 'accountType': 'BUSINESS'}
+                return self._respond(method, 'user', 200, user)
+            if method == 'GET' and url.path == ORDERS_PATH:
+                return self._get_orders(seller)
+            if method == 'GET' and url.path.startswith(ORDERS_PATH + '/'):
+                return self._get_order(seller, url.path[len(ORDERS_PATH) + 1:])
+            if method == 'GET' and url.path == INVENTORY_ITEMS_PATH:
+                return self._get_inventory_items(seller)
+            if method == 'PUT' and url.path.startswith(INVENTORY_ITEMS_PATH + '/'):
+                sku = url.path[len(INVENTORY_ITEMS_PATH) + 1:]
+                quantity = payload['availability']['shipToLocationAvailability']['quantity']
+                standin.set_quantity(seller, sku, quantity)
+                return self._respond(method, 'inventory_item', 204)
+            if method == 'POST' and url.path == BULK_UPDATE_PATH:
+                return self._bulk_update(seller, payload)
+            return self._respond(method, url.path, 404, {'errors': [{'message': 'Not found'}]})
+
+        def _get_orders(self, seller):
+            limit = min(int(self.query.get('limit', 50)), ORDERS_MAX_PAGE_SIZE)
+            offset = int(self.query.get('offset', 0))
+            created_from = created_to = None
+            match = CREATION_DATE_FILTER.search(self.query.get('filter', ''))
+            if match:
+                start, _, end = match.group(1).partition('..')
+                created_from, created_to = parse_timestamp(start), parse_timestamp(end)
+
+            indexes = standin.find_orders(seller, created_from, created_to)
+            page = indexes[offset:offset + limit]
+            data = {
+                'href': self._page_url(offset, limit),
+                'total': len(indexes),
+                'limit': limit,
+                'offset': offset,
+                'orders': [standin.build_order(seller, index) for index in page],
+            }
+            if offset + limit < len(indexes):
+                data['next'] = self._page_url(offset + limit, limit)
+            return self._respond('GET', 'orders', 200, data)
+
+        def _get_order(self, seller, order_id):
+            _, _, index = order_id.rpartition('-')
+            if not index.isdigit() or int(index) >= standin.order_count():
+                return self._respond('GET', 'order', 404, {'errors': [{'message': 'Order not found'}]})
+            order = standin.build_order(seller, int(index))
+            if order['orderId'] != order_id:
+                return self._respond('GET', 'order', 404, {'errors': [{'message': 'Order not found'}]})
+            return self._respond('GET', 'order', 200, order)
+
+        def _get_inventory_items(self, seller):
+            limit = min(int(self.query.get('limit', 25)), INVENTORY_MAX_PAGE_SIZE)
+            offset = int(self.query.get('offset', 0))
+            total, items = standin.inventory_page(seller, offset, limit)
+            data = {
+                'href': self._page_url(offset, limit),
+                'total': total,
+                'size': len(items),
+                'limit': limit,
+                'inventoryItems': [
+                    {
+                        'sku': sku,
+                        'availability': {'shipToLocationAvailability': {'quantity': quantity}},
+                        'product': {'title': f"Stand-in card {sku}"},
+                    }
+                    for sku, quantity in items
+                ],
+            }
+            if offset + limit < total:
+                data['next'] = self._page_url(offset + limit, limit)
+            return self._respond('GET', 'inventory_items', 200, data)
+
+        def _bulk_update(self, seller, payload):
+            requests = (payload or {}).get('requests', [])
+            if len(requests) > BULK_UPDATE_MAX_SKUS:
+                return self._respond('POST', 'bulk_update', 400, {'errors': [{'message': 'Too many requests in batch'}]})
+            responses = []
+            for entry in requests:
+                quantity = entry.get('shipToLocationAvailability', {}).get('quantity')
+                standin.set_quantity(seller, entry['sku'], quantity)
+                responses.append({'statusCode': 200, 'sku': entry['sku']})
+            return self._respond('POST', 'bulk_update', 200, {'responses': responses})
+
+        def _page_url(self, offset, limit):
+            query = dict(self.query, offset=offset, limit=limit)
+            path = urlparse(self.path).path
+            return f"http://{self.headers.get('Host')}{path}?{urlencode(query)}"
+
+        def _respond(self, method, route, status, data=None, headers=None):
+            standin.stats[(method, route, status)] += 1
+            body = json.dumps(data).encode() if data is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return StandinHandler
+
+def make_server(standin, host='127.0.0.1', port=8765):
+    """
+    Returns a threaded HTTP server for the stand-in; call serve_forever() on it.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(standin))
+    server.daemon_threads = True
+    return server
@@ -1,7 +1,8 @@
 import json
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from apps.channels.models import ChannelIntegration
+from asgiref.sync import sync_to_async
+from apps.channels.services.webhook_intake import record_notification
 import hashlib
 import hmac
 import base64
@@ -32,9 +33,10 @@ def verify_ebay_signature(request, endpoint_url):
     return hmac.compare_digest(expected_signature, signature)
 
 @csrf_exempt
-def ebay_notification_webhook(request):
+async def ebay_notification_webhook(request):
     """
-    Webhook handler for eBay Account Deletion and other notifications
+    Webhook handler for eBay order, item sold and account deletion notifications.
+    Async so slow deliveries don't tie up a worker thread under ASGI.
     """
     if request.method == 'GET':
         challenge_code = request.GET.get('challenge_code')
@@ -59,17 +61,12 @@ def ebay_notification_webhook(request):
             
         try:
             payload = json.loads(request.body)
-            # Route based on notification type
-            notification_type = payload.get('metadata', {}).get('topic')
-            
-            if notification_type == 'MARKETPLACE_ACCOUNT_DELETION':
-                # Handle account deletion (required by eBay)
-                # Find associated integration and mark as disconnected
-                pass
-                
-            return JsonResponse({'status': 'success'}, status=200)
-            
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON'}, status=400)
             
+        # Only persist here and acknowledge; the notification is applied by a
+        # worker once the intake row is committed
+        await sync_to_async(record_notification)(payload, request.body)
+        return JsonResponse({'status': 'success'}, status=200)
+            
     return JsonResponse({'error': 'Method not allowed'}, status=405)